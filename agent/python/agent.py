@@ -1,14 +1,18 @@
 import argparse
 import json
 import platform
+import random
 import subprocess
 import time
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import logging
 from pathlib import Path
+from typing import Optional
 
 import psutil
 import requests
+from requests.adapters import HTTPAdapter
 
 
 def read_memory():
@@ -21,75 +25,515 @@ def read_memory():
     }
 
 
+def _cpu_busy(t) -> tuple:
+    """(tiempo total, tiempo ocupado) de un cpu_times, con el mismo criterio que psutil."""
+    total = sum(t)
+    # En Linux guest/guest_nice ya están contados en user/nice
+    total -= getattr(t, "guest", 0) + getattr(t, "guest_nice", 0)
+    idle = t.idle + getattr(t, "iowait", 0)
+    return total, total - idle
+
+
+def _cpu_percent(busy_delta: float, total_delta: float) -> float:
+    if total_delta <= 0:
+        return 0.0
+    return round(min(max(busy_delta / total_delta * 100, 0.0), 100.0), 1)
+
+
+class CpuSampler:
+    """
+    % de CPU total y por núcleo a partir de un único delta de cpu_times(percpu=True)
+    desde la lectura anterior: no duerme y ambos valores cubren la misma ventana.
+    """
+
+    MIN_WINDOW = 0.1  # segundos; evita deltas vacíos al leer dos veces seguidas
+
+    def __init__(self):
+        self._last = psutil.cpu_times(percpu=True)
+        self._last_at = time.monotonic()
+
+    def read(self) -> dict:
+        wait = self.MIN_WINDOW - (time.monotonic() - self._last_at)
+        if wait > 0:
+            time.sleep(wait)
+        now = psutil.cpu_times(percpu=True)
+        per_core = []
+        sum_total = sum_busy = 0.0
+        for prev, cur in zip(self._last, now):
+            t0, b0 = _cpu_busy(prev)
+            t1, b1 = _cpu_busy(cur)
+            per_core.append(_cpu_percent(b1 - b0, t1 - t0))
+            sum_total += t1 - t0
+            sum_busy += b1 - b0
+        self._last = now
+        self._last_at = time.monotonic()
+        return {"total": _cpu_percent(sum_busy, sum_total), "per_core": per_core}
+
+
+_cpu_sampler: Optional[CpuSampler] = None
+
+
 def read_cpu():
-    total = psutil.cpu_percent(interval=1)
-    per_core = psutil.cpu_percent(interval=None, percpu=True)
-    return {"total": total, "per_core": per_core}
+    global _cpu_sampler
+    if _cpu_sampler is None:
+        _cpu_sampler = CpuSampler()
+    return _cpu_sampler.read()
 
 
-def read_disk():
-    # Seleccionar un punto de montaje válido (Linux: '/', Windows: primera partición)
-    mountpoint = "/"
-    try:
-        parts = psutil.disk_partitions()
-        if parts:
-            mountpoint = parts[0].mountpoint or mountpoint
-    except Exception:
-        pass
-    du = psutil.disk_usage(mountpoint)
-    return {
-        "total": float(du.total) / (1024 ** 3),
-        "used": float(du.used) / (1024 ** 3),
-        "free": float(du.free) / (1024 ** 3),
-        "percent": du.percent,
-    }
+# Sistemas de archivos que no representan almacenamiento real
+_PSEUDO_FSTYPES = {
+    "squashfs", "tmpfs", "devtmpfs", "overlay", "aufs", "proc", "sysfs", "cgroup", "cgroup2",
+    "autofs", "devpts", "mqueue", "debugfs", "tracefs", "securityfs", "pstore", "fusectl",
+    "configfs", "binfmt_misc", "hugetlbfs", "ramfs", "nsfs", "iso9660", "udf",
+}
+
+
+def read_mounts() -> list:
+    """Uso de cada punto de montaje real (sin loop/snap/pseudo fs ni bind mounts repetidos)."""
+    mounts = []
+    seen_devices = set()
+    for part in psutil.disk_partitions(all=False):
+        fstype = (part.fstype or "").lower()
+        if (not fstype or fstype in _PSEUDO_FSTYPES or "cdrom" in part.opts
+                or part.device.startswith("/dev/loop") or part.mountpoint.startswith("/snap/")):
+            continue
+        if part.device in seen_devices:
+            continue
+        try:
+            du = psutil.disk_usage(part.mountpoint)
+        except (PermissionError, OSError):
+            continue
+        if du.total == 0:
+            continue
+        seen_devices.add(part.device)
+        mounts.append({
+            "mountpoint": part.mountpoint,
+            "device": part.device,
+            "fstype": fstype,
+            "total": round(float(du.total) / (1024 ** 3), 2),
+            "used": round(float(du.used) / (1024 ** 3), 2),
+            "free": round(float(du.free) / (1024 ** 3), 2),
+            "percent": du.percent,
+        })
+    return mounts
+
+
+def read_disk(mounts: Optional[list] = None):
+    """
+    Disco único (compatibilidad con el esquema anterior): el montaje más lleno,
+    que es el que interesa vigilar.
+    """
+    mounts = read_mounts() if mounts is None else mounts
+    if not mounts:
+        du = psutil.disk_usage("/")
+        return {
+            "total": float(du.total) / (1024 ** 3),
+            "used": float(du.used) / (1024 ** 3),
+            "free": float(du.free) / (1024 ** 3),
+            "percent": du.percent,
+        }
+    fullest = max(mounts, key=lambda m: m["percent"])
+    return {k: fullest[k] for k in ("total", "used", "free", "percent")}
+
+
+class MountTracker:
+    """
+    Decide qué montajes enviar: sólo los que cambiaron al menos `min_change` puntos
+    porcentuales (o aparecieron), los forzados con `force` (p. ej. por superar su
+    umbral) y la lista completa cada `full_every` reportes.
+    """
+
+    def __init__(self, min_change: float = 0.5, full_every: int = 12):
+        self.min_change = min_change
+        self.full_every = max(int(full_every), 1)
+        self._last: dict = {}
+        self._reports = 0
+        self._forced: set = set()
+        self.current: list = []  # todos los montajes de la última lectura
+
+    def force(self, mountpoints):
+        """Incluir estos montajes en el próximo reporte aunque no hayan cambiado."""
+        self._forced.update(mountpoints)
+
+    def changed(self, mounts: list) -> tuple:
+        self.current = mounts
+        forced, self._forced = self._forced, set()
+        full = self._reports % self.full_every == 0 or set(self._last) != {m["mountpoint"] for m in mounts}
+        self._reports += 1
+        if full:
+            self._last = {m["mountpoint"]: m["percent"] for m in mounts}
+            return mounts, True
+        out = [m for m in mounts
+               if m["mountpoint"] in forced or abs(m["percent"] - self._last[m["mountpoint"]]) >= self.min_change]
+        for m in out:
+            self._last[m["mountpoint"]] = m["percent"]
+        return out, False
+
+
+class IoRateSampler:
+    """
+    Tasas de red y disco por segundo a partir del delta de los contadores acumulados
+    de psutil desde la lectura anterior (el primer reporte no tiene tasas).
+    """
+
+    def __init__(self):
+        self._net = self._disk = None
+        self._at = None
+
+    @staticmethod
+    def _delta(cur, prev, field: str) -> int:
+        # Contadores reiniciados (p.ej. interfaz recreada): no reportar negativos
+        return max(getattr(cur, field) - getattr(prev, field), 0)
+
+    def read(self) -> tuple:
+        now = time.monotonic()
+        try:
+            net = psutil.net_io_counters()
+        except Exception:
+            net = None
+        try:
+            disk = psutil.disk_io_counters()
+        except Exception:
+            disk = None
+
+        net_rates = disk_rates = None
+        elapsed = now - self._at if self._at is not None else 0
+        if elapsed > 0:
+            d = self._delta
+            if net is not None and self._net is not None:
+                net_rates = {
+                    "rx_bytes_per_s": round(d(net, self._net, "bytes_recv") / elapsed, 1),
+                    "tx_bytes_per_s": round(d(net, self._net, "bytes_sent") / elapsed, 1),
+                    "rx_packets_per_s": round(d(net, self._net, "packets_recv") / elapsed, 2),
+                    "tx_packets_per_s": round(d(net, self._net, "packets_sent") / elapsed, 2),
+                    "errors": d(net, self._net, "errin") + d(net, self._net, "errout"),
+                    "drops": d(net, self._net, "dropin") + d(net, self._net, "dropout"),
+                }
+            if disk is not None and self._disk is not None:
+                disk_rates = {
+                    "read_bytes_per_s": round(d(disk, self._disk, "read_bytes") / elapsed, 1),
+                    "write_bytes_per_s": round(d(disk, self._disk, "write_bytes") / elapsed, 1),
+                    "read_iops": round(d(disk, self._disk, "read_count") / elapsed, 2),
+                    "write_iops": round(d(disk, self._disk, "write_count") / elapsed, 2),
+                }
+        self._net, self._disk, self._at = net, disk, now
+        return net_rates, disk_rates
+
+
+class ProcessTop:
+    """
+    Top-N de procesos por CPU y por memoria (RSS). Los psutil.Process se conservan
+    entre reportes: cpu_percent(None) de cada uno mide desde la lectura anterior,
+    sin dormir y sin recrear objetos en cada ciclo.
+    """
+
+    def __init__(self, n: int = 5):
+        self.n = n
+        self._procs: dict = {}
+
+    def _iter(self):
+        alive = set()
+        for pid in psutil.pids():
+            proc = self._procs.get(pid)
+            if proc is None:
+                try:
+                    proc = psutil.Process(pid)
+                    proc.cpu_percent(None)  # primer llamado: fija la referencia
+                except psutil.Error:
+                    continue
+                self._procs[pid] = proc
+            alive.add(pid)
+            yield proc
+        for pid in list(self._procs):
+            if pid not in alive:
+                del self._procs[pid]
+
+    def read(self) -> Optional[dict]:
+        if self.n <= 0:
+            return None
+        rows = []
+        for proc in self._iter():
+            try:
+                with proc.oneshot():
+                    if not proc.is_running():  # pid reutilizado por otro proceso
+                        raise psutil.NoSuchProcess(proc.pid)
+                    rows.append({
+                        "pid": proc.pid,
+                        "name": proc.name(),
+                        "cpu": round(proc.cpu_percent(None), 1),
+                        "rss_mb": round(proc.memory_info().rss / (1024 ** 2), 1),
+                    })
+            except psutil.Error:
+                self._procs.pop(proc.pid, None)
+        return {
+            "by_cpu": sorted(rows, key=lambda r: r["cpu"], reverse=True)[: self.n],
+            "by_mem": sorted(rows, key=lambda r: r["rss_mb"], reverse=True)[: self.n],
+        }
+
+
+_io_rates = IoRateSampler()
+_process_top = ProcessTop()
+_docker = None
 
 
 def read_docker():
+    """
+    Contenedores vía Docker Engine API (socket unix, conexión persistente).
+    En Windows, sin socket unix, se mantiene la consulta por CLI.
+    """
+    global _docker
+    if platform.system() == "Windows":
+        try:
+            out = subprocess.check_output(["docker", "ps", "--format", "{{.Names}}"], text=True)
+            names = [n for n in out.strip().split("\n") if n]
+            return {"running_containers": len(names), "containers": [{"name": n} for n in names]}
+        except Exception:
+            return {"running_containers": 0, "containers": []}
+
+    if _docker is None:
+        from docker_stats import DockerCollector
+        _docker = DockerCollector()
+    if not _docker.available():
+        return {"running_containers": 0, "containers": []}
     try:
-        out = subprocess.check_output(["docker", "ps", "--format", "{{.Names}}"], text=True)
-        names = [n for n in out.strip().split("\n") if n]
-        return {"running_containers": len(names), "containers": [{"name": n} for n in names]}
-    except Exception:
+        return _docker.collect()
+    except Exception as e:
+        logging.debug("Docker API no disponible: %s", e)
         return {"running_containers": 0, "containers": []}
 
 
+_mount_tracker = MountTracker()
+
+
 def payload(server_id: str):
+    mounts = read_mounts()
+    changed, complete = _mount_tracker.changed(mounts)
+    net, disk_io = _io_rates.read()
     return {
         "server_id": server_id,
         "memory": read_memory(),
         "cpu": read_cpu(),
-        "disk": read_disk(),
+        "disk": read_disk(mounts),
+        "disks": changed,
+        "disks_complete": complete,
+        "net": net,
+        "disk_io": disk_io,
+        "processes": _process_top.read(),
         "docker": read_docker(),
         "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
     }
 
 
-def loop(server_url: str, server_id: str, token: str, interval: int, verify_tls: str):
+def _percent_sample(data: dict) -> tuple:
+    """CPU, % de memoria usada y % de disco de un payload (o de una lectura suelta)."""
+    mem = data["memory"]
+    mem_pct = mem["used"] / mem["total"] * 100 if mem["total"] else None
+    return data["cpu"]["total"], mem_pct, data["disk"]["percent"]
+
+
+def sample_until(deadline: float, sample_interval: float, aggregator, watch=None) -> list:
+    """
+    Espera hasta `deadline` (time.monotonic) midiendo CPU, memoria y disco cada
+    `sample_interval` segundos para el resumen del intervalo. Con `watch`, cada
+    muestra se compara con los umbrales del servidor y en cuanto uno se supera
+    devuelve los umbrales superados, para enviar el reporte sin esperar al fin
+    del intervalo. Sin superaciones devuelve una lista vacía.
+    """
     while True:
-        data = payload(server_id)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return []
+        if sample_interval <= 0 or (aggregator is None and watch is None):
+            time.sleep(remaining)
+            return []
+        time.sleep(min(sample_interval, remaining))
+        if deadline - time.monotonic() <= 0:
+            return []
         try:
-            resp = requests.post(
-                f"{server_url}/api/metrics",
-                json=data,
-                headers={"X-Auth-Token": token},
-                timeout=10,
-                verify=verify_tls if verify_tls else True,
+            mounts = read_mounts()
+            cpu, mem_pct, disk_pct = _percent_sample({"cpu": read_cpu(), "memory": read_memory(), "disk": read_disk(mounts)})
+            if aggregator is not None:
+                aggregator.add(cpu, mem_pct, disk_pct)
+            if watch is not None:
+                breached = watch.breaches(cpu, mem_pct, mounts)
+                if breached:
+                    logging.warning("Umbral superado (%s): reporte inmediato", ", ".join(breached))
+                    return breached
+        except Exception as e:
+            logging.debug("Error tomando muestra intermedia: %s", e)
+
+
+def make_session(token: str, verify_tls) -> requests.Session:
+    """
+    Sesión HTTP de larga duración: mantiene la conexión (keep-alive) y el TLS
+    establecido entre ciclos en lugar de abrir uno nuevo en cada envío.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"X-Auth-Token": token, "Connection": "keep-alive"})
+    # False desactiva la verificación; None o "" usan la CA del sistema
+    session.verify = True if verify_tls is None or verify_tls == "" else verify_tls
+    return session
+
+
+def _is_retryable(status_code: int) -> bool:
+    """Errores transitorios del backend: la muestra se guarda en el spool."""
+    return status_code == 429 or status_code >= 500
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    """Segundos de espera pedidos por el servidor (Retry-After en segundos o fecha HTTP)."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _jittered(seconds: float, fraction: float) -> float:
+    """`seconds` ± `fraction` aleatorio, para que los agentes no queden en fase."""
+    if fraction <= 0:
+        return seconds
+    return seconds * random.uniform(1 - fraction, 1 + fraction)
+
+
+def replay_spool(session: requests.Session, server_url: str, server_id: str, spool, batch_size: int = 100,
+                 max_batches: int = 10, pause: float = 1.0) -> bool:
+    """
+    Reenvía el backlog del spool en lotes a /api/metrics/batch conservando los timestamps
+    originales. Limita lotes por ciclo y pausa entre lotes para no saturar el backend
+    cuando vuelve. Devuelve False si el envío falló y conviene reintentar más tarde.
+    """
+    for i in range(max_batches):
+        samples, position = spool.read_batch(batch_size)
+        if position is None:
+            return True
+        if samples:
+            resp = session.post(
+                f"{server_url}/api/metrics/batch",
+                json={"server_id": server_id, "samples": samples},
+                timeout=30,
             )
+            if resp.status_code == 404:
+                # Backend sin endpoint de lotes: reenviar una a una
+                for sample in samples:
+                    single = session.post(f"{server_url}/api/metrics", json=sample, timeout=10)
+                    if _is_retryable(single.status_code):
+                        return False
+            elif resp.status_code == 422:
+                logging.error("Lote del spool rechazado por el servidor, se descarta: %s", resp.text)
+            elif resp.status_code != 200:
+                logging.warning("Reenvío del spool pospuesto (%s)", resp.status_code)
+                return False
+            else:
+                logging.info("Reenviadas %s muestras del spool", resp.json().get("accepted", len(samples)))
+        spool.commit(position)
+        if i < max_batches - 1 and spool.pending():
+            time.sleep(pause)
+    return True
+
+
+def post_sample(session: requests.Session, server_url: str, data: dict, wire=None) -> requests.Response:
+    """Envía una muestra; con `wire` usa el formato compacto (delta + compresión)."""
+    url = f"{server_url}/api/metrics"
+    if wire is None:
+        return session.post(url, json=data, timeout=10)
+    body, headers, _ = wire.encode(data)
+    resp = session.post(url, data=body, headers=headers, timeout=10)
+    if resp.status_code == 409:
+        # El servidor no tiene nuestra base (reinicio, otro worker): reenviar completa
+        logging.info("Servidor pidió muestra completa (resync)")
+        wire.reset()
+        body, headers, _ = wire.encode(data, full=True)
+        resp = session.post(url, data=body, headers=headers, timeout=10)
+    if resp.status_code == 200:
+        try:
+            wire.acknowledge(resp.json())
+        except ValueError:
+            pass
+    return resp
+
+
+def loop(server_url: str, server_id: str, token: str, interval: int, verify_tls: str, spool=None,
+         replay_opts: Optional[dict] = None, sample_interval: float = 0, wire=None, watch=None,
+         jitter: float = 0.1, start_jitter: float = 60):
+    # Desfase inicial aleatorio: tras un reinicio masivo no reportan todos a la vez
+    if start_jitter > 0:
+        time.sleep(random.uniform(0, min(start_jitter, interval)))
+    session = make_session(token, verify_tls)
+    replay_opts = replay_opts or {}
+    aggregator = None
+    if sample_interval > 0:
+        from sampling import IntervalAggregator
+        aggregator = IntervalAggregator()
+    breached = []
+    while True:
+        cycle_start = time.monotonic()
+        # Reporte por umbral: los montajes que lo dispararon viajan aunque no hayan cambiado
+        _mount_tracker.force(key.split(":", 1)[1] for key in breached if key.startswith("disk:"))
+        data = payload(server_id)
+        if aggregator is not None:
+            # La lectura del reporte cierra el intervalo como último valor del resumen
+            aggregator.add(*_percent_sample(data))
+            data["summary"] = aggregator.summary()
+            aggregator.reset()
+        if watch is not None:
+            # Lo que ya viaja en este reporte no necesita otro fuera de ciclo; el servidor
+            # evalúa todos los montajes, también los que no se reenvían por no cambiar
+            watch.breaches(*_percent_sample(data)[:2], _mount_tracker.current)
+        sent = False
+        wait = None
+        backoff = False
+        try:
+            resp = post_sample(session, server_url, data, wire)
             if resp.status_code == 200:
+                sent = True
                 try:
                     rj = resp.json()
                     new_interval = rj.get("report_interval")
                     if new_interval and isinstance(new_interval, int) and new_interval != interval:
                         logging.info("Actualizando intervalo de %ss a %ss", interval, new_interval)
                         interval = new_interval
+                    # Momento sugerido por el servidor (ya repartido entre agentes)
+                    next_in = rj.get("next_report_in")
+                    if isinstance(next_in, (int, float)) and next_in > 0:
+                        wait = min(next_in, 2 * interval)
+                    if watch is not None:
+                        watch.update(rj.get("thresholds"))
                 except Exception:
                     pass
+                # Backend disponible: vaciar backlog pendiente
+                if spool is not None and spool.pending():
+                    replay_spool(session, server_url, server_id, spool, **replay_opts)
             else:
                 logging.error("Error enviando métricas %s %s", resp.status_code, resp.text)
+                if spool is not None and _is_retryable(resp.status_code):
+                    spool.append(data)
+                retry_after = _retry_after(resp) if resp.status_code in (429, 503) else None
+                if retry_after is not None:
+                    # Backpressure del servidor: volver cuando lo indica, con algo de jitter extra
+                    wait = min(retry_after + random.uniform(0, retry_after * jitter), 2 * interval)
+                    backoff = True
+                    logging.info("Servidor saturado, próximo intento en %.0fs", wait)
         except Exception as e:
             logging.exception("Excepción enviando métricas: %s", e)
-        time.sleep(interval)
+            if spool is not None and not sent:
+                spool.append(data)
+            # Descartar conexiones posiblemente rotas y reconectar en el próximo ciclo
+            session.close()
+            session = make_session(token, verify_tls)
+        if wait is None:
+            wait = _jittered(interval, jitter)
+        # Durante un backoff no se adelantan reportes por umbral
+        breached = sample_until(cycle_start + wait, sample_interval, aggregator, None if backoff else watch)
 
 
 def load_config(path: Path) -> dict:
@@ -174,7 +618,55 @@ def main():
         print("Faltan parámetros obligatorios. Usa --config o pasa --server, --server-id y --token.")
         return
 
-    loop(server, server_id, token, interval, verify)
+    # Spool local para muestras que no se pudieron enviar
+    spool = None
+    if cfg.get("spool", True):
+        try:
+            from spool import Spool
+            spool = Spool(
+                cfg.get("spool_dir") or Path(__file__).resolve().parent / "spool",
+                max_bytes=int(cfg.get("spool_max_mb", 50)) * 1024 ** 2,
+                max_age=float(cfg.get("spool_max_age_hours", 168)) * 3600,
+            )
+        except Exception as e:
+            logging.error("Spool deshabilitado: %s", e)
+    replay_opts = {
+        "batch_size": int(cfg.get("replay_batch_size", 100)),
+        "max_batches": int(cfg.get("replay_max_batches", 10)),
+        "pause": float(cfg.get("replay_pause", 1.0)),
+    }
+
+    # Montajes: umbral de cambio para reenviarlos y cada cuántos reportes va la lista completa
+    global _mount_tracker
+    _mount_tracker = MountTracker(
+        min_change=float(cfg.get("mount_min_change", 0.5)),
+        full_every=int(cfg.get("mount_full_every", 12)),
+    )
+
+    # Top de procesos por CPU/memoria (0 = no enviar)
+    _process_top.n = int(cfg.get("top_processes", 5))
+
+    # Muestreo dentro del intervalo (0 = sólo un snapshot por reporte)
+    sample_interval = float(cfg.get("sample_interval", 10))
+
+    # Reporte inmediato cuando una muestra rápida supera los umbrales del servidor
+    watch = None
+    if cfg.get("immediate_reports", True) and sample_interval > 0:
+        from sampling import ThresholdWatch
+        watch = ThresholdWatch(cooldown=float(cfg.get("breach_cooldown", 600)))
+
+    # Formato compacto (delta + gzip/zstd) para enlaces medidos o satelitales
+    wire = None
+    if cfg.get("wire_mode") == "compact":
+        from wire import WireEncoder
+        wire = WireEncoder(cfg.get("wire_compression", "gzip"), cfg.get("wire_format", "json"))
+
+    # Jitter del intervalo (fracción) y desfase inicial aleatorio máximo (s)
+    jitter = float(cfg.get("interval_jitter", 0.1))
+    start_jitter = float(cfg.get("start_jitter", 60))
+
+    loop(server, server_id, token, interval, verify, spool, replay_opts, sample_interval, wire, watch,
+         jitter, start_jitter)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""
+Colector de contenedores vía Docker Engine API sobre el socket unix.
+
+Una sola conexión HTTP persistente (http.client, sin dependencias extra) y sin
+lanzar procesos `docker`. El % de CPU se calcula con el delta entre la lectura
+one-shot actual y la anterior de cada contenedor, igual que CpuSampler.
+Si Docker no está instalado o el socket no es accesible devuelve un resultado vacío.
+"""
+import http.client
+import json
+import logging
+import os
+import socket
+from typing import Optional
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 5.0):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self._path)
+        self.sock = sock
+
+
+def socket_path_from_env() -> str:
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return DEFAULT_SOCKET
+
+
+class DockerCollector:
+    def __init__(self, socket_path: Optional[str] = None, timeout: float = 5.0):
+        self.socket_path = socket_path or socket_path_from_env()
+        self.timeout = timeout
+        self._conn: Optional[_UnixHTTPConnection] = None
+        # id -> (total_usage, system_cpu_usage) de la lectura anterior
+        self._prev_cpu: dict[str, tuple] = {}
+
+    def available(self) -> bool:
+        return hasattr(socket, "AF_UNIX") and os.path.exists(self.socket_path)
+
+    def _get(self, path: str):
+        if self._conn is None:
+            self._conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            self._conn.request("GET", path)
+            resp = self._conn.getresponse()
+            body = resp.read()
+        except Exception:
+            self.close()
+            raise
+        if resp.status != 200:
+            raise RuntimeError(f"Docker API {path}: {resp.status}")
+        return json.loads(body)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _cpu_percent(self, cid: str, stats: dict) -> Optional[float]:
+        cpu = stats.get("cpu_stats") or {}
+        total = (cpu.get("cpu_usage") or {}).get("total_usage")
+        system = cpu.get("system_cpu_usage")
+        if total is None or system is None:
+            return None
+        prev = self._prev_cpu.get(cid)
+        self._prev_cpu[cid] = (total, system)
+        if prev is None:
+            return None
+        d_total, d_system = total - prev[0], system - prev[1]
+        if d_system <= 0 or d_total < 0:
+            return 0.0
+        online = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+        return round(d_total / d_system * online * 100, 2)
+
+    @staticmethod
+    def _mem_mb(stats: dict) -> Optional[float]:
+        mem = stats.get("memory_stats") or {}
+        usage = mem.get("usage")
+        if usage is None:
+            return None
+        # Igual que `docker stats`: descontar page cache (cgroup v2: inactive_file, v1: cache)
+        detail = mem.get("stats") or {}
+        usage -= detail.get("inactive_file", detail.get("cache", 0))
+        return round(max(usage, 0) / (1024 ** 2), 2)
+
+    def collect(self) -> dict:
+        containers = []
+        running = 0
+        seen = set()
+        for c in self._get("/containers/json?all=1"):
+            cid = c["Id"]
+            seen.add(cid)
+            name = (c.get("Names") or [cid[:12]])[0].lstrip("/")
+            state = c.get("State")
+            item = {"name": name, "state": state, "cpu": None, "mem": None, "restart_count": None}
+            try:
+                inspect = self._get(f"/containers/{cid}/json")
+                item["restart_count"] = inspect.get("RestartCount")
+                if state == "running":
+                    running += 1
+                    stats = self._get(f"/containers/{cid}/stats?stream=false&one-shot=true")
+                    item["cpu"] = self._cpu_percent(cid, stats)
+                    item["mem"] = self._mem_mb(stats)
+            except Exception as e:
+                logging.debug("Sin estadísticas para %s: %s", name, e)
+            containers.append(item)
+        # Olvidar contenedores que ya no existen
+        for cid in list(self._prev_cpu):
+            if cid not in seen:
+                del self._prev_cpu[cid]
+        return {"running_containers": running, "containers": containers}
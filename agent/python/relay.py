@@ -0,0 +1,400 @@
+"""
+Relay de sitio: concentra los agentes de una red (p. ej. una DMZ) y reenvía sus
+muestras al backend central por una sola conexión persistente.
+
+- Los agentes locales apuntan `server` al relay; acepta /api/metrics y
+  /api/metrics/batch en JSON o MessagePack, con gzip o zstd (si está instalado
+  `zstandard`) opcional.
+- Cada `flush_interval` segundos agrupa lo recibido por servidor y token y lo
+  envía a /api/metrics/batch del backend, comprimido con gzip, con el token del
+  agente que lo envió.
+- Si el backend no responde (corte del WAN, 5xx) las muestras van al spool en
+  disco y se reenvían en orden cuando vuelve. Un 429 sólo frena a ese servidor.
+
+El relay no puede validar tokens: cada muestra queda ligada al token con el que
+llegó mediante una referencia opaca (hash de servidor y token), con un spool por
+referencia. Los tokens sólo se guardan en memoria; tras reiniciar el relay, el
+backlog de una referencia espera a que su agente vuelva a reportar con ese token.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+import signal
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from agent import _is_retryable, _retry_after, load_config, make_session, setup_logging
+from spool import Spool
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAX_BODY = 10 * 1024 * 1024
+
+
+def token_ref(server_id: str, token: str) -> str:
+    """Referencia opaca a (servidor, token); es lo único del token que llega a disco."""
+    return hashlib.sha256(f"{server_id}\0{token}".encode("utf-8")).hexdigest()[:32]
+
+
+class Relay:
+    def __init__(self, server_url: str, verify_tls, spool_dir, batch_size: int = 200,
+                 flush_interval: float = 5.0, max_pending: int = 10000, max_refs: int = 5000,
+                 spool_max_bytes: int = 50 * 1024 ** 2, spool_max_age: float = 7 * 86400):
+        self.server_url = server_url.rstrip("/")
+        self.verify_tls = verify_tls
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_refs = max_refs
+        self.spool_max_bytes = spool_max_bytes
+        self.spool_max_age = spool_max_age
+        self._pending: list[tuple] = []        # (ref, muestra)
+        self._tokens: dict[str, tuple] = {}    # ref -> (server_id, token), sólo en memoria
+        self._rejected: set = set()            # refs cuyo token rechazó el backend
+        self._info: dict[str, dict] = {}       # última respuesta del backend por servidor
+        self._backoff: dict[str, float] = {}   # ref -> fin del 429 (monotonic)
+        self._resume_at = 0.0                  # backoff global pedido por el backend (monotonic)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._session = None
+        # Un spool por referencia; los de un arranque anterior esperan a su token
+        self._spools: dict[str, Spool] = {}
+        for d in sorted(self.spool_dir.iterdir()):
+            if d.is_dir() and any(d.glob("seg-*.jsonl")):
+                self._spools[d.name] = self._open_spool(d.name)
+            elif d.is_dir():
+                shutil.rmtree(d, ignore_errors=True)
+
+    # --- Lado de los agentes (hilos del servidor HTTP) ---
+
+    def accept(self, server_id: str, token: str, samples: list) -> tuple:
+        """Encola muestras de un agente. Devuelve (status HTTP, cuerpo de la respuesta)."""
+        ref = token_ref(server_id, token)
+        with self._lock:
+            if ref in self._rejected:
+                return 403, {"detail": "Unauthorized server or bad token"}
+            if ref not in self._tokens and len(self._tokens) >= self.max_refs:
+                logging.error("Relay con %s tokens distintos en memoria, se rechaza %s", self.max_refs, server_id)
+                return 503, {"detail": "Relay saturado"}
+            self._tokens[ref] = (server_id, token)
+            self._pending.extend((ref, sample) for sample in samples)
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+            info = self._info.get(server_id, {})
+        response = {"status": "ok", "queued": len(samples)}
+        for key in ("report_interval", "thresholds"):
+            if info.get(key) is not None:
+                response[key] = info[key]
+        return 200, response
+
+    # --- Reenvío al backend (un único hilo) ---
+
+    def _open_spool(self, ref: str) -> Spool:
+        return Spool(self.spool_dir / ref, max_bytes=self.spool_max_bytes, max_age=self.spool_max_age)
+
+    def _spool(self, ref: str, samples: list):
+        spool = self._spools.get(ref)
+        if spool is None:
+            if len(self._spools) >= self.max_refs:
+                logging.error("Demasiados spools en el relay, se descartan %s muestras", len(samples))
+                return
+            spool = self._spools[ref] = self._open_spool(ref)
+        spool.extend(samples)
+
+    def _drop_spool(self, ref: str):
+        spool = self._spools.pop(ref, None)
+        if spool is not None:
+            spool.seal()
+            shutil.rmtree(spool.dir, ignore_errors=True)
+
+    def _backlog(self, ref: str) -> bool:
+        spool = self._spools.get(ref)
+        return spool is not None and spool.pending()
+
+    def _post_batch(self, server_id: str, token: str, samples: list):
+        body = gzip.compress(json.dumps({"server_id": server_id, "samples": samples}).encode("utf-8"), compresslevel=6)
+        return self._session.post(
+            f"{self.server_url}/api/metrics/batch",
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip", "X-Auth-Token": token},
+            timeout=30,
+        )
+
+    def _send(self, ref: str, samples: list) -> tuple:
+        """
+        Envía las muestras de una referencia en lotes. Devuelve (resultado, no enviadas):
+        "ok", "rejected" (token inválido, se descartan), "retry" (429 de este
+        servidor) o "down" (backend caído o saturado: afecta a todos).
+        """
+        server_id, token = self._tokens[ref]
+        for i in range(0, len(samples), self.batch_size):
+            chunk = samples[i:i + self.batch_size]
+            try:
+                resp = self._post_batch(server_id, token, chunk)
+            except Exception as e:
+                logging.warning("Backend no disponible: %s", e)
+                self._reconnect()
+                return "down", samples[i:]
+            if resp.status_code == 200:
+                rj = resp.json()
+                with self._lock:
+                    self._info[server_id] = rj
+                if rj.get("rejected"):
+                    logging.warning("Backend descartó %s muestras de %s", rj["rejected"], server_id)
+            elif resp.status_code in (401, 403):
+                logging.error("Backend rechazó el token de %s, se descartan sus muestras", server_id)
+                with self._lock:
+                    self._rejected.add(ref)
+                    self._tokens.pop(ref, None)
+                return "rejected", []
+            elif resp.status_code == 429:
+                self._backoff[ref] = time.monotonic() + (_retry_after(resp) or self.flush_interval)
+                logging.warning("Backend limita a %s (429), se reintenta más tarde", server_id)
+                return "retry", samples[i:]
+            elif _is_retryable(resp.status_code):
+                self._resume_at = time.monotonic() + (_retry_after(resp) or 0)
+                logging.warning("Backend respondió %s, se reintenta más tarde", resp.status_code)
+                return "down", samples[i:]
+            else:
+                logging.error("Lote de %s rechazado (%s), se descarta: %s", server_id, resp.status_code, resp.text)
+        return "ok", []
+
+    def _reconnect(self):
+        """Una sola conexión persistente hacia el backend; el token va en cada lote."""
+        if self._session is not None:
+            self._session.close()
+        self._session = make_session("", self.verify_tls)
+        self._session.headers.pop("X-Auth-Token", None)
+
+    def _ready(self, ref: str) -> bool:
+        return ref in self._tokens and time.monotonic() >= self._backoff.get(ref, 0)
+
+    def replay(self, max_batches: int = 10) -> bool:
+        """
+        Reenvía el spool de cada referencia con su propio token. Las que no tienen
+        token conocido o están en 429 quedan intactas. False si el backend cayó.
+        """
+        for ref in list(self._spools):
+            if ref in self._rejected:
+                self._drop_spool(ref)
+                continue
+            if not self._ready(ref):
+                continue
+            spool = self._spools[ref]
+            for _ in range(max_batches):
+                samples, position = spool.read_batch(self.batch_size)
+                if position is None:
+                    break
+                if samples:
+                    outcome, _ = self._send(ref, samples)
+                    if outcome == "rejected":
+                        self._drop_spool(ref)
+                        break
+                    if outcome == "down":
+                        return False
+                    if outcome == "retry":
+                        break  # sin commit: se reintenta el mismo lote
+                spool.commit(position)
+        return True
+
+    def flush(self):
+        with self._lock:
+            entries, self._pending = self._pending, []
+        groups: dict[str, list] = {}
+        for ref, sample in entries:
+            groups.setdefault(ref, []).append(sample)
+
+        down = time.monotonic() < self._resume_at
+        spooled = 0
+        for ref, samples in groups.items():
+            if ref in self._rejected:
+                continue
+            # Con backlog propio las nuevas van detrás, para conservar el orden
+            if down or not self._ready(ref) or self._backlog(ref):
+                self._spool(ref, samples)
+                spooled += len(samples)
+                continue
+            outcome, rest = self._send(ref, samples)
+            if rest:
+                self._spool(ref, rest)
+                spooled += len(rest)
+            if outcome == "down":
+                down = True
+        if spooled:
+            logging.info("%s muestras guardadas en el spool", spooled)
+        if not down:
+            self.replay()
+
+    def run(self):
+        self._reconnect()
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.exception("Error reenviando muestras: %s", e)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def close(self):
+        """Guarda en el spool lo que quedó en memoria (llamar con el reenvío detenido)."""
+        with self._lock:
+            entries, self._pending = self._pending, []
+        groups: dict[str, list] = {}
+        for ref, sample in entries:
+            groups.setdefault(ref, []).append(sample)
+        for ref, samples in groups.items():
+            self._spool(ref, samples)
+        for spool in self._spools.values():
+            spool.seal()
+
+
+class UnsupportedEncoding(ValueError):
+    """Compresión o formato que este relay no sabe decodificar (415)."""
+
+
+def _decode(body: bytes, headers) -> dict:
+    encoding = (headers.get("Content-Encoding") or "").strip().lower()
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd no soportado en el relay (zstandard no instalado)")
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            body = reader.read(MAX_BODY + 1)
+        if len(body) > MAX_BODY:
+            raise ValueError("Cuerpo descomprimido demasiado grande")
+    elif encoding not in ("", "identity"):
+        raise UnsupportedEncoding(f"Content-Encoding no soportado: {encoding}")
+    content_type = (headers.get("Content-Type") or "").split(";")[0].strip().lower()
+    if content_type.endswith("msgpack"):
+        if msgpack is None:
+            raise UnsupportedEncoding("MessagePack no soportado (msgpack no instalado)")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    relay: Relay = None
+
+    def _reply(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path not in ("/api/metrics", "/api/metrics/batch"):
+            return self._reply(404, {"detail": "Not Found"})
+        token = self.headers.get("X-Auth-Token")
+        if not token:
+            return self._reply(401, {"detail": "Missing auth token"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            return self._reply(413, {"detail": "Cuerpo demasiado grande"})
+        try:
+            message = _decode(self.rfile.read(length), self.headers)
+        except UnsupportedEncoding as e:
+            return self._reply(415, {"detail": str(e)})
+        except ValueError as e:
+            return self._reply(400, {"detail": str(e)})
+        if not isinstance(message, dict) or not isinstance(message.get("server_id"), str):
+            return self._reply(422, {"detail": "server_id requerido"})
+
+        if self.path == "/api/metrics":
+            if "delta" in message:
+                # El relay no guarda bases: el agente reenvía la muestra completa
+                return self._reply(409, {"detail": "resync"})
+            message.pop("seq", None)
+            samples = [message]
+        else:
+            samples = [s for s in message.get("samples") or [] if isinstance(s, dict)]
+            if any(s.get("server_id") != message["server_id"] for s in samples):
+                return self._reply(422, {"detail": "Muestras de otro servidor en el lote"})
+
+        status, response = self.relay.accept(message["server_id"], token, samples)
+        if status == 200 and self.path == "/api/metrics/batch":
+            response["accepted"], response["rejected"] = len(samples), 0
+        self._reply(status, response)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay de sitio para agentes de monitoreo")
+    parser.add_argument("--server", help="URL del backend central (https://host:port)")
+    parser.add_argument("--listen", help="Dirección local host:puerto (default 0.0.0.0:8081)")
+    parser.add_argument("--config", default=str(Path(__file__).resolve().parent / "relay.config.json"), help="Ruta a archivo de configuración")
+    args = parser.parse_args()
+
+    setup_logging()
+    cfg = load_config(Path(args.config))
+    server = args.server or cfg.get("server", "")
+    if not server:
+        print("Falta la URL del backend. Usa --server o la clave 'server' en la configuración.")
+        return
+    host, _, port = (args.listen or cfg.get("listen", "0.0.0.0:8081")).rpartition(":")
+
+    verify = cfg.get("verify", True)
+    if isinstance(verify, str) and verify.lower() == "false":
+        verify = False
+
+    relay = Relay(
+        server,
+        verify,
+        cfg.get("spool_dir") or Path(__file__).resolve().parent / "relay-spool",
+        batch_size=int(cfg.get("batch_size", 200)),
+        flush_interval=float(cfg.get("flush_interval", 5)),
+        spool_max_bytes=int(cfg.get("spool_max_mb", 50)) * 1024 ** 2,
+        spool_max_age=float(cfg.get("spool_max_age_hours", 168)) * 3600,
+    )
+    forwarder = threading.Thread(target=relay.run, name="relay-forwarder", daemon=True)
+    forwarder.start()
+
+    RelayHandler.relay = relay
+    httpd = ThreadingHTTPServer((host or "0.0.0.0", int(port)), RelayHandler)
+    if cfg.get("tls_cert"):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cfg["tls_cert"], cfg.get("tls_key"))
+        httpd.socket = ctx.wrap_socket(httpd.socket, server_side=True)
+    # systemd y pm2 detienen con SIGTERM: cerrar igual que con Ctrl+C para guardar
+    # lo pendiente. shutdown() espera a serve_forever, así que va en otro hilo.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=httpd.shutdown, daemon=True).start())
+    logging.info("Relay escuchando en %s:%s, reenviando a %s", host or "0.0.0.0", port, server)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        relay.stop()
+        forwarder.join(timeout=30)
+        # Lo que quede en memoria se guarda para el próximo arranque
+        relay.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Agregación de muestras dentro del intervalo de reporte.
+
+El agente mide cada pocos segundos y envía un único resumen (min, max, avg, p95,
+last) por intervalo. La memoria es fija sin importar cuántas muestras se tomen:
+los percentiles salen de un histograma de resolución 0.1 sobre 0-100 %.
+
+ThresholdWatch evalúa esas mismas muestras contra los umbrales que devuelve el
+servidor para adelantar el reporte cuando algo se dispara.
+"""
+import math
+import time
+
+_BINS = 1001  # 0.0 .. 100.0 en pasos de 0.1
+
+
+class SeriesAggregator:
+    """Resumen en streaming de una serie porcentual (0-100)."""
+
+    __slots__ = ("count", "min", "max", "total", "last", "_hist")
+
+    def __init__(self):
+        self._hist = [0] * _BINS
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.last = None
+        for i in range(_BINS):
+            self._hist[i] = 0
+
+    def add(self, value: float):
+        value = min(max(float(value), 0.0), 100.0)
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._hist[int(round(value * 10))] += 1
+
+    def percentile(self, q: float) -> float:
+        rank = max(1, math.ceil(q * self.count))  # nearest-rank
+        seen = 0
+        for i, n in enumerate(self._hist):
+            seen += n
+            if n and seen >= rank:
+                return i / 10
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return None
+        return {
+            "min": self.min,
+            "max": self.max,
+            "avg": round(self.total / self.count, 2),
+            "p95": min(self.percentile(0.95), self.max),
+            "last": self.last,
+        }
+
+
+class IntervalAggregator:
+    """Agrupa las series de CPU, memoria y disco de un intervalo de reporte."""
+
+    SERIES = ("cpu", "memory", "disk")
+
+    def __init__(self):
+        self.series = {name: SeriesAggregator() for name in self.SERIES}
+        self.samples = 0
+        self.started = None
+
+    def add(self, cpu: float, memory: float, disk: float):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.samples += 1
+        for name, value in (("cpu", cpu), ("memory", memory), ("disk", disk)):
+            if value is not None:
+                self.series[name].add(value)
+
+    def summary(self):
+        if not self.samples:
+            return None
+        out = {
+            "samples": self.samples,
+            "window": round(time.monotonic() - self.started, 1),
+        }
+        for name, agg in self.series.items():
+            out[name] = agg.summary()
+        return out
+
+    def reset(self):
+        self.samples = 0
+        self.started = None
+        for agg in self.series.values():
+            agg.reset()
+
+
+class ThresholdWatch:
+    """
+    Umbrales efectivos del servidor (respuesta de /api/metrics) evaluados en cada
+    muestra rápida. Cada umbral superado tiene su propio cooldown local para no
+    repetir reportes fuera de ciclo mientras la condición se mantiene.
+    """
+
+    def __init__(self, cooldown: float = 600):
+        self.cooldown = cooldown
+        self.limits = {}
+        self._last = {}
+
+    def update(self, limits):
+        if isinstance(limits, dict):
+            self.limits = limits
+
+    def breaches(self, cpu, memory, mounts) -> list:
+        """Umbrales superados fuera de cooldown (p. ej. "cpu", "disk:/data"); arma su cooldown."""
+        checks = [("cpu", cpu, self.limits.get("cpu")), ("memory", memory, self.limits.get("memory"))]
+        mount_limits = self.limits.get("disk_mounts") or {}
+        for mount in mounts or []:
+            limit = mount_limits.get(mount["mountpoint"], self.limits.get("disk"))
+            checks.append((f"disk:{mount['mountpoint']}", mount["percent"], limit))
+
+        now = time.monotonic()
+        out = []
+        for key, value, limit in checks:
+            if value is None or not limit or limit <= 0 or value < limit:
+                continue
+            if now - self._last.get(key, float("-inf")) < self.cooldown:
+                continue
+            self._last[key] = now
+            out.append(key)
+        return out
@@ -0,0 +1,154 @@
+"""
+Spool local de muestras no enviadas.
+
+Segmentos JSONL append-only (`seg-<ms>.jsonl`) en un directorio. El segmento activo
+se rota por tamaño o antigüedad; los segmentos sellados se reenvían en orden y se
+borran al confirmarse. Un cursor (`cursor.json`) recuerda hasta dónde se envió el
+segmento más antiguo para no duplicar muestras tras un reinicio.
+Límites: tamaño total y antigüedad máxima; al superarlos se descartan los segmentos
+más antiguos.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+CURSOR_FILE = "cursor.json"
+
+
+class Spool:
+    def __init__(self, directory, max_bytes: int = 50 * 1024 ** 2, max_age: float = 7 * 86400,
+                 segment_bytes: int = 1024 ** 2, segment_age: float = 3600):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self._active: Optional[Path] = None
+        self._active_fh = None
+        self._active_opened = 0.0
+
+    # --- Escritura ---
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.dir.glob("seg-*.jsonl"))
+
+    def _open_segment(self):
+        # Nombres siempre crecientes aunque el reloj retroceda: el orden de reenvío es el del nombre
+        seq = int(time.time() * 1000)
+        segments = self._segments()
+        if segments:
+            seq = max(seq, int(segments[-1].stem[4:]) + 1)
+        path = self.dir / f"seg-{seq:015d}.jsonl"
+        self._active = path
+        self._active_fh = open(path, "ab")
+        self._active_opened = time.time()
+
+    def seal(self):
+        """Cierra el segmento activo; la próxima escritura abre uno nuevo."""
+        if self._active_fh:
+            self._active_fh.close()
+        self._active = None
+        self._active_fh = None
+
+    def append(self, record: dict):
+        self.extend([record])
+
+    def extend(self, records: list):
+        """Agrega varias muestras con un solo fsync."""
+        if not records:
+            return
+        if self._active_fh is None:
+            self._open_segment()
+        self._active_fh.write(b"".join(
+            json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n" for record in records
+        ))
+        self._active_fh.flush()
+        os.fsync(self._active_fh.fileno())
+        if (self._active_fh.tell() >= self.segment_bytes
+                or time.time() - self._active_opened >= self.segment_age):
+            self.seal()
+        self._enforce_limits()
+
+    def _enforce_limits(self):
+        now = time.time()
+        segments = [s for s in self._segments() if s != self._active]
+        total = sum(s.stat().st_size for s in self._segments())
+        for seg in segments:
+            too_old = now - seg.stat().st_mtime > self.max_age
+            if not too_old and total <= self.max_bytes:
+                break
+            size = seg.stat().st_size
+            logging.warning("Spool lleno o antiguo: se descarta %s (%s bytes)", seg.name, size)
+            self._drop(seg)
+            total -= size
+
+    def _drop(self, seg: Path):
+        seg.unlink(missing_ok=True)
+        cursor = self._read_cursor()
+        if cursor and cursor.get("segment") == seg.name:
+            (self.dir / CURSOR_FILE).unlink(missing_ok=True)
+
+    # --- Lectura / confirmación ---
+
+    def pending(self) -> bool:
+        return bool(self._segments())
+
+    def _read_cursor(self) -> Optional[dict]:
+        try:
+            return json.loads((self.dir / CURSOR_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_cursor(self, segment: str, offset: int):
+        tmp = self.dir / (CURSOR_FILE + ".tmp")
+        tmp.write_text(json.dumps({"segment": segment, "offset": offset}), encoding="utf-8")
+        os.replace(tmp, self.dir / CURSOR_FILE)
+
+    def read_batch(self, max_items: int) -> tuple[list[dict], Optional[tuple[str, int]]]:
+        """
+        Hasta `max_items` muestras del segmento más antiguo, a partir del cursor.
+        Devuelve (muestras, posición); la posición se pasa a `commit` tras enviarlas.
+        """
+        segments = self._segments()
+        if not segments:
+            return [], None
+        seg = segments[0]
+        if seg == self._active:
+            self.seal()
+
+        cursor = self._read_cursor()
+        offset = cursor["offset"] if cursor and cursor.get("segment") == seg.name else 0
+        records = []
+        with open(seg, "rb") as fh:
+            fh.seek(offset)
+            while len(records) < max_items:
+                line = fh.readline()
+                if not line:
+                    break
+                offset = fh.tell()
+                if not line.endswith(b"\n"):
+                    # Línea truncada por un corte de energía (el segmento ya está sellado)
+                    logging.warning("Línea truncada en %s, se omite", seg.name)
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logging.warning("Línea corrupta en %s, se omite", seg.name)
+        return records, (seg.name, offset)
+
+    def commit(self, position: tuple[str, int]):
+        """Confirma lo leído hasta `position`; borra el segmento si quedó completo."""
+        name, offset = position
+        seg = self.dir / name
+        try:
+            size = seg.stat().st_size
+        except OSError:
+            return
+        if offset >= size:
+            self._drop(seg)
+        else:
+            self._write_cursor(name, offset)
@@ -0,0 +1,205 @@
+import sys
+import os
+import gzip
+import json
+import signal
+import socket
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import msgpack
+import pytest
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import relay
+from agent import make_session
+from relay import Relay, UnsupportedEncoding, _decode
+
+
+def _resp(status_code: int, data: dict = None, headers: dict = None):
+    resp = MagicMock(status_code=status_code, text="", headers=headers or {})
+    resp.json.return_value = data or {}
+    return resp
+
+
+class FakeSession:
+    """Sesión del backend: responde según el token y registra cada lote."""
+
+    def __init__(self, respond=None):
+        self.headers = {}
+        self.posts = []
+        self.respond = respond or (lambda token, body: _resp(200, {"accepted": len(body["samples"])}))
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        body = json.loads(gzip.decompress(data))
+        self.posts.append((headers["X-Auth-Token"], body))
+        return self.respond(headers["X-Auth-Token"], body)
+
+    def close(self):
+        pass
+
+    def sent(self, token=None):
+        return [s["n"] for t, body in self.posts if token in (None, t) for s in body["samples"]]
+
+
+@pytest.fixture
+def backend():
+    session = FakeSession()
+    with patch.object(relay, "make_session", return_value=session):
+        yield session
+
+
+def _relay(tmp_path, **kwargs) -> Relay:
+    r = Relay("http://backend", True, tmp_path / "spool", **kwargs)
+    r._reconnect()
+    return r
+
+
+def _samples(server_id: str, *ns) -> list:
+    return [{"server_id": server_id, "n": n} for n in ns]
+
+
+def test_decode_gzip_json_and_msgpack():
+    payload = {"server_id": "srv1", "cpu_total": 10.0}
+    assert _decode(gzip.compress(json.dumps(payload).encode()), {"Content-Encoding": "gzip"}) == payload
+    assert _decode(msgpack.packb(payload), {"Content-Type": "application/msgpack"}) == payload
+    with pytest.raises(UnsupportedEncoding):
+        _decode(b"{}", {"Content-Encoding": "br"})
+
+
+def test_decode_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    payload = {"server_id": "srv1", "cpu_total": 10.0}
+    body = zstandard.ZstdCompressor().compress(json.dumps(payload).encode())
+    assert _decode(body, {"Content-Encoding": "zstd"}) == payload
+
+
+def test_decode_zstd_without_zstandard_is_unsupported():
+    with patch.object(relay, "zstandard", None):
+        with pytest.raises(UnsupportedEncoding):
+            _decode(b"\x28\xb5\x2f\xfd", {"Content-Encoding": "zstd"})
+
+
+def test_flush_groups_by_server_and_token(tmp_path, backend):
+    r = _relay(tmp_path)
+    assert r.accept("srv1", "tok1", _samples("srv1", 0, 1))[0] == 200
+    assert r.accept("srv2", "tok2", _samples("srv2", 2))[0] == 200
+    r.accept("srv1", "tok1", _samples("srv1", 3))
+    r.flush()
+
+    assert [(token, body["server_id"]) for token, body in backend.posts] == [("tok1", "srv1"), ("tok2", "srv2")]
+    assert backend.sent("tok1") == [0, 1, 3]
+    assert backend.sent("tok2") == [2]
+
+
+def test_forged_sample_spooled_during_outage_replays_with_its_own_token(tmp_path, backend):
+    r = _relay(tmp_path)
+    backend.respond = lambda token, body: _resp(503)
+    r.accept("srv1", "good", _samples("srv1", 0))
+    r.accept("srv1", "forged", _samples("srv1", 99))
+    r.flush()
+    assert backend.posts and not r.replay()
+
+    backend.posts.clear()
+    backend.respond = lambda token, body: _resp(200) if token == "good" else _resp(403)
+    r._resume_at = 0
+    r.flush()
+
+    assert backend.sent("good") == [0]
+    assert backend.sent("forged") == [99]  # se intentó con el token del falsificador, no con otro
+    assert r.accept("srv1", "forged", _samples("srv1", 100))[0] == 403
+    assert not any(spool.pending() for spool in r._spools.values())
+
+
+def test_rate_limit_backs_off_only_that_server(tmp_path, backend):
+    r = _relay(tmp_path, flush_interval=60)
+    backend.respond = lambda token, body: _resp(429, headers={"Retry-After": "60"}) if token == "tok1" else _resp(200)
+    r.accept("srv1", "tok1", _samples("srv1", 0))
+    r.accept("srv2", "tok2", _samples("srv2", 1))
+    r.flush()
+
+    r.accept("srv1", "tok1", _samples("srv1", 2))
+    r.accept("srv2", "tok2", _samples("srv2", 3))
+    r.flush()
+
+    assert backend.sent("tok1") == [0]   # un solo intento durante el backoff
+    assert backend.sent("tok2") == [1, 3]
+    ref = relay.token_ref("srv1", "tok1")
+    assert [s["n"] for s in r._spools[ref].read_batch(10)[0]] == [0, 2]
+
+
+def test_backlog_waits_for_its_token_after_restart(tmp_path, backend):
+    backend.respond = lambda token, body: _resp(503)
+    r = _relay(tmp_path)
+    r.accept("srv1", "tok1", _samples("srv1", 0, 1))
+    r.flush()
+    r.close()
+
+    # Tras reiniciar el relay no conoce el token: el backlog queda intacto
+    backend.posts.clear()
+    backend.respond = lambda token, body: _resp(200)
+    r = _relay(tmp_path)
+    ref = relay.token_ref("srv1", "tok1")
+    segments = sorted(p.name for p in r._spools[ref].dir.glob("seg-*.jsonl"))
+    r.flush()
+    assert backend.posts == []
+    assert sorted(p.name for p in r._spools[ref].dir.glob("seg-*.jsonl")) == segments
+
+    # El agente vuelve a reportar: primero el backlog, luego lo nuevo
+    r.accept("srv1", "tok1", _samples("srv1", 2))
+    r.flush()
+    assert backend.sent() == [0, 1, 2]
+    assert not r._spools[ref].pending()
+
+
+def test_make_session_keeps_verify_false():
+    assert make_session("tok", False).verify is False
+    assert make_session("tok", None).verify is True
+    assert make_session("tok", "/etc/ca.pem").verify == "/etc/ca.pem"
+
+
+def test_sigterm_spools_pending_samples(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = tmp_path / "relay.config.json"
+    config.write_text(json.dumps({
+        "server": "http://127.0.0.1:9", "listen": f"127.0.0.1:{port}",
+        "spool_dir": str(tmp_path / "spool"), "flush_interval": 3600,
+    }))
+
+    statuses = []
+
+    def agent_then_sigterm():
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            resp = requests.post(f"http://127.0.0.1:{port}/api/metrics", json={"server_id": "srv1", "n": 0},
+                                 headers={"X-Auth-Token": "tok1"}, timeout=5)
+            statuses.append(resp.status_code)
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    previous = signal.getsignal(signal.SIGTERM)
+    sender = threading.Thread(target=agent_then_sigterm)
+    try:
+        with patch.object(relay, "setup_logging"), \
+             patch.object(sys, "argv", ["relay.py", "--config", str(config)]):
+            sender.start()
+            relay.main()  # vuelve al recibir SIGTERM
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        sender.join(timeout=5)
+
+    assert statuses == [200]
+    # Lo recibido antes del SIGTERM quedó en el spool de su token
+    spool_dir = tmp_path / "spool" / relay.token_ref("srv1", "tok1")
+    lines = [json.loads(line) for seg in spool_dir.glob("seg-*.jsonl") for line in seg.read_text().splitlines()]
+    assert lines == [{"server_id": "srv1", "n": 0}]
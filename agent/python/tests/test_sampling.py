@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import agent
+from agent import MountTracker, sample_until
+from sampling import ThresholdWatch
+
+LIMITS = {"cpu": 90.0, "memory": 90.0, "disk": 80.0, "disk_mounts": {"/backup": 95.0}}
+
+
+def _mount(mountpoint: str, percent: float) -> dict:
+    return {"mountpoint": mountpoint, "device": "/dev/sda1", "fstype": "ext4",
+            "total": 100.0, "used": percent, "free": 100.0 - percent, "percent": percent}
+
+
+def test_threshold_watch_uses_server_limits_and_mount_overrides():
+    watch = ThresholdWatch(cooldown=600)
+    assert watch.breaches(99.0, 99.0, [_mount("/", 99.0)]) == []  # sin umbrales del servidor
+
+    watch.update(LIMITS)
+    mounts = [_mount("/", 85.0), _mount("/backup", 90.0), _mount("/data", 50.0)]
+    assert watch.breaches(95.0, 10.0, mounts) == ["cpu", "disk:/"]
+
+
+def test_threshold_watch_cooldown_per_threshold():
+    watch = ThresholdWatch(cooldown=0.05)
+    watch.update(LIMITS)
+    assert watch.breaches(95.0, 10.0, []) == ["cpu"]
+    assert watch.breaches(95.0, 95.0, []) == ["memory"]
+    time.sleep(0.06)
+    assert watch.breaches(95.0, 95.0, []) == ["cpu", "memory"]
+
+
+def test_threshold_watch_ignores_invalid_update():
+    watch = ThresholdWatch()
+    watch.update(LIMITS)
+    watch.update(None)
+    assert watch.limits == LIMITS
+
+
+def test_mount_tracker_forces_unchanged_mounts():
+    tracker = MountTracker(min_change=0.5, full_every=100)
+    mounts = [_mount("/", 50.0), _mount("/data", 85.0)]
+    assert tracker.changed(mounts) == (mounts, True)
+    assert tracker.changed(mounts) == ([], False)
+
+    tracker.force(["/data"])
+    assert tracker.changed(mounts) == ([mounts[1]], False)
+    assert tracker.changed(mounts) == ([], False)
+    assert tracker.current == mounts
+
+
+def test_sample_until_returns_breached_mount():
+    watch = ThresholdWatch()
+    watch.update(LIMITS)
+    mounts = [_mount("/", 50.0), _mount("/data", 85.0)]
+    with patch.object(agent, "read_mounts", return_value=mounts), \
+         patch.object(agent, "read_cpu", return_value={"total": 10.0, "per_core": [10.0]}), \
+         patch.object(agent, "read_memory", return_value={"total": 100.0, "used": 10.0, "free": 90.0, "cache": 0.0}):
+        breached = sample_until(time.monotonic() + 5, 0.01, None, watch)
+    assert breached == ["disk:/data"]
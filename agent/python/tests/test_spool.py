@@ -0,0 +1,79 @@
+import sys
+import os
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from spool import Spool, CURSOR_FILE
+from agent import replay_spool
+
+
+def _resp(status_code: int, data: dict = None):
+    resp = MagicMock(status_code=status_code, text="")
+    resp.json.return_value = data or {}
+    return resp
+
+
+def test_spool_reads_in_order_and_resumes_from_cursor(tmp_path):
+    spool = Spool(tmp_path)
+    for i in range(5):
+        spool.append({"n": i})
+
+    batch, position = spool.read_batch(3)
+    assert [r["n"] for r in batch] == [0, 1, 2]
+    spool.commit(position)
+
+    # Tras un reinicio se continúa desde el cursor, sin duplicar
+    reopened = Spool(tmp_path)
+    batch, position = reopened.read_batch(10)
+    assert [r["n"] for r in batch] == [3, 4]
+    reopened.commit(position)
+    assert not reopened.pending()
+    assert not (tmp_path / CURSOR_FILE).exists()
+
+
+def test_spool_skips_truncated_line(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append({"n": 0})
+    spool.seal()
+    seg = next(tmp_path.glob("seg-*.jsonl"))
+    with open(seg, "ab") as fh:
+        fh.write(b'{"n": 1')  # corte de energía a mitad de escritura
+
+    batch, position = spool.read_batch(10)
+    assert batch == [{"n": 0}]
+    spool.commit(position)
+    assert spool.read_batch(10) == ([], None)
+
+
+def test_spool_drops_oldest_segments_over_size(tmp_path):
+    spool = Spool(tmp_path, max_bytes=200, segment_bytes=50)
+    for i in range(20):
+        spool.append({"n": i, "pad": "x" * 20})
+    total = sum(s.stat().st_size for s in tmp_path.glob("seg-*.jsonl"))
+    assert total <= 200 + 50
+    batch, _ = spool.read_batch(100)
+    assert batch[0]["n"] > 0
+
+
+def test_replay_spool_sends_batches_and_commits(tmp_path):
+    spool = Spool(tmp_path)
+    for i in range(5):
+        spool.append({"server_id": "srv1", "n": i})
+    session = MagicMock()
+    session.post.return_value = _resp(200, {"accepted": 2})
+
+    assert replay_spool(session, "http://backend", "srv1", spool, batch_size=2, max_batches=10, pause=0)
+    sent = [s["n"] for call in session.post.call_args_list for s in call.kwargs["json"]["samples"]]
+    assert sent == [0, 1, 2, 3, 4]
+    assert not spool.pending()
+
+
+def test_replay_spool_keeps_backlog_when_backend_fails(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append({"server_id": "srv1", "n": 0})
+    session = MagicMock()
+    session.post.return_value = _resp(503)
+
+    assert not replay_spool(session, "http://backend", "srv1", spool, pause=0)
+    assert spool.read_batch(10)[0] == [{"server_id": "srv1", "n": 0}]
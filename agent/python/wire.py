@@ -0,0 +1,101 @@
+"""
+Formato compacto de envío (contraparte de server/app/wire.py).
+
+Cada muestra lleva un `seq`. Cuando el servidor confirma una (`ack`), pasa a ser
+la base: las siguientes se envían como delta de campos cambiados más un digest de
+la muestra completa. El cuerpo va en JSON o MessagePack (si `msgpack` está
+instalado) y se comprime con gzip, o zstd si `zstandard` está instalado y se pidió.
+Si el servidor responde 409 se vuelve a enviar completa.
+"""
+import gzip
+import hashlib
+import json
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DELETED_KEY = "$del"
+
+
+def digest(sample: dict) -> str:
+    canonical = json.dumps(sample, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def diff(old: dict, new: dict) -> dict:
+    """Campos de `new` que difieren de `old` (recursivo en dicts; listas completas)."""
+    out = {}
+    for key, value in new.items():
+        if key not in old:
+            out[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            nested = diff(old[key], value)
+            if nested:
+                out[key] = nested
+        elif old[key] != value:
+            out[key] = value
+    removed = [k for k in old if k not in new]
+    if removed:
+        out[DELETED_KEY] = removed
+    return out
+
+
+class WireEncoder:
+    def __init__(self, compression: str = "gzip", fmt: str = "json"):
+        if compression == "zstd" and zstandard is None:
+            compression = "gzip"
+        if fmt == "msgpack" and msgpack is None:
+            fmt = "json"
+        self.compression = compression
+        self.fmt = fmt
+        self._seq = 0
+        self._base: Optional[tuple] = None     # (seq, muestra completa) confirmada
+        self._pending: Optional[tuple] = None  # última enviada, sin confirmar
+
+    def reset(self):
+        self._base = None
+
+    def encode(self, sample: dict, full: bool = False) -> tuple:
+        """(cuerpo, headers, seq) de la muestra; `full` fuerza el envío completo."""
+        self._seq += 1
+        seq = self._seq
+        # Round-trip JSON para que la base sea idéntica a lo que reconstruye el servidor
+        sample = json.loads(json.dumps(sample))
+        if self._base is not None and not full:
+            message = {
+                "server_id": sample["server_id"],
+                "seq": seq,
+                "base": self._base[0],
+                "delta": diff(self._base[1], sample),
+                "digest": digest(sample),
+            }
+        else:
+            message = dict(sample, seq=seq)
+        self._pending = (seq, sample)
+
+        if self.fmt == "msgpack":
+            body = msgpack.packb(message, use_bin_type=True)
+            headers = {"Content-Type": "application/msgpack"}
+        else:
+            body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+            headers = {"Content-Type": "application/json"}
+        if self.compression == "zstd":
+            body = zstandard.ZstdCompressor(level=6).compress(body)
+            headers["Content-Encoding"] = "zstd"
+        elif self.compression == "gzip":
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers, seq
+
+    def acknowledge(self, response: dict):
+        """Adopta como base la muestra confirmada por el servidor."""
+        if self._pending is not None and response.get("ack") == self._pending[0]:
+            self._base = self._pending
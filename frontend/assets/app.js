@@ -1464,11 +1464,27 @@ function DataMonitoringDashboard({ currentServer, userInfo }) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
+  const [flowStats, setFlowStats] = useState({ day: null, rows: [] });
+  const lastIdRef = useRef(null);
+
   const fetchData = async () => {
     try {
       setLoading(true);
-      const res = await fetchJSON('/api/data-monitoring?limit=50');
-      setData(res);
+      // Tras la primera carga solo se piden los registros nuevos (after_id)
+      const lastId = lastIdRef.current;
+      const url = lastId === null
+        ? '/api/data-monitoring?limit=50'
+        : `/api/data-monitoring?limit=50&after_id=${lastId}`;
+      const res = await fetchJSON(url);
+      if (res.length > 0) lastIdRef.current = res[0].id;
+      if (lastId === null) {
+        setData(res);
+      } else if (res.length > 0) {
+        setData(prev => res.concat(prev).slice(0, 50));
+      }
+      // Distribución por flujo del último día con datos (contadores agregados del servidor)
+      const stats = await fetchJSON('/api/data-monitoring/stats?group_by=flow&latest=true');
+      setFlowStats({ day: stats.length > 0 ? stats[0].day : null, rows: stats });
       setError(null);
     } catch (err) {
       console.error(err);
@@ -1484,13 +1500,8 @@ function DataMonitoringDashboard({ currentServer, userInfo }) {
     return () => clearInterval(interval);
   }, []);
 
-  const flowCounts = {};
-  data.forEach(d => {
-      const f = d.flow || 'Unknown';
-      flowCounts[f] = (flowCounts[f] || 0) + 1;
-  });
-  const chartLabels = Object.keys(flowCounts);
-  const chartData = Object.values(flowCounts);
+  const chartLabels = flowStats.rows.map(r => r.flow || 'Unknown');
+  const chartData = flowStats.rows.map(r => r.count);
 
   const handleDownload = () => {
     const token = getDashboardToken();
@@ -1548,7 +1559,7 @@ function DataMonitoringDashboard({ currentServer, userInfo }) {
     error && React.createElement('div', { style: { color: '#ef4444', marginBottom: 8 } }, error),
     
     chartLabels.length > 0 && React.createElement('div', { style: { marginBottom: 24 } },
-        React.createElement('div', { className: 'title', style: { fontSize: '0.9rem', marginBottom: 8, color: '#94a3b8' } }, 'Distribución por Flujo'),
+        React.createElement('div', { className: 'title', style: { fontSize: '0.9rem', marginBottom: 8, color: '#94a3b8' } }, flowStats.day ? `Distribución por Flujo (${flowStats.day})` : 'Distribución por Flujo'),
         React.createElement(BarChart, { labels: chartLabels, data: chartData, label: 'Eventos', color: '#3b82f6' })
     ),
 
@@ -37,6 +37,11 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "")
 SMTP_TLS = os.getenv("SMTP_TLS", "True").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))          # conexiones SMTP persistentes
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "10"))             # segundos
+
+# Canal de envío de correos: "mailjet" (API HTTP) o "smtp" (relay propio con pool de conexiones)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "mailjet").strip().lower()
 
 # Configuración de Email (API)
 EMAIL_API_KEY = os.getenv("EMAIL_API_KEY", "4cc4901cb8203fb46673d8e641d947b6")
@@ -56,6 +61,36 @@ TWILIO_ALERT_PHONE = os.getenv("TWILIO_ALERT_PHONE", "")
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "")
 TWILIO_WHATSAPP_TO = os.getenv("TWILIO_WHATSAPP_TO", "")
 TWILIO_WHATSAPP_CONTENT_SID = os.getenv("TWILIO_WHATSAPP_CONTENT_SID", "")
+TWILIO_WHATSAPP_MPS = float(os.getenv("TWILIO_WHATSAPP_MPS", "1"))      # mensajes salientes por segundo
+TWILIO_WHATSAPP_BURST = float(os.getenv("TWILIO_WHATSAPP_BURST", "1"))  # ráfaga máxima permitida
+
+# Procesamiento en segundo plano de comandos de WhatsApp
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "4"))
+WHATSAPP_MAX_PENDING_PER_PHONE = int(os.getenv("WHATSAPP_MAX_PENDING_PER_PHONE", "20"))
+FLEET_STATUS_TTL = int(os.getenv("FLEET_STATUS_TTL", "15"))  # segundos de caché del estado de flota por usuario
+
+# Ingest de métricas
+METRICS_MAX_BATCH = int(os.getenv("METRICS_MAX_BATCH", "500"))              # muestras por lote (reenvío de spool)
+REPLAY_ALERT_MAX_AGE = int(os.getenv("REPLAY_ALERT_MAX_AGE", "600"))        # muestras más antiguas no alertan (s)
+MOUNT_STATE_MAX_AGE = int(os.getenv("MOUNT_STATE_MAX_AGE", "86400"))        # sin reporte completo de montajes, estado más antiguo que se considera (s)
+PROCESS_SNAPSHOT_MARGIN = float(os.getenv("PROCESS_SNAPSHOT_MARGIN", "0.9"))  # guardar top de procesos desde 90% del umbral
+WIRE_MAX_BODY = int(os.getenv("WIRE_MAX_BODY", str(10 * 1024 * 1024)))     # bytes máximos (ya descomprimidos)
+INGEST_RETRY_AFTER = int(os.getenv("INGEST_RETRY_AFTER", "30"))            # Retry-After base cuando el ingest no da abasto (s)
+INGEST_SERVER_RATE = float(os.getenv("INGEST_SERVER_RATE", "0.2"))        # reportes/s sostenidos por servidor
+INGEST_SERVER_BURST = int(os.getenv("INGEST_SERVER_BURST", "10"))           # ráfaga (reporte inmediato, reenvío de spool)
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "8"))            # escrituras de ingest simultáneas (el resto del pool queda para el dashboard)
+INGEST_MAX_LATENCY = float(os.getenv("INGEST_MAX_LATENCY", "2.0"))         # latencia media de escritura que dispara el rechazo (s)
+INGEST_SHED_SECONDS = float(os.getenv("INGEST_SHED_SECONDS", "5"))         # cuánto dura el rechazo de carga (s)
+
+# Ingest por lotes de data-monitoring
+DATA_MONITORING_MAX_BATCH = int(os.getenv("DATA_MONITORING_MAX_BATCH", "5000"))     # registros por request
+DATA_MONITORING_INSERT_CHUNK = int(os.getenv("DATA_MONITORING_INSERT_CHUNK", "500"))  # filas por INSERT multi-fila
+DATA_MONITORING_MAX_PAGE = int(os.getenv("DATA_MONITORING_MAX_PAGE", "1000"))          # límite máximo del listado
+
+# Exportaciones en streaming
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))                # filas por fetch del cursor
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))    # tamaño de cada bloque enviado
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
 
 # Configuración de monitoreo de servidores offline
 OFFLINE_CHECK_INTERVAL = int(os.getenv("OFFLINE_CHECK_INTERVAL", "60"))  # cada cuánto revisar (segundos)
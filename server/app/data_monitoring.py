@@ -0,0 +1,272 @@
+"""
+Utilidades de ingest para data_monitoring.
+
+Los clientes (POS / cajas) envían `createdAt` y `workingDay` como texto libre; aquí se
+normalizan a columnas tipadas e indexadas sin perder el valor original.
+"""
+from collections import Counter
+from datetime import datetime, date, timezone
+from typing import Optional
+
+from sqlalchemy import select, update, delete, bindparam, text, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .models import DataMonitoring, DataMonitoringCounter
+
+# Formatos aceptados además de ISO 8601
+_DATETIME_FORMATS = (
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+)
+_DATE_FORMATS = (
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%Y%m%d",
+)
+
+
+def parse_client_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Convierte el `createdAt` del cliente a datetime UTC naive; None si no se reconoce."""
+    if not value:
+        return None
+    raw = value.strip()
+    dt = None
+    try:
+        dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        for fmt in _DATETIME_FORMATS:
+            try:
+                dt = datetime.strptime(raw, fmt)
+                break
+            except ValueError:
+                continue
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_working_day(value: Optional[str]) -> Optional[date]:
+    """Convierte el `workingDay` del cliente a date; acepta también un datetime completo."""
+    if not value:
+        return None
+    raw = value.strip()
+    try:
+        return date.fromisoformat(raw[:10])
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except ValueError:
+            continue
+    dt = parse_client_datetime(raw)
+    return dt.date() if dt else None
+
+
+def data_monitoring_row(payload) -> dict:
+    """Fila lista para insertar a partir de un DataMonitoringSchema."""
+    return {
+        "app": payload.app,
+        "cash_register_number": payload.cash_register_number,
+        "user_name": payload.user_name,
+        "flow": payload.flow,
+        "patent": payload.patent,
+        "vehicle_type": payload.vehicle_type,
+        "product": payload.product,
+        "created_at_client": payload.created_at_client,
+        "entity_id": payload.entity_id,
+        "working_day": payload.working_day,
+        "created_at_ts": parse_client_datetime(payload.created_at_client),
+        "working_day_date": parse_working_day(payload.working_day),
+    }
+
+
+def backfill_typed_timestamps(engine: Engine, chunk_size: int = 5000, log=print) -> int:
+    """
+    Rellena created_at_ts / working_day_date en filas antiguas, por bloques de ids
+    para no mantener transacciones largas. Devuelve el número de filas actualizadas.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        with Session(engine) as sess:
+            rows = sess.execute(
+                select(DataMonitoring.id, DataMonitoring.created_at_client, DataMonitoring.working_day)
+                .where(DataMonitoring.id > last_id)
+                .where((DataMonitoring.created_at_ts.is_(None)) | (DataMonitoring.working_day_date.is_(None)))
+                .order_by(DataMonitoring.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            params = [
+                {
+                    "row_id": r.id,
+                    "p_created_at_ts": parse_client_datetime(r.created_at_client),
+                    "p_working_day_date": parse_working_day(r.working_day),
+                }
+                for r in rows
+            ]
+            sess.connection().execute(
+                update(DataMonitoring.__table__)
+                .where(DataMonitoring.__table__.c.id == bindparam("row_id"))
+                .values(created_at_ts=bindparam("p_created_at_ts"), working_day_date=bindparam("p_working_day_date")),
+                params,
+            )
+            sess.commit()
+            updated += len(rows)
+            last_id = rows[-1].id
+            log(f"   … {updated} filas procesadas (id <= {last_id})")
+    return updated
+
+
+# --- Contadores agregados ---
+
+COUNTER_KEY_COLUMNS = ["working_day_date", "hour", "app", "flow", "vehicle_type", "product"]
+COUNTER_DIMENSIONS = ("app", "flow", "vehicle_type", "product")
+
+
+def counter_key(row: dict, fallback: Optional[datetime] = None) -> tuple:
+    """
+    Clave de contador de una fila. Si el cliente no envió fechas reconocibles se usa
+    `fallback` (hora de recepción) para el día y la hora.
+    """
+    ts = row.get("created_at_ts")
+    fallback = fallback or datetime.utcnow()
+    day = row.get("working_day_date") or (ts.date() if ts else fallback.date())
+    hour = ts.hour if ts else fallback.hour
+    return (
+        day,
+        hour,
+        row["app"],
+        row["flow"],
+        row.get("vehicle_type") or "",
+        row.get("product") or "",
+    )
+
+
+def _upsert_counters(sess: Session, counts: Counter):
+    if not counts:
+        return
+    stmt = sqlite_insert(DataMonitoringCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=COUNTER_KEY_COLUMNS,
+        set_={"count": DataMonitoringCounter.count + stmt.excluded["count"]},
+    )
+    sess.execute(stmt, [dict(zip(COUNTER_KEY_COLUMNS, key), count=n) for key, n in counts.items()])
+
+
+def increment_counters(sess: Session, rows: list[dict]):
+    """Suma las filas recién insertadas a los contadores, en la misma transacción. No hace commit."""
+    now = datetime.utcnow()
+    _upsert_counters(sess, Counter(counter_key(r, now) for r in rows))
+
+
+def rebuild_counters(sess: Session, yield_per: int = 5000) -> int:
+    """Recalcula todos los contadores desde la tabla cruda. No hace commit."""
+    sess.execute(delete(DataMonitoringCounter))
+    counts: Counter = Counter()
+    result = sess.execute(
+        select(
+            DataMonitoring.app, DataMonitoring.flow, DataMonitoring.vehicle_type, DataMonitoring.product,
+            DataMonitoring.created_at_ts, DataMonitoring.working_day_date, DataMonitoring.received_at,
+        ).execution_options(yield_per=yield_per)
+    )
+    total = 0
+    for r in result:
+        counts[counter_key(r._asdict(), r.received_at)] += 1
+        total += 1
+    _upsert_counters(sess, counts)
+    return total
+
+
+# --- Búsqueda de texto (FTS5 trigram) ---
+
+FTS_TABLE = "data_monitoring_fts"
+FTS_COLUMNS = ("patent", "user_name", "entity_id")
+
+_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        patent, user_name, entity_id,
+        content='data_monitoring', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON data_monitoring BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, patent, user_name, entity_id)
+        VALUES (new.id, new.patent, new.user_name, new.entity_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON data_monitoring BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, patent, user_name, entity_id)
+        VALUES ('delete', old.id, old.patent, old.user_name, old.entity_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF patent, user_name, entity_id ON data_monitoring BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, patent, user_name, entity_id)
+        VALUES ('delete', old.id, old.patent, old.user_name, old.entity_id);
+        INSERT INTO {FTS_TABLE}(rowid, patent, user_name, entity_id)
+        VALUES (new.id, new.patent, new.user_name, new.entity_id);
+    END""",
+]
+
+
+def ensure_fts(engine: Engine) -> bool:
+    """
+    Crea el índice FTS5 (tokenizer trigram) y los triggers que lo mantienen
+    sincronizado con data_monitoring. Si el índice es nuevo se llena desde la tabla.
+    Devuelve False si SQLite no soporta FTS5/trigram (la búsqueda usa LIKE).
+    """
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": FTS_TABLE},
+            ).first()
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        return True
+    except Exception as e:
+        print(f"Índice FTS de data_monitoring no disponible: {e}")
+        return False
+
+
+def _fts_query(term: str, field: Optional[str]) -> str:
+    phrase = '"' + term.replace('"', '""') + '"'
+    return f"{field} : {phrase}" if field else phrase
+
+
+def search_ids(sess: Session, term: str, field: Optional[str] = None, limit: int = 50, offset: int = 0) -> list[int]:
+    """
+    Ids que coinciden parcialmente con `term` en patente, usuario o entidad,
+    ordenados por relevancia (bm25). Con menos de 3 caracteres, o sin FTS5,
+    se usa LIKE ordenado por id descendente.
+    """
+    term = term.strip()
+    if len(term) >= 3:
+        try:
+            return list(sess.execute(
+                text(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q "
+                    f"ORDER BY bm25({FTS_TABLE}), rowid DESC LIMIT :limit OFFSET :offset"
+                ),
+                {"q": _fts_query(term, field), "limit": limit, "offset": offset},
+            ).scalars())
+        except OperationalError:
+            sess.rollback()
+
+    columns = [getattr(DataMonitoring, field)] if field else [getattr(DataMonitoring, c) for c in FTS_COLUMNS]
+    return list(sess.execute(
+        select(DataMonitoring.id)
+        .where(or_(*(c.contains(term, autoescape=True) for c in columns)))
+        .order_by(DataMonitoring.id.desc())
+        .limit(limit)
+        .offset(offset)
+    ).scalars())
@@ -1,6 +1,15 @@
+import html
 import requests
 import json
 import logging
+import queue
+import smtplib
+import ssl
+import threading
+from email.message import EmailMessage
+from email.utils import formataddr
+from functools import lru_cache
+from string import Template
 from twilio.rest import Client
 from .config import (
     EMAIL_API_KEY,
@@ -9,6 +18,15 @@ from .config import (
     EMAIL_SENDER_NAME,
     EMAIL_RECEIVERS,
     EMAIL_SUBJECT_PREFIX,
+    EMAIL_TRANSPORT,
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_USER,
+    SMTP_PASSWORD,
+    SMTP_FROM_EMAIL,
+    SMTP_TLS,
+    SMTP_POOL_SIZE,
+    SMTP_TIMEOUT,
     TWILIO_ACCOUNT_SID,
     TWILIO_AUTH_TOKEN,
     TWILIO_VERIFY_SERVICE_SID,
@@ -20,46 +38,13 @@ from .config import (
 
 logger = logging.getLogger(__name__)
 
-def send_alert_email(server_id: str, alert_type: str, current_value: float, threshold: float, extra_recipients: list = None, full_metrics: dict = None):
-    """
-    Envía un correo de alerta usando Mailjet API v3.1.
-    """
-    if not EMAIL_API_KEY or not EMAIL_API_SECRET:
-        logger.warning("Credenciales de email no configuradas. No se enviará alerta.")
-        return
+# --- Plantillas de correo de alerta ---
+# Las partes estáticas del HTML se compilan una sola vez al importar el módulo;
+# en cada alerta solo se sustituyen los valores variables.
 
-    subject = f"{EMAIL_SUBJECT_PREFIX} 🚨 {alert_type} en {server_id} ({current_value}%)"
-    text_content = (
-        f"🚨 ALERTA DE MONITOREO 🚨\n\n"
-        f"Servidor: {server_id}\n"
-        f"Problema: {alert_type}\n"
-        f"Valor Actual: {current_value}%\n"
-        f"Umbral Máximo: {threshold}%\n\n"
-        f"Por favor verifique el servidor inmediatamente."
-    )
-    
-    metrics_html = ""
-    if full_metrics:
-        try:
-            mem = full_metrics.get('memory', {})
-            disk = full_metrics.get('disk', {})
-            cpu = full_metrics.get('cpu', {})
-            
-            # Memoria (MB)
-            mem_total = mem.get('total', 0)
-            mem_used = mem.get('used', 0)
-            mem_free = mem.get('free', 0)
-            mem_pct = round((mem_used / mem_total * 100), 1) if mem_total > 0 else 0
-            
-            # Disco (GB)
-            disk_total = disk.get('total', 0)
-            disk_used = disk.get('used', 0)
-            disk_free = disk.get('free', 0)
-            disk_pct = disk.get('percent', 0)
-            
-            cpu_total = cpu.get('total', 0)
-            
-            metrics_html = f"""
+_BADGE_STYLE = "display: inline-block; padding: 4px 10px; border-radius: 20px; background-color: $bg; color: $fg; font-weight: bold; font-size: 13px;"
+
+_METRICS_TABLE_TEMPLATE = Template("""
             <div style="margin-top: 25px;">
                 <h4 style="margin-bottom: 15px; color: #444; font-size: 16px; border-bottom: 2px solid #eee; padding-bottom: 10px;">📊 Estado Actual de Recursos</h4>
                 <table style="width: 100%; border-collapse: collapse; font-family: 'Segoe UI', Arial, sans-serif; font-size: 14px; background-color: #fff; border: 1px solid #e0e0e0; border-radius: 6px; overflow: hidden;">
@@ -74,8 +59,8 @@ def send_alert_email(server_id: str, alert_type: str, current_value: float, thre
                         <tr>
                             <td style="padding: 12px 15px; border-bottom: 1px solid #f0f0f0;"><strong>CPU</strong></td>
                             <td style="padding: 12px 15px; text-align: center; border-bottom: 1px solid #f0f0f0;">
-                                <span style="display: inline-block; padding: 4px 10px; border-radius: 20px; background-color: {'#ffebee' if cpu_total > 80 else '#e8f5e9'}; color: {'#c62828' if cpu_total > 80 else '#2e7d32'}; font-weight: bold; font-size: 13px;">
-                                    {cpu_total}%
+                                <span style="$cpu_badge">
+                                    $cpu_total%
                                 </span>
                             </td>
                             <td style="padding: 12px 15px; color: #666; border-bottom: 1px solid #f0f0f0;">-</td>
@@ -83,52 +68,75 @@ def send_alert_email(server_id: str, alert_type: str, current_value: float, thre
                         <tr>
                             <td style="padding: 12px 15px; border-bottom: 1px solid #f0f0f0;"><strong>Memoria RAM</strong></td>
                             <td style="padding: 12px 15px; text-align: center; border-bottom: 1px solid #f0f0f0;">
-                                <span style="display: inline-block; padding: 4px 10px; border-radius: 20px; background-color: {'#ffebee' if mem_pct > 80 else '#e8f5e9'}; color: {'#c62828' if mem_pct > 80 else '#2e7d32'}; font-weight: bold; font-size: 13px;">
-                                    {mem_pct}%
+                                <span style="$mem_badge">
+                                    $mem_pct%
                                 </span>
                             </td>
                             <td style="padding: 12px 15px; color: #666; border-bottom: 1px solid #f0f0f0;">
-                                {int(mem_used)} MB / {int(mem_total)} MB
-                                <div style="font-size: 12px; color: #999; margin-top: 2px;">Libre: {int(mem_free)} MB</div>
+                                $mem_used MB / $mem_total MB
+                                <div style="font-size: 12px; color: #999; margin-top: 2px;">Libre: $mem_free MB</div>
                             </td>
                         </tr>
                         <tr>
                             <td style="padding: 12px 15px;"><strong>Disco</strong></td>
                             <td style="padding: 12px 15px; text-align: center;">
-                                <span style="display: inline-block; padding: 4px 10px; border-radius: 20px; background-color: {'#ffebee' if disk_pct > 80 else '#e8f5e9'}; color: {'#c62828' if disk_pct > 80 else '#2e7d32'}; font-weight: bold; font-size: 13px;">
-                                    {disk_pct}%
+                                <span style="$disk_badge">
+                                    $disk_pct%
                                 </span>
                             </td>
                             <td style="padding: 12px 15px; color: #666;">
-                                {round(disk_used, 1)} GB / {round(disk_total, 1)} GB
-                                <div style="font-size: 12px; color: #999; margin-top: 2px;">Libre: {round(disk_free, 1)} GB</div>
+                                $disk_used GB / $disk_total GB
+                                <div style="font-size: 12px; color: #999; margin-top: 2px;">Libre: $disk_free GB</div>
                             </td>
                         </tr>
                     </tbody>
                 </table>
             </div>
-            """
-        except Exception as e:
-            logger.error(f"Error generando tabla de métricas: {e}")
+            """)
+
+_PROCESS_ROW_TEMPLATE = Template("""
+                        <tr>
+                            <td style="padding: 8px 15px; border-bottom: 1px solid #f0f0f0;">$name <span style="color: #999;">($pid)</span></td>
+                            <td style="padding: 8px 15px; text-align: center; border-bottom: 1px solid #f0f0f0;">$cpu%</td>
+                            <td style="padding: 8px 15px; text-align: center; border-bottom: 1px solid #f0f0f0;">$rss_mb MB</td>
+                        </tr>""")
+
+_PROCESS_TABLE_TEMPLATE = Template("""
+            <div style="background-color: #f8f9fa; border-radius: 8px; padding: 20px; margin-top: 20px; border: 1px solid #e9ecef;">
+                <h3 style="margin-top: 0; color: #2c3e50; font-size: 18px; border-bottom: 2px solid #e9ecef; padding-bottom: 10px; margin-bottom: 15px;">$title</h3>
+                <table style="width: 100%; border-collapse: collapse; font-size: 14px; background-color: white; border-radius: 6px; overflow: hidden;">
+                    <thead>
+                        <tr style="background-color: #34495e; color: white;">
+                            <th style="padding: 10px 15px; text-align: left;">Proceso</th>
+                            <th style="padding: 10px 15px; text-align: center;">CPU</th>
+                            <th style="padding: 10px 15px; text-align: center;">Memoria</th>
+                        </tr>
+                    </thead>
+                    <tbody>$rows
+                    </tbody>
+                </table>
+            </div>
+            """)
 
-    html_content = f"""
+_ALERT_HTML_TEMPLATE = Template("""
     <div style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; color: #333; max-width: 600px; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 20px rgba(0,0,0,0.05);">
         <div style="background-color: #d32f2f; color: white; padding: 30px 20px; text-align: center;">
-            <h1 style="margin: 0; font-size: 26px; font-weight: 700; letter-spacing: -0.5px;">⚠️ {alert_type}</h1>
-            <p style="margin: 10px 0 0; font-size: 16px; opacity: 0.9; font-weight: 400;">Servidor: <strong style="background-color: rgba(255,255,255,0.2); padding: 2px 8px; border-radius: 4px;">{server_id}</strong></p>
+            <h1 style="margin: 0; font-size: 26px; font-weight: 700; letter-spacing: -0.5px;">⚠️ $alert_type</h1>
+            <p style="margin: 10px 0 0; font-size: 16px; opacity: 0.9; font-weight: 400;">Servidor: <strong style="background-color: rgba(255,255,255,0.2); padding: 2px 8px; border-radius: 4px;">$server_id</strong></p>
         </div>
         
         <div style="padding: 30px; background-color: #ffffff;">
             <div style="text-align: center; margin-bottom: 30px;">
                 <p style="font-size: 16px; color: #555; margin-bottom: 15px;">Se ha detectado que el uso ha superado el umbral seguro.</p>
                 <div style="display: inline-block; padding: 20px 40px; background-color: #fff5f5; border: 2px solid #d32f2f; border-radius: 12px;">
-                    <span style="font-size: 36px; font-weight: 800; color: #d32f2f; display: block; line-height: 1;">{current_value}%</span>
+                    <span style="font-size: 36px; font-weight: 800; color: #d32f2f; display: block; line-height: 1;">$current_value%</span>
                     <span style="display: block; font-size: 12px; color: #d32f2f; text-transform: uppercase; letter-spacing: 1px; margin-top: 8px; font-weight: 600;">Uso Actual</span>
                 </div>
-                <p style="font-size: 14px; color: #888; margin-top: 15px;">Umbral configurado: <strong>{threshold}%</strong></p>
+                <p style="font-size: 14px; color: #888; margin-top: 15px;">Umbral configurado: <strong>$threshold%</strong></p>
             </div>
 
-            {metrics_html}
+            $metrics_html
+            <!--processes-->
 
             <div style="margin-top: 35px; text-align: center; border-top: 1px solid #eee; padding-top: 25px;">
                 <p style="color: #666; font-size: 14px; margin-bottom: 5px;">Por favor, revise el servidor para evitar interrupciones.</p>
@@ -138,25 +146,276 @@ def send_alert_email(server_id: str, alert_type: str, current_value: float, thre
             Enviado automáticamente por <strong>Monitoreo Server</strong>
         </div>
     </div>
+    """)
+
+_ALERT_TEXT_TEMPLATE = Template(
+    "🚨 ALERTA DE MONITOREO 🚨\n\n"
+    "Servidor: $server_id\n"
+    "Problema: $alert_type\n"
+    "Valor Actual: $current_value%\n"
+    "Umbral Máximo: $threshold%\n\n"
+    "Por favor verifique el servidor inmediatamente."
+)
+
+# Estilos de badge precalculados (alerta / normal)
+_BADGE_HIGH = Template(_BADGE_STYLE).substitute(bg="#ffebee", fg="#c62828")
+_BADGE_OK = Template(_BADGE_STYLE).substitute(bg="#e8f5e9", fg="#2e7d32")
+
+# Tamaño de la caché de cuerpos renderizados (digests y reintentos reutilizan el mismo mensaje)
+ALERT_RENDER_CACHE_SIZE = 256
+
+
+def _badge(pct: float) -> str:
+    return _BADGE_HIGH if pct > 80 else _BADGE_OK
+
+
+def _value_bucket(value) -> float:
+    """Agrupa valores cercanos (0.1%) para que compartan el mismo cuerpo renderizado."""
+    try:
+        return round(float(value), 1)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _metrics_summary(full_metrics: dict | None) -> tuple | None:
+    """Reduce las métricas completas a una tupla hashable con los valores que muestra la tabla."""
+    if not full_metrics:
+        return None
+    mem = full_metrics.get('memory', {}) or {}
+    disk = full_metrics.get('disk', {}) or {}
+    cpu = full_metrics.get('cpu', {}) or {}
+
+    # Memoria (MB)
+    mem_total = mem.get('total', 0)
+    mem_used = mem.get('used', 0)
+    mem_free = mem.get('free', 0)
+    mem_pct = round((mem_used / mem_total * 100), 1) if mem_total > 0 else 0
+
+    # Disco (GB)
+    disk_total = disk.get('total', 0)
+    disk_used = disk.get('used', 0)
+    disk_free = disk.get('free', 0)
+    disk_pct = disk.get('percent', 0)
+
+    cpu_total = cpu.get('total', 0)
+
+    return (
+        _value_bucket(cpu_total),
+        mem_pct, int(mem_used), int(mem_total), int(mem_free),
+        _value_bucket(disk_pct), round(disk_used, 1), round(disk_total, 1), round(disk_free, 1),
+    )
+
+
+def _process_summary(full_metrics: dict | None) -> tuple | None:
+    """Top de procesos del payload como tupla hashable: ((título, ((nombre, pid, cpu, rss_mb), ...)), ...)."""
+    processes = (full_metrics or {}).get('processes') or {}
+    sections = []
+    for key, title in (('by_cpu', 'Procesos con más CPU'), ('by_mem', 'Procesos con más memoria')):
+        rows = tuple(
+            (str(p.get('name', '?')), int(p.get('pid', 0)), _value_bucket(p.get('cpu')), round(float(p.get('rss_mb') or 0), 1))
+            for p in processes.get(key) or []
+        )
+        if rows:
+            sections.append((title, rows))
+    return tuple(sections) or None
+
+
+def _render_process_tables(processes: tuple) -> str:
+    return "".join(
+        _PROCESS_TABLE_TEMPLATE.substitute(
+            title=title,
+            rows="".join(
+                _PROCESS_ROW_TEMPLATE.substitute(name=html.escape(name), pid=pid, cpu=cpu, rss_mb=rss_mb)
+                for name, pid, cpu, rss_mb in rows
+            ),
+        )
+        for title, rows in processes
+    )
+
+
+def _process_text(processes: tuple) -> str:
+    lines = []
+    for title, rows in processes:
+        lines.append(f"\n\n{title}:")
+        lines.extend(f"  - {name} ({pid}): CPU {cpu}%, {rss_mb} MB" for name, pid, cpu, rss_mb in rows)
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=ALERT_RENDER_CACHE_SIZE)
+def _render_metrics_table(summary: tuple) -> str:
+    cpu_total, mem_pct, mem_used, mem_total, mem_free, disk_pct, disk_used, disk_total, disk_free = summary
+    return _METRICS_TABLE_TEMPLATE.substitute(
+        cpu_badge=_badge(cpu_total), cpu_total=cpu_total,
+        mem_badge=_badge(mem_pct), mem_pct=mem_pct,
+        mem_used=mem_used, mem_total=mem_total, mem_free=mem_free,
+        disk_badge=_badge(disk_pct), disk_pct=disk_pct,
+        disk_used=disk_used, disk_total=disk_total, disk_free=disk_free,
+    )
+
+
+@lru_cache(maxsize=ALERT_RENDER_CACHE_SIZE)
+def render_alert_email(server_id: str, alert_type: str, value_bucket: float, threshold: float, summary: tuple | None = None):
+    """
+    Renderiza (subject, texto, html) de una alerta.
+    El resultado se cachea por (servidor, alerta, bucket de valor, umbral, resumen de métricas).
     """
+    subject = f"{EMAIL_SUBJECT_PREFIX} 🚨 {alert_type} en {server_id} ({value_bucket}%)"
+    values = {
+        "server_id": server_id,
+        "alert_type": alert_type,
+        "current_value": value_bucket,
+        "threshold": threshold,
+    }
+    text_content = _ALERT_TEXT_TEMPLATE.substitute(values)
 
-    to_recipients = []
+    metrics_html = ""
+    if summary:
+        try:
+            metrics_html = _render_metrics_table(summary)
+        except Exception as e:
+            logger.error(f"Error generando tabla de métricas: {e}")
 
-    for receiver in EMAIL_RECEIVERS:
-        r = receiver.strip()
-        if r:
-            to_recipients.append({"Email": r, "Name": "Admin"})
+    html_content = _ALERT_HTML_TEMPLATE.substitute(values, metrics_html=metrics_html)
+    return subject, text_content, html_content
 
-    # Eliminar duplicados
-    unique = {}
-    for r in to_recipients:
-        unique[r['Email']] = r
-    to_recipients = list(unique.values())
 
-    if not to_recipients:
-        logger.warning("No hay destinatarios de correo configurados.")
-        return
+def add_process_tables(rendered: tuple, processes: tuple | None) -> tuple:
+    """
+    Agrega el top de procesos a un correo ya renderizado. Va fuera de la caché:
+    pid y consumo cambian en cada alerta y la harían fallar casi siempre.
+    """
+    subject, text_content, html_content = rendered
+    if not processes:
+        return rendered
+    html_content = html_content.replace("<!--processes-->", _render_process_tables(processes), 1)
+    return subject, text_content + _process_text(processes), html_content
+
+
+# --- Transporte SMTP con pool de conexiones ---
+
+class SMTPConnectionPool:
+    """
+    Pool de conexiones SMTP autenticadas y persistentes.
+    Cada conexión se reutiliza para varios mensajes; si el servidor la cerró
+    (timeout del relay, reinicio) se descarta, se reconecta y se reintenta una vez.
+    """
+
+    def __init__(self, host: str, port: int, user: str = "", password: str = "",
+                 use_tls: bool = True, size: int = 2, timeout: int = 10):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.port == 465:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            conn.ehlo()
+            if self.use_tls:
+                conn.starttls(context=ssl.create_default_context())
+                conn.ehlo()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    @staticmethod
+    def _discard(conn: smtplib.SMTP | None):
+        if conn is None:
+            return
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_stale(exc: Exception) -> bool:
+        if isinstance(exc, smtplib.SMTPResponseException):
+            return exc.smtp_code == 421  # el relay cierra la sesión
+        return isinstance(exc, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError))
+
+    def _acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
 
+    def send(self, msg: EmailMessage):
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._acquire()
+            try:
+                conn.send_message(msg)
+            except Exception as e:
+                if not self._is_stale(e):
+                    raise
+                # Conexión caducada: reconectar y reintentar una sola vez
+                self._discard(conn)
+                conn = None
+                conn = self._connect()
+                conn.send_message(msg)
+            self._idle.put(conn)
+            conn = None
+        finally:
+            self._discard(conn)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_smtp_pool: SMTPConnectionPool | None = None
+_smtp_pool_lock = threading.Lock()
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    global _smtp_pool
+    with _smtp_pool_lock:
+        if _smtp_pool is None:
+            _smtp_pool = SMTPConnectionPool(
+                SMTP_SERVER,
+                SMTP_PORT,
+                user=SMTP_USER,
+                password=SMTP_PASSWORD,
+                use_tls=SMTP_TLS,
+                size=SMTP_POOL_SIZE,
+                timeout=SMTP_TIMEOUT,
+            )
+        return _smtp_pool
+
+
+def _email_configured() -> bool:
+    if EMAIL_TRANSPORT == "smtp":
+        return bool(SMTP_SERVER)
+    return bool(EMAIL_API_KEY and EMAIL_API_SECRET)
+
+
+def _send_via_smtp(to_recipients: list, subject: str, text_content: str, html_content: str, custom_id: str):
+    msg = EmailMessage()
+    msg["From"] = formataddr((EMAIL_SENDER_NAME, SMTP_FROM_EMAIL or EMAIL_SENDER_EMAIL))
+    msg["To"] = ", ".join(formataddr((r.get("Name", ""), r["Email"])) for r in to_recipients)
+    msg["Subject"] = subject
+    msg["X-Custom-ID"] = custom_id
+    msg.set_content(text_content)
+    msg.add_alternative(html_content, subtype="html")
+    get_smtp_pool().send(msg)
+
+
+def _send_via_mailjet(to_recipients: list, subject: str, text_content: str, html_content: str, custom_id: str) -> bool:
     # Estructura para Mailjet Send API v3.1
     payload = {
         "Messages": [
@@ -169,27 +428,73 @@ def send_alert_email(server_id: str, alert_type: str, current_value: float, thre
                 "Subject": subject,
                 "TextPart": text_content,
                 "HTMLPart": html_content,
-                "CustomID": f"AppAlert-{server_id}"
+                "CustomID": custom_id
             }
         ]
     }
-    
+
     url = "https://api.mailjet.com/v3.1/send"
-    
+
+    response = requests.post(
+        url,
+        auth=(EMAIL_API_KEY, EMAIL_API_SECRET),
+        headers={"Content-Type": "application/json"},
+        data=json.dumps(payload),
+        timeout=10
+    )
+
+    if response.status_code in [200, 201]:
+        return True
+    logger.error(f"Error enviando email: {response.status_code} - {response.text}")
+    return False
+
+
+def send_alert_email(server_id: str, alert_type: str, current_value: float, threshold: float, extra_recipients: list = None, full_metrics: dict = None):
+    """
+    Envía un correo de alerta usando Mailjet API v3.1 o el relay SMTP (EMAIL_TRANSPORT).
+    """
+    if not _email_configured():
+        logger.warning("Credenciales de email no configuradas. No se enviará alerta.")
+        return
+
+    summary = None
+    processes = None
     try:
-        response = requests.post(
-            url,
-            auth=(EMAIL_API_KEY, EMAIL_API_SECRET),
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload),
-            timeout=10
-        )
-        
-        if response.status_code in [200, 201]:
-            logger.info(f"Email de alerta enviado para {server_id} ({alert_type})")
+        summary = _metrics_summary(full_metrics)
+        processes = _process_summary(full_metrics)
+    except Exception as e:
+        logger.error(f"Error generando tabla de métricas: {e}")
+
+    subject, text_content, html_content = add_process_tables(
+        render_alert_email(server_id, alert_type, _value_bucket(current_value), threshold, summary),
+        processes,
+    )
+
+    to_recipients = []
+
+    for receiver in EMAIL_RECEIVERS:
+        r = receiver.strip()
+        if r:
+            to_recipients.append({"Email": r, "Name": "Admin"})
+
+    # Eliminar duplicados
+    unique = {}
+    for r in to_recipients:
+        unique[r['Email']] = r
+    to_recipients = list(unique.values())
+
+    if not to_recipients:
+        logger.warning("No hay destinatarios de correo configurados.")
+        return
+
+    try:
+        if EMAIL_TRANSPORT == "smtp":
+            _send_via_smtp(to_recipients, subject, text_content, html_content, f"AppAlert-{server_id}")
+            sent = True
         else:
-            logger.error(f"Error enviando email: {response.status_code} - {response.text}")
-            
+            sent = _send_via_mailjet(to_recipients, subject, text_content, html_content, f"AppAlert-{server_id}")
+        if sent:
+            logger.info(f"Email de alerta enviado para {server_id} ({alert_type})")
     except Exception as e:
         logger.error(f"Excepción al enviar email: {e}")
 
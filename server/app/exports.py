@@ -0,0 +1,189 @@
+"""
+Columnas y escritura de exportaciones de metrics y data_monitoring.
+
+La exportación Parquet usa pyarrow, que es una dependencia opcional: si no está
+instalada, PARQUET_AVAILABLE es False y los endpoints responden 501.
+"""
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .config import EXPORT_YIELD_PER, EXPORT_PARQUET_COMPRESSION
+from .models import Metric, DataMonitoring
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+    pq = None
+    PARQUET_AVAILABLE = False
+
+
+_SUMMARY_STAT_COLUMNS = [
+    getattr(Metric, f"{prefix}_{stat}")
+    for prefix in ("cpu", "mem_percent", "disk_percent")
+    for stat in ("min", "max", "avg", "p95")
+]
+
+
+_IO_COLUMNS = [
+    Metric.net_rx_bps, Metric.net_tx_bps, Metric.net_rx_pps, Metric.net_tx_pps,
+    Metric.net_errors, Metric.net_drops,
+    Metric.disk_read_bps, Metric.disk_write_bps, Metric.disk_read_iops, Metric.disk_write_iops,
+]
+
+
+def _metrics_schema():
+    container = pa.struct([
+        ("name", pa.string()),
+        ("cpu", pa.float64()),
+        ("mem", pa.float64()),
+        ("state", pa.string()),
+        ("restart_count", pa.int32()),
+    ])
+    return pa.schema([
+        ("id", pa.int64()),
+        ("server_id", pa.string()),
+        ("ts", pa.timestamp("us")),
+        ("mem_total", pa.float64()),
+        ("mem_used", pa.float64()),
+        ("mem_free", pa.float64()),
+        ("mem_cache", pa.float64()),
+        ("cpu_total", pa.float64()),
+        ("cpu_per_core", pa.list_(pa.float64())),
+        ("disk_total", pa.float64()),
+        ("disk_used", pa.float64()),
+        ("disk_free", pa.float64()),
+        ("disk_percent", pa.float64()),
+        ("docker_running", pa.int32()),
+        ("docker_containers", pa.list_(container)),
+        ("summary_samples", pa.int32()),
+        ("summary_window", pa.float64()),
+        *((c.key, pa.float64()) for c in _SUMMARY_STAT_COLUMNS),
+        *((c.key, pa.int64() if c.key in ("net_errors", "net_drops") else pa.float64()) for c in _IO_COLUMNS),
+    ])
+
+
+def _data_monitoring_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("app", pa.string()),
+        ("cash_register_number", pa.int32()),
+        ("user_name", pa.string()),
+        ("flow", pa.string()),
+        ("patent", pa.string()),
+        ("vehicle_type", pa.string()),
+        ("product", pa.string()),
+        ("created_at_client", pa.string()),
+        ("entity_id", pa.string()),
+        ("working_day", pa.string()),
+        ("received_at", pa.timestamp("us")),
+    ])
+
+
+def _json_list(raw: Optional[str]) -> list:
+    try:
+        value = json.loads(raw or "[]")
+        return value if isinstance(value, list) else []
+    except (TypeError, ValueError):
+        return []
+
+
+def _containers(raw: Optional[str]) -> list[dict]:
+    out = []
+    for c in _json_list(raw):
+        if isinstance(c, dict):
+            out.append({
+                "name": c.get("name"), "cpu": c.get("cpu"), "mem": c.get("mem"),
+                "state": c.get("state"), "restart_count": c.get("restart_count"),
+            })
+        elif isinstance(c, str):
+            out.append({"name": c, "cpu": None, "mem": None, "state": None, "restart_count": None})
+    return out
+
+
+METRIC_COLUMNS = [
+    Metric.id, Metric.server_id, Metric.ts,
+    Metric.mem_total, Metric.mem_used, Metric.mem_free, Metric.mem_cache,
+    Metric.cpu_total, Metric.cpu_per_core,
+    Metric.disk_total, Metric.disk_used, Metric.disk_free, Metric.disk_percent,
+    Metric.docker_running, Metric.docker_containers,
+    Metric.summary_samples, Metric.summary_window, *_SUMMARY_STAT_COLUMNS,
+    *_IO_COLUMNS,
+]
+
+DATA_MONITORING_COLUMNS = [
+    DataMonitoring.id, DataMonitoring.app, DataMonitoring.cash_register_number, DataMonitoring.user_name,
+    DataMonitoring.flow, DataMonitoring.patent, DataMonitoring.vehicle_type, DataMonitoring.product,
+    DataMonitoring.created_at_client, DataMonitoring.entity_id, DataMonitoring.working_day, DataMonitoring.received_at,
+]
+
+
+def metrics_query(server_id: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    q = select(*METRIC_COLUMNS).order_by(Metric.id.asc())
+    if server_id:
+        q = q.where(Metric.server_id == server_id)
+    if start is not None:
+        q = q.where(Metric.ts >= start)
+    if end is not None:
+        q = q.where(Metric.ts < end)
+    return q
+
+
+def data_monitoring_query(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    q = select(*DATA_MONITORING_COLUMNS).order_by(DataMonitoring.id.asc())
+    if start is not None:
+        q = q.where(DataMonitoring.received_at >= start)
+    if end is not None:
+        q = q.where(DataMonitoring.received_at < end)
+    return q
+
+
+def _record_batches(sess: Session, query, schema, convert) -> Iterator:
+    result = sess.execute(query.execution_options(yield_per=EXPORT_YIELD_PER))
+    names = schema.names
+    for rows in result.partitions():
+        columns = {name: [] for name in names}
+        for row in rows:
+            for name, value in zip(names, convert(row)):
+                columns[name].append(value)
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def _metric_values(row):
+    values = list(row)
+    values[8] = [float(v) for v in _json_list(row.cpu_per_core)]
+    values[14] = _containers(row.docker_containers)
+    return values
+
+
+def iter_metric_batches(sess: Session, **filters) -> Iterator:
+    return _record_batches(sess, metrics_query(**filters), _metrics_schema(), _metric_values)
+
+
+def iter_data_monitoring_batches(sess: Session, **filters) -> Iterator:
+    return _record_batches(sess, data_monitoring_query(**filters), _data_monitoring_schema(), tuple)
+
+
+def write_parquet(batches: Iterator, schema, sink) -> int:
+    """Escribe los record batches en `sink` (ruta o archivo). Devuelve el número de filas."""
+    total = 0
+    with pq.ParquetWriter(sink, schema, compression=EXPORT_PARQUET_COMPRESSION) as writer:
+        for batch in batches:
+            if batch.num_rows:
+                writer.write_batch(batch)
+                total += batch.num_rows
+    return total
+
+
+def export_metrics_parquet(sess: Session, sink, **filters) -> int:
+    return write_parquet(iter_metric_batches(sess, **filters), _metrics_schema(), sink)
+
+
+def export_data_monitoring_parquet(sess: Session, sink, **filters) -> int:
+    return write_parquet(iter_data_monitoring_batches(sess, **filters), _data_monitoring_schema(), sink)
@@ -1,25 +1,36 @@
 import json
 from pathlib import Path
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, date, timezone
 import os
 import uuid
 import unicodedata
 import io
 import csv
-
-from fastapi import FastAPI, HTTPException, Header, Depends, status, Request, Response
-from fastapi.responses import HTMLResponse, StreamingResponse
+import tempfile
+import math
+import random
+import zlib
+from contextlib import contextmanager
+
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from sqlalchemy import create_engine, select, delete, text
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, select, delete, insert, text, func, tuple_, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, aliased
 from passlib.context import CryptContext
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
+from starlette.background import BackgroundTask
 
 from .config import (
     DB_PATH,
@@ -31,10 +42,30 @@ from .config import (
     JWT_SECRET_KEY,
     JWT_ALGORITHM,
     JWT_EXPIRE_MINUTES,
+    TWILIO_WHATSAPP_MPS,
+    TWILIO_WHATSAPP_BURST,
+    WHATSAPP_WORKERS,
+    WHATSAPP_MAX_PENDING_PER_PHONE,
+    FLEET_STATUS_TTL,
+    DATA_MONITORING_MAX_BATCH,
+    DATA_MONITORING_INSERT_CHUNK,
+    DATA_MONITORING_MAX_PAGE,
+    EXPORT_YIELD_PER,
+    EXPORT_CHUNK_BYTES,
+    METRICS_MAX_BATCH,
+    REPLAY_ALERT_MAX_AGE,
+    MOUNT_STATE_MAX_AGE,
+    PROCESS_SNAPSHOT_MARGIN,
+    INGEST_RETRY_AFTER,
+    INGEST_SERVER_RATE,
+    INGEST_SERVER_BURST,
+    INGEST_MAX_INFLIGHT,
+    INGEST_MAX_LATENCY,
+    INGEST_SHED_SECONDS,
 )
-from .models import Base, Server, Metric, AlertConfig, User, UserSession, AlertRecipient, AlertRule, ServerThreshold, AuditLog, UserServerLink, DataMonitoring, DataMonitoringServerConfig, DataMonitoringUserConfig, WhatsAppSession
+from .models import Base, Server, Metric, AlertConfig, User, UserSession, AlertRecipient, AlertRule, ServerThreshold, AuditLog, UserServerLink, DataMonitoring, DataMonitoringServerConfig, DataMonitoringUserConfig, WhatsAppSession, DataMonitoringCounter, MetricDisk
 from .schemas import (
-    MetricsIngestSchema, RegisterServerSchema, AlertConfigSchema, LoginSchema,
+    MetricsIngestSchema, MetricsBatchSchema, DiskMountSchema, RegisterServerSchema, AlertConfigSchema, LoginSchema,
     UserCreateSchema, UserResponseSchema, ChangePasswordSchema,
     ServerConfigUpdateSchema, AlertRecipientSchema, AlertRecipientCreateSchema,
     ServerAssignmentSchema, AlertRuleCreate, AlertRuleResponse, ServerUpdateGroupSchema,
@@ -43,6 +74,16 @@ from .schemas import (
     UserUpdateSchema, UserServerAssignmentResponse, DataMonitoringSchema, DataMonitoringResponseSchema
 )
 from .email_utils import send_alert_email, send_offline_sms_alert, send_whatsapp_twilio_alert, send_whatsapp_text
+from .workers import KeyedSerialExecutor, RateLimitedSender, KeyedTokenBuckets, AdmissionController
+from .data_monitoring import (
+    data_monitoring_row, increment_counters, rebuild_counters, ensure_fts, search_ids,
+    COUNTER_DIMENSIONS, FTS_COLUMNS,
+)
+from .wire import WireDecodeMiddleware, WireError, decode_model, bases as wire_bases
+from .exports import (
+    METRIC_COLUMNS, DATA_MONITORING_COLUMNS, PARQUET_AVAILABLE, metrics_query,
+    export_metrics_parquet, export_data_monitoring_parquet,
+)
 import time
 import asyncio
 import jwt
@@ -101,6 +142,9 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# Descompresión y muestras en delta del agente (formato compacto)
+app.add_middleware(WireDecodeMiddleware)
+
 def ensure_default_alerts(sess: Session):
     # Usamos scalars().first() para evitar error si hay múltiples (aunque no debería)
     cfg = sess.execute(select(AlertConfig)).scalars().first()
@@ -197,11 +241,78 @@ def ensure_admin_assignments():
             print(f"Error en ensure_admin_assignments: {e}")
             sess.rollback()
 
+def _ensure_columns(table: str, columns: tuple):
+    """Agrega a `table` las columnas (nombre, tipo DDL) que falten en bases existentes."""
+    with Session(engine) as sess:
+        for column, ddl in columns:
+            try:
+                sess.execute(text(f"SELECT {column} FROM {table} LIMIT 1"))
+            except Exception:
+                sess.rollback()
+                print(f"Agregando columna {column} a {table}...")
+                try:
+                    sess.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                    sess.commit()
+                except Exception as e:
+                    print(f"Error migrando {column}: {e}")
+                    sess.rollback()
+
+def ensure_data_monitoring_columns():
+    """Migración manual: columnas tipadas de fecha en data_monitoring."""
+    _ensure_columns("data_monitoring", (
+        ("created_at_ts", "DATETIME"),
+        ("working_day_date", "DATE"),
+        ("idempotent", "BOOLEAN"),
+    ))
+
+def ensure_metrics_columns():
+    """Migración manual: columnas de resumen por intervalo y de throughput en metrics."""
+    _ensure_columns("metrics", (
+        ("summary_samples", "INTEGER"),
+        ("summary_window", "FLOAT"),
+        *((f"{prefix}_{stat}", "FLOAT")
+          for prefix in ("cpu", "mem_percent", "disk_percent")
+          for stat in ("min", "max", "avg", "p95")),
+        ("net_rx_bps", "FLOAT"),
+        ("net_tx_bps", "FLOAT"),
+        ("net_rx_pps", "FLOAT"),
+        ("net_tx_pps", "FLOAT"),
+        ("net_errors", "INTEGER"),
+        ("net_drops", "INTEGER"),
+        ("disk_read_bps", "FLOAT"),
+        ("disk_write_bps", "FLOAT"),
+        ("disk_read_iops", "FLOAT"),
+        ("disk_write_iops", "FLOAT"),
+        ("top_processes", "TEXT"),
+    ))
+
+def ensure_threshold_columns():
+    """Migración manual: umbrales de disco por montaje."""
+    _ensure_columns("server_thresholds", (("disk_mount_thresholds", "TEXT"),))
+    _ensure_columns("metric_disks", (("complete", "BOOLEAN"),))
+
+def ensure_indexes():
+    """Crea los índices de data_monitoring y metrics en bases existentes (create_all no los agrega)."""
+    with Session(engine) as sess:
+        try:
+            for model in (DataMonitoring, Metric, MetricDisk):
+                for idx in model.__table__.indexes:
+                    idx.create(sess.connection(), checkfirst=True)
+            sess.commit()
+        except Exception as e:
+            print(f"Error creando índices: {e}")
+            sess.rollback()
+
 @app.on_event("startup")
 def startup():
     try:
         ensure_recipient_type_column()
         ensure_link_column()
+        ensure_data_monitoring_columns()
+        ensure_metrics_columns()
+        ensure_threshold_columns()
+        ensure_indexes()
+        ensure_fts(engine)
         ensure_admin_assignments()
         with Session(engine) as sess:
             ensure_default_alerts(sess)
@@ -209,6 +320,30 @@ def startup():
         print(f"Advertencia en startup: {e}")
 
 
+# Comandos de WhatsApp: se procesan fuera del request, en orden por teléfono.
+_whatsapp_commands = KeyedSerialExecutor(
+    max_workers=WHATSAPP_WORKERS,
+    max_pending_per_key=WHATSAPP_MAX_PENDING_PER_PHONE,
+    name="whatsapp-cmd",
+)
+# Respuestas salientes limitadas al throughput de mensajería de Twilio.
+_whatsapp_outbox = RateLimitedSender(
+    send_whatsapp_text,
+    rate_per_sec=TWILIO_WHATSAPP_MPS,
+    burst=TWILIO_WHATSAPP_BURST,
+    name="whatsapp-out",
+)
+
+
+def _reply_whatsapp(phone: str, body: str):
+    _whatsapp_outbox.send(phone, body)
+
+
+def _process_whatsapp_command(phone: str, text: str):
+    with Session(engine) as sess:
+        _handle_whatsapp_command(sess, phone, text)
+
+
 @app.post("/api/whatsapp/webhook")
 async def whatsapp_webhook(request: Request):
     form = await request.form()
@@ -218,8 +353,8 @@ async def whatsapp_webhook(request: Request):
     text = (body or "").strip()
     if not phone or not text:
         return {"status": "ok"}
-    with Session(engine) as sess:
-        _handle_whatsapp_command(sess, phone, text)
+    # Responder a Twilio de inmediato; bcrypt, consultas y envíos van al worker
+    _whatsapp_commands.submit(phone, _process_whatsapp_command, phone, text)
     return {"status": "ok"}
 
 # Caché en memoria de métricas recientes por servidor
@@ -233,6 +368,9 @@ _threshold_cache: dict[str, dict] = {}
 _alert_state: dict[tuple[str, str], float] = {}
 ALERT_COOLDOWN = 3600
 
+# Caché de estado de flota por usuario: user_id -> (timestamp, filas)
+_fleet_cache: dict[int, tuple[float, list[dict]]] = {}
+
 
 def create_jwt_for_user(user_id: int) -> str:
     expire = datetime.utcnow() + timedelta(minutes=JWT_EXPIRE_MINUTES)
@@ -265,10 +403,75 @@ def _get_or_create_whatsapp_session(sess: Session, phone: str) -> WhatsAppSessio
     return wa
 
 
+def get_user_fleet_status(sess: Session, user_id: int, use_cache: bool = True) -> list[dict]:
+    """
+    Servidores asignados al usuario junto con su última muestra, en una sola consulta
+    (subconsulta correlacionada sobre el índice (server_id, ts); las muestras reenviadas
+    desde el spool del agente llegan con id mayor pero ts antiguo).
+    Se cachea por usuario durante FLEET_STATUS_TTL segundos.
+    """
+    now = time.time()
+    cached = _fleet_cache.get(user_id)
+    if use_cache and cached and now - cached[0] < FLEET_STATUS_TTL:
+        return cached[1]
+
+    latest_id = (
+        select(Metric.id)
+        .where(Metric.server_id == Server.server_id)
+        .order_by(Metric.ts.desc(), Metric.id.desc())
+        .limit(1)
+        .correlate(Server)
+        .scalar_subquery()
+    )
+    rows = sess.execute(
+        select(
+            Server.server_id,
+            Metric.ts,
+            Metric.cpu_total,
+            Metric.mem_used,
+            Metric.mem_total,
+            Metric.disk_percent,
+        )
+        .join(UserServerLink, Server.id == UserServerLink.server_id)
+        .outerjoin(Metric, Metric.id == latest_id)
+        .where(UserServerLink.user_id == user_id)
+        .order_by(Server.id)
+    ).all()
+
+    fleet = [
+        {
+            "server_id": r.server_id,
+            "ts": r.ts,
+            "cpu_total": r.cpu_total,
+            "mem_used": r.mem_used,
+            "mem_total": r.mem_total,
+            "disk_percent": r.disk_percent,
+            "has_data": r.ts is not None,
+        }
+        for r in rows
+    ]
+    _fleet_cache[user_id] = (now, fleet)
+    return fleet
+
+
+def invalidate_fleet_cache(user_id: Optional[int] = None):
+    if user_id is None:
+        _fleet_cache.clear()
+    else:
+        _fleet_cache.pop(user_id, None)
+
+
+def _fleet_list_message(fleet: list[dict]) -> str:
+    lines = ["Servidores disponibles:"]
+    for idx, srv in enumerate(fleet, start=1):
+        lines.append(f"{idx} - {srv['server_id']}")
+    return "\n".join(lines)
+
+
 def _handle_whatsapp_command(sess: Session, phone: str, text: str):
     normalized = text.strip().lower()
     if normalized in ("help", "ayuda", "h"):
-        send_whatsapp_text(
+        _reply_whatsapp(
             phone,
             (
                 "Bienvenido al monitor de servidores.\n\n"
@@ -291,7 +494,7 @@ def _handle_whatsapp_command(sess: Session, phone: str, text: str):
             .first()
         )
         if not user or not verify_password(password, user.password_hash):
-            send_whatsapp_text(phone, "Credenciales inválidas. Intente nuevamente.")
+            _reply_whatsapp(phone, "Credenciales inválidas. Intente nuevamente.")
             return
 
         wa = _get_or_create_whatsapp_session(sess, phone)
@@ -299,142 +502,91 @@ def _handle_whatsapp_command(sess: Session, phone: str, text: str):
         wa.jwt_token = create_jwt_for_user(user.id)
         sess.commit()
 
-        assigned_servers = (
-            sess.execute(
-                select(Server)
-                .join(UserServerLink, Server.id == UserServerLink.server_id)
-                .where(UserServerLink.user_id == user.id)
-            )
-            .scalars()
-            .all()
-        )
-        if not assigned_servers:
-            send_whatsapp_text(phone, "No tienes servidores asignados.")
+        # Tras un login se parte de datos frescos
+        fleet = get_user_fleet_status(sess, user.id, use_cache=False)
+        if not fleet:
+            _reply_whatsapp(phone, "No tienes servidores asignados.")
             return
 
-        lines = ["Servidores disponibles:"]
-        for idx, srv in enumerate(assigned_servers, start=1):
-            lines.append(f"{idx} - {srv.server_id}")
-        send_whatsapp_text(phone, "\n".join(lines))
+        _reply_whatsapp(phone, _fleet_list_message(fleet))
         return
 
     if normalized == "list":
         wa = _get_or_create_whatsapp_session(sess, phone)
         if not wa.user_id:
-            send_whatsapp_text(phone, "Primero ejecuta: LOGIN correo password")
+            _reply_whatsapp(phone, "Primero ejecuta: LOGIN correo password")
             return
-        user = sess.get(User, wa.user_id)
-        assigned_servers = (
-            sess.execute(
-                select(Server)
-                .join(UserServerLink, Server.id == UserServerLink.server_id)
-                .where(UserServerLink.user_id == user.id)
-            )
-            .scalars()
-            .all()
-        )
-        if not assigned_servers:
-            send_whatsapp_text(phone, "No tienes servidores asignados.")
+        fleet = get_user_fleet_status(sess, wa.user_id)
+        if not fleet:
+            _reply_whatsapp(phone, "No tienes servidores asignados.")
             return
-        lines = ["Servidores disponibles:"]
-        for idx, srv in enumerate(assigned_servers, start=1):
-            lines.append(f"{idx} - {srv.server_id}")
-        send_whatsapp_text(phone, "\n".join(lines))
+        _reply_whatsapp(phone, _fleet_list_message(fleet))
         return
 
     if normalized.startswith("status "):
         wa = _get_or_create_whatsapp_session(sess, phone)
         if not wa.user_id:
-            send_whatsapp_text(phone, "Primero ejecuta: LOGIN correo password")
+            _reply_whatsapp(phone, "Primero ejecuta: LOGIN correo password")
             return
         arg = normalized.split(" ", 1)[1].strip()
-        user = sess.get(User, wa.user_id)
-        assigned_servers = (
-            sess.execute(
-                select(Server)
-                .join(UserServerLink, Server.id == UserServerLink.server_id)
-                .where(UserServerLink.user_id == user.id)
-            )
-            .scalars()
-            .all()
-        )
-        if not assigned_servers:
-            send_whatsapp_text(phone, "No tienes servidores asignados.")
+        fleet = get_user_fleet_status(sess, wa.user_id)
+        if not fleet:
+            _reply_whatsapp(phone, "No tienes servidores asignados.")
             return
 
         if arg in ("all", "todos"):
             lines = []
-            for srv in assigned_servers:
-                last_metric = (
-                    sess.execute(
-                        select(Metric)
-                        .where(Metric.server_id == srv.server_id)
-                        .order_by(Metric.ts.desc())
-                        .limit(1)
-                    )
-                    .scalars()
-                    .first()
-                )
-                if not last_metric:
+            for srv in fleet:
+                if not srv["has_data"]:
                     status_icon = "❌"
                     cpu = "-"
                     mem = "-"
                     disk = "-"
                 else:
                     status_icon = "✅"
-                    cpu = f"{last_metric.cpu_total:.1f}%"
-                    mem = f"{(last_metric.mem_used / max(last_metric.mem_total, 1) * 100):.1f}%"
-                    disk = f"{last_metric.disk_percent:.1f}%"
+                    cpu = f"{srv['cpu_total']:.1f}%"
+                    mem = f"{(srv['mem_used'] / max(srv['mem_total'], 1) * 100):.1f}%"
+                    disk = f"{srv['disk_percent']:.1f}%"
                 lines.append(
-                    f"{status_icon} {srv.server_id} | CPU {cpu} | MEM {mem} | DISK {disk}"
+                    f"{status_icon} {srv['server_id']} | CPU {cpu} | MEM {mem} | DISK {disk}"
                 )
-            send_whatsapp_text(phone, "\n".join(lines) or "Sin datos.")
+            _reply_whatsapp(phone, "\n".join(lines) or "Sin datos.")
             return
 
         try:
             idx = int(arg)
         except ValueError:
-            send_whatsapp_text(phone, "Uso: STATUS n  o  STATUS ALL")
+            _reply_whatsapp(phone, "Uso: STATUS n  o  STATUS ALL")
             return
 
-        if idx < 1 or idx > len(assigned_servers):
-            send_whatsapp_text(phone, "Número de servidor inválido.")
+        if idx < 1 or idx > len(fleet):
+            _reply_whatsapp(phone, "Número de servidor inválido.")
             return
 
-        srv = assigned_servers[idx - 1]
-        last_metric = (
-            sess.execute(
-                select(Metric)
-                .where(Metric.server_id == srv.server_id)
-                .order_by(Metric.ts.desc())
-                .limit(1)
-            )
-            .scalars()
-            .first()
-        )
-        if not last_metric:
-            send_whatsapp_text(phone, f"No hay datos recientes para {srv.server_id}.")
+        srv = fleet[idx - 1]
+        if not srv["has_data"]:
+            _reply_whatsapp(phone, f"No hay datos recientes para {srv['server_id']}.")
             return
 
-        cpu = last_metric.cpu_total
+        cpu = srv["cpu_total"]
         mem_pct = (
-            last_metric.mem_used / max(last_metric.mem_total, 1) * 100
-            if last_metric.mem_total
+            srv["mem_used"] / max(srv["mem_total"], 1) * 100
+            if srv["mem_total"]
             else 0
         )
-        disk_pct = last_metric.disk_percent or 0
+        disk_pct = srv["disk_percent"] or 0
 
         status_lines = [
-            f"Servidor: {srv.server_id}",
+            f"Servidor: {srv['server_id']}",
             "Estado: ONLINE",
             f"CPU: {cpu:.1f}%",
             f"Memoria: {mem_pct:.1f}%",
             f"Disco: {disk_pct:.1f}%",
         ]
-        send_whatsapp_text(phone, "\n".join(status_lines))
+        _reply_whatsapp(phone, "\n".join(status_lines))
         return
 
-    send_whatsapp_text(
+    _reply_whatsapp(
         phone,
         "Comando no reconocido. Escribe AYUDA para ver los comandos disponibles.",
     )
@@ -683,6 +835,7 @@ def assign_servers_to_user(user_id: int, payload: ServerAssignmentSchema, user:
                     sess.add(link)
         
         sess.commit()
+        invalidate_fleet_cache(user_id)
         return {"status": "assigned", "count": len(payload.assignments)}
 
 @app.get("/api/admin/users/{user_id}/servers", response_model=List[UserServerAssignmentResponse])
@@ -722,6 +875,7 @@ def register_server(payload: RegisterServerSchema):
             sess.add(UserServerLink(user_id=admin.id, server_id=srv.id, receive_alerts=True))
             
         sess.commit()
+        invalidate_fleet_cache()
         return {"status": "registered", "server_id": payload.server_id}
 
 
@@ -758,6 +912,7 @@ def delete_server(server_id: str, user: dict = Depends(require_admin)):
         # Limpiar caché si existe
         if server_id in _cache:
             del _cache[server_id]
+        invalidate_fleet_cache()
             
         return {"status": "deleted", "server_id": server_id}
 
@@ -962,6 +1117,14 @@ def log_audit(sess: Session, action: str, target_type: str, target_id: str, chan
 
 # --- Gestión de Umbrales (Thresholds) ---
 
+def _threshold_dict(t: ServerThreshold) -> dict:
+    return {
+        "cpu": t.cpu_threshold,
+        "memory": t.memory_threshold,
+        "disk": t.disk_threshold,
+        "disk_mounts": json.loads(t.disk_mount_thresholds) if t.disk_mount_thresholds else {},
+    }
+
 @app.get("/api/umbrales", response_model=List[ServerThresholdResponse])
 def list_thresholds(user: dict = Depends(require_admin)):
     with Session(engine) as sess:
@@ -1004,6 +1167,11 @@ def update_threshold(server_id: str, payload: ServerThresholdUpdate, user: dict
         if payload.disk_threshold is not None:
             changes["disk_threshold"] = {"old": t.disk_threshold, "new": payload.disk_threshold}
             t.disk_threshold = payload.disk_threshold
+
+        if payload.disk_mount_thresholds is not None:
+            new_mounts = json.dumps(payload.disk_mount_thresholds) if payload.disk_mount_thresholds else None
+            changes["disk_mount_thresholds"] = {"old": t.disk_mount_thresholds, "new": new_mounts}
+            t.disk_mount_thresholds = new_mounts
             
         # Log Audit
         log_audit(sess, "update", "threshold", server_id, changes, user["email"])
@@ -1012,11 +1180,7 @@ def update_threshold(server_id: str, payload: ServerThresholdUpdate, user: dict
         sess.refresh(t)
         
         # Update Cache
-        _threshold_cache[server_id] = {
-            "cpu": t.cpu_threshold,
-            "memory": t.memory_threshold,
-            "disk": t.disk_threshold
-        }
+        _threshold_cache[server_id] = _threshold_dict(t)
         
         return t
 
@@ -1044,13 +1208,10 @@ def import_thresholds(payload: List[ServerThresholdImport], user: dict = Depends
             t.cpu_threshold = item.cpu_threshold
             t.memory_threshold = item.memory_threshold
             t.disk_threshold = item.disk_threshold
+            t.disk_mount_thresholds = json.dumps(item.disk_mount_thresholds) if item.disk_mount_thresholds else None
             
             # Update cache immediately
-            _threshold_cache[item.server_id] = {
-                "cpu": t.cpu_threshold,
-                "memory": t.memory_threshold,
-                "disk": t.disk_threshold
-            }
+            _threshold_cache[item.server_id] = _threshold_dict(t)
             count += 1
         
         log_audit(sess, "import", "threshold", "bulk", {"count": count}, user["email"])
@@ -1064,145 +1225,567 @@ def list_audit_logs(user: dict = Depends(require_admin)):
         return logs
 
 
-@app.post("/api/metrics")
-def ingest_metrics(payload: MetricsIngestSchema, x_auth_token: Optional[str] = Header(None)):
+def _parse_sample_ts(value: Optional[str]) -> Optional[datetime]:
+    """Timestamp original de la muestra (ISO 8601) como datetime UTC naive; None si no es válido."""
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    # No aceptar relojes adelantados: como máximo "ahora"
+    return min(ts, datetime.utcnow())
+
+
+def _validate_sample(payload: MetricsIngestSchema):
+    # Validaciones de rango
+    if not (0 <= payload.cpu.total <= 100):
+        raise HTTPException(status_code=422, detail="cpu.total fuera de rango")
+    if any(c < 0 or c > 100 for c in payload.cpu.per_core):
+        raise HTTPException(status_code=422, detail="cpu.per_core fuera de rango")
+    if payload.memory.used > payload.memory.total or payload.memory.total <= 0:
+        raise HTTPException(status_code=422, detail="memoria inválida")
+    if not (0 <= payload.disk.percent <= 100):
+        raise HTTPException(status_code=422, detail="disk.percent fuera de rango")
+
+
+def _build_metric(payload: MetricsIngestSchema, limits: Optional[dict] = None, sample_ts: bool = True) -> Metric:
+    m = Metric(
+        server_id=payload.server_id,
+        mem_total=payload.memory.total,
+        mem_used=payload.memory.used,
+        mem_free=payload.memory.free,
+        mem_cache=payload.memory.cache,
+        cpu_total=payload.cpu.total,
+        cpu_per_core=json.dumps(payload.cpu.per_core),
+        disk_total=payload.disk.total,
+        disk_used=payload.disk.used,
+        disk_free=payload.disk.free,
+        disk_percent=payload.disk.percent,
+        docker_running=payload.docker.running_containers,
+        docker_containers=json.dumps([c.model_dump() for c in payload.docker.containers])
+    )
+    # Muestras reenviadas desde el spool del agente conservan su hora original;
+    # las de /api/metrics usan la hora de recepción (el reloj del agente puede ir atrasado)
+    ts = _parse_sample_ts(payload.timestamp) if sample_ts else None
+    if ts is not None:
+        m.ts = ts
+    summary = payload.summary
+    if summary is not None:
+        m.summary_samples = summary.samples
+        m.summary_window = summary.window
+        for prefix, series in (("cpu", summary.cpu), ("mem_percent", summary.memory), ("disk_percent", summary.disk)):
+            if series is not None:
+                for stat in ("min", "max", "avg", "p95"):
+                    setattr(m, f"{prefix}_{stat}", getattr(series, stat))
+    if payload.net is not None:
+        m.net_rx_bps = payload.net.rx_bytes_per_s
+        m.net_tx_bps = payload.net.tx_bytes_per_s
+        m.net_rx_pps = payload.net.rx_packets_per_s
+        m.net_tx_pps = payload.net.tx_packets_per_s
+        m.net_errors = payload.net.errors
+        m.net_drops = payload.net.drops
+    if payload.disk_io is not None:
+        m.disk_read_bps = payload.disk_io.read_bytes_per_s
+        m.disk_write_bps = payload.disk_io.write_bytes_per_s
+        m.disk_read_iops = payload.disk_io.read_iops
+        m.disk_write_iops = payload.disk_io.write_iops
+    # Top de procesos: sólo cerca de un umbral, para acotar el almacenamiento
+    if payload.processes is not None and limits is not None and _near_breach(payload, limits):
+        m.top_processes = json.dumps(payload.processes.model_dump())
+    return m
+
+
+def _io_dicts(m: Metric) -> tuple:
+    net = None
+    if m.net_rx_bps is not None:
+        net = {
+            "rx_bytes_per_s": m.net_rx_bps,
+            "tx_bytes_per_s": m.net_tx_bps,
+            "rx_packets_per_s": m.net_rx_pps,
+            "tx_packets_per_s": m.net_tx_pps,
+            "errors": m.net_errors,
+            "drops": m.net_drops,
+        }
+    disk_io = None
+    if m.disk_read_bps is not None:
+        disk_io = {
+            "read_bytes_per_s": m.disk_read_bps,
+            "write_bytes_per_s": m.disk_write_bps,
+            "read_iops": m.disk_read_iops,
+            "write_iops": m.disk_write_iops,
+        }
+    return net, disk_io
+
+
+def _summary_dict(m: Metric) -> Optional[dict]:
+    """Resumen del intervalo tal como lo envió el agente (None si sólo hay snapshot)."""
+    if not m.summary_samples:
+        return None
+
+    def series(prefix: str, last):
+        if getattr(m, f"{prefix}_max") is None:
+            return None
+        out = {stat: getattr(m, f"{prefix}_{stat}") for stat in ("min", "max", "avg", "p95")}
+        out["last"] = last
+        return out
+
+    mem_pct = (m.mem_used / m.mem_total * 100) if m.mem_total else None
+    return {
+        "samples": m.summary_samples,
+        "window": m.summary_window,
+        "cpu": series("cpu", m.cpu_total),
+        "memory": series("mem_percent", mem_pct),
+        "disk": series("disk_percent", m.disk_percent),
+    }
+
+
+def _is_live_sample(m: Metric) -> bool:
+    """Las muestras antiguas de un lote (backlog reenviado) no disparan alertas."""
+    if m.ts is None:
+        return True
+    ts = m.ts.replace(tzinfo=None) if m.ts.tzinfo else m.ts
+    return (datetime.utcnow() - ts).total_seconds() <= REPLAY_ALERT_MAX_AGE
+
+
+def _effective_limits(sess: Session, server_id: str) -> dict:
+    """Umbrales efectivos del servidor. Prioridad: Específico > Global."""
+    # Cargar configuración de alertas global
+    alert_cfg = sess.execute(select(AlertConfig)).scalar_one_or_none()
+
+    # Cargar umbrales específicos (con caché)
+    thresholds = _threshold_cache.get(server_id)
+    if thresholds is None:
+        # Si no está en caché, buscar en DB
+        t_db = sess.execute(select(ServerThreshold).where(ServerThreshold.server_id == server_id)).scalar_one_or_none()
+        if t_db:
+            thresholds = _threshold_dict(t_db)
+        else:
+            thresholds = {}
+        _threshold_cache[server_id] = thresholds
+
+    cpu_limit = thresholds.get("cpu")
+    if cpu_limit is None and alert_cfg:
+        cpu_limit = alert_cfg.cpu_total_percent
+
+    mem_limit = thresholds.get("memory")
+    if mem_limit is None and alert_cfg:
+        mem_limit = alert_cfg.memory_used_percent
+
+    disk_limit = thresholds.get("disk")
+    if disk_limit is None and alert_cfg:
+        disk_limit = alert_cfg.disk_used_percent
+
+    return {
+        "cpu": cpu_limit,
+        "memory": mem_limit,
+        "disk": disk_limit,
+        "disk_mounts": thresholds.get("disk_mounts") or {},
+    }
+
+
+def _mem_percent_of(payload: MetricsIngestSchema) -> float:
+    return (payload.memory.used / payload.memory.total) * 100 if payload.memory.total > 0 else 0
+
+
+def _near_breach(payload: MetricsIngestSchema, limits: dict) -> bool:
+    """CPU o memoria dentro del margen PROCESS_SNAPSHOT_MARGIN del umbral (o por encima)."""
+    for value, limit in ((payload.cpu.total, limits.get("cpu")), (_mem_percent_of(payload), limits.get("memory"))):
+        if limit and limit > 0 and value >= limit * PROCESS_SNAPSHOT_MARGIN:
+            return True
+    return False
+
+
+def _check_alerts(sess: Session, srv: Server, payload: MetricsIngestSchema, limits: Optional[dict] = None):
+    # Verificar Alertas
+    try:
+        if limits is None:
+            limits = _effective_limits(sess, payload.server_id)
+        cpu_limit = limits["cpu"]
+        mem_limit = limits["memory"]
+        disk_limit = limits["disk"]
+
+        # Datos completos para el correo
+        full_metrics = payload.model_dump()
+        current_time = time.time()
+        
+        # Check CPU
+        if cpu_limit and cpu_limit > 0 and payload.cpu.total >= cpu_limit:
+            key = (payload.server_id, "cpu")
+            last_sent = _alert_state.get(key, 0)
+            if current_time - last_sent > ALERT_COOLDOWN:
+                recipients, applied_rules = get_alert_recipients(sess, srv, "cpu")
+                print(f"[ALERT] Sending CPU alert for {srv.server_id}. Threshold: {cpu_limit}% (Global or Custom). Applied rules: {applied_rules}")
+                send_alert_email(payload.server_id, "CPU Alta", payload.cpu.total, cpu_limit, recipients, full_metrics)
+                _alert_state[key] = current_time
+        
+        # Check Memory
+        mem_percent = _mem_percent_of(payload)
+        if mem_limit and mem_limit > 0 and mem_percent >= mem_limit:
+            key = (payload.server_id, "memory")
+            last_sent = _alert_state.get(key, 0)
+            if current_time - last_sent > ALERT_COOLDOWN:
+                recipients, applied_rules = get_alert_recipients(sess, srv, "memory")
+                print(f"[ALERT] Sending Memory alert for {srv.server_id}. Threshold: {mem_limit}% (Global or Custom). Applied rules: {applied_rules}")
+                send_alert_email(payload.server_id, "Memoria Alta", mem_percent, mem_limit, recipients, full_metrics)
+                _alert_state[key] = current_time
+
+        # Check Disk: por montaje si el agente los envía (aunque ninguno haya cambiado),
+        # si no el disco único
+        mounts = _alert_mounts(sess, payload)
+        if mounts:
+            _check_mount_alerts(sess, srv, payload.server_id, mounts, disk_limit, limits["disk_mounts"], full_metrics, current_time)
+        elif disk_limit and disk_limit > 0 and payload.disk.percent >= disk_limit:
+            key = (payload.server_id, "disk")
+            last_sent = _alert_state.get(key, 0)
+            if current_time - last_sent > ALERT_COOLDOWN:
+                recipients, applied_rules = get_alert_recipients(sess, srv, "disk")
+                print(f"[ALERT] Sending Disk alert for {srv.server_id}. Threshold: {disk_limit}% (Global or Custom). Applied rules: {applied_rules}")
+                send_alert_email(payload.server_id, "Disco Lleno", payload.disk.percent, disk_limit, recipients, full_metrics)
+                _alert_state[key] = current_time
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Error checking alerts: {e}")
+
+
+def _alert_mounts(sess: Session, payload: MetricsIngestSchema) -> list[DiskMountSchema]:
+    """
+    Montajes a evaluar: los del reporte más, si el reporte es parcial, el último
+    estado guardado de los que no cambiaron (siguen llenos aunque no se reenvíen).
+    """
+    if payload.disks is None:
+        return []
+    mounts = list(payload.disks)
+    if not payload.disks_complete:
+        reported = {m.mountpoint for m in mounts}
+        mounts.extend(
+            DiskMountSchema(
+                mountpoint=r.mountpoint, device=r.device, fstype=r.fstype,
+                total=r.total, used=r.used, free=r.free, percent=r.percent,
+            )
+            for r in _latest_mount_rows(sess, payload.server_id)
+            if r.mountpoint not in reported
+        )
+    return mounts
+
+
+def _check_mount_alerts(sess: Session, srv: Server, server_id: str, mounts: list, disk_limit, mount_limits: dict,
+                        full_metrics: dict, current_time: float):
+    for mount in mounts:
+        limit = mount_limits.get(mount.mountpoint, disk_limit)
+        if not limit or limit <= 0 or mount.percent < limit:
+            continue
+        key = (server_id, "disk", mount.mountpoint)
+        if current_time - _alert_state.get(key, 0) <= ALERT_COOLDOWN:
+            continue
+        recipients, applied_rules = get_alert_recipients(sess, srv, "disk")
+        print(f"[ALERT] Sending Disk alert for {srv.server_id} ({mount.mountpoint}). Threshold: {limit}%. Applied rules: {applied_rules}")
+        # La tabla del correo muestra el montaje que disparó la alerta
+        mount_metrics = dict(full_metrics, disk=mount.model_dump())
+        send_alert_email(server_id, f"Disco Lleno ({mount.mountpoint})", mount.percent, limit, recipients, mount_metrics)
+        _alert_state[key] = current_time
+
+
+def _mount_rows(payload: MetricsIngestSchema, ts: Optional[datetime]) -> list[dict]:
+    # Todas las filas de un reporte comparten ts: el último reporte completo marca
+    # qué montajes existen (los que faltan en él se desmontaron)
+    ts = ts or datetime.utcnow()
+    return [
+        {"server_id": payload.server_id, "ts": ts, "complete": payload.disks_complete or None, **mount.model_dump()}
+        for mount in payload.disks or []
+    ]
+
+
+def _cache_sample(payload: MetricsIngestSchema, m: Metric):
+    # Actualizar caché en memoria
+    try:
+        entry = {
+            "server_id": payload.server_id,
+            "ts": str(m.ts),
+            "memory": payload.memory.model_dump(),
+            "cpu": payload.cpu.model_dump(),
+            "disk": payload.disk.model_dump(),
+            "docker": payload.docker.model_dump(),
+            "summary": payload.summary.model_dump() if payload.summary else None,
+            "net": payload.net.model_dump() if payload.net else None,
+            "disk_io": payload.disk_io.model_dump() if payload.disk_io else None,
+            "processes": json.loads(m.top_processes) if m.top_processes else None,
+        }
+        buf = _cache.get(payload.server_id)
+        if not buf:
+            buf = []
+            _cache[payload.server_id] = buf
+        buf.append(entry)
+        if len(buf) > CACHE_MAX_ITEMS:
+            # recortar dejado en el inicio
+            del buf[: len(buf) - CACHE_MAX_ITEMS]
+    except Exception:
+        # No bloquear por errores de caché
+        pass
+
+
+def _authenticate_server(sess: Session, server_id: str, x_auth_token: Optional[str]) -> Server:
     if not x_auth_token:
         raise HTTPException(status_code=401, detail="Missing auth token")
+    srv = sess.execute(select(Server).where(Server.server_id == server_id)).scalar_one_or_none()
+    if not srv or srv.token != x_auth_token:
+        raise HTTPException(status_code=403, detail="Unauthorized server or bad token")
+    return srv
 
-    with Session(engine) as sess:
-        srv = sess.execute(select(Server).where(Server.server_id == payload.server_id)).scalar_one_or_none()
-        if not srv or srv.token != x_auth_token:
-            raise HTTPException(status_code=403, detail="Unauthorized server or bad token")
-
-        # Validaciones de rango
-        if not (0 <= payload.cpu.total <= 100):
-            raise HTTPException(status_code=422, detail="cpu.total fuera de rango")
-        if any(c < 0 or c > 100 for c in payload.cpu.per_core):
-            raise HTTPException(status_code=422, detail="cpu.per_core fuera de rango")
-        if payload.memory.used > payload.memory.total or payload.memory.total <= 0:
-            raise HTTPException(status_code=422, detail="memoria inválida")
-        if not (0 <= payload.disk.percent <= 100):
-            raise HTTPException(status_code=422, detail="disk.percent fuera de rango")
-
-        m = Metric(
-            server_id=payload.server_id,
-            mem_total=payload.memory.total,
-            mem_used=payload.memory.used,
-            mem_free=payload.memory.free,
-            mem_cache=payload.memory.cache,
-            cpu_total=payload.cpu.total,
-            cpu_per_core=json.dumps(payload.cpu.per_core),
-            disk_total=payload.disk.total,
-            disk_used=payload.disk.used,
-            disk_free=payload.disk.free,
-            disk_percent=payload.disk.percent,
-            docker_running=payload.docker.running_containers,
-            docker_containers=json.dumps([c.model_dump() for c in payload.docker.containers])
+
+def _retry_later(status_code: int, detail: str, retry_after: int = INGEST_RETRY_AFTER) -> HTTPException:
+    """Respuesta de backpressure; el Retry-After lleva jitter para que los agentes no vuelvan juntos."""
+    seconds = retry_after + random.randint(0, max(retry_after, 1))
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(seconds)})
+
+
+@contextmanager
+def _db_backpressure():
+    """SQLite bloqueado o sin conexiones libres: 503 con Retry-After en lugar de un 500."""
+    try:
+        yield
+    except OperationalError as e:
+        print(f"[INGEST] Base de datos ocupada, se pide reintentar: {e.orig}")
+        raise _retry_later(503, "Base de datos ocupada, reintentar más tarde")
+
+
+# Rate limit por servidor (clave server_id + token: un token falso no agota el bucket del real)
+_ingest_buckets = KeyedTokenBuckets(INGEST_SERVER_RATE, INGEST_SERVER_BURST)
+# Escrituras de ingest simultáneas acotadas: el resto del threadpool atiende al dashboard
+_ingest_admission = AdmissionController(INGEST_MAX_INFLIGHT, INGEST_MAX_LATENCY, shed_for=INGEST_SHED_SECONDS)
+
+
+class _IngestSlot:
+    """
+    Plaza de admisión de un ingest. Sólo se mide la escritura en la DB (de
+    `db_started` a `release`): ni la espera en el threadpool ni las alertas por
+    correo que se envían después del commit cuentan para el rechazo de carga.
+    """
+
+    def __init__(self):
+        self._started = None
+        self._held = True
+
+    def db_started(self):
+        self._started = time.monotonic()
+
+    def release(self):
+        if not self._held:
+            return
+        self._held = False
+        _ingest_admission.leave(None if self._started is None else time.monotonic() - self._started)
+
+
+@contextmanager
+def _admit_ingest(server_id: str, token: Optional[str]):
+    """429 si el servidor supera su cuota, 503 si la DB está saturada. Entrega la plaza del ingest."""
+    bucket = _ingest_buckets.get((server_id, token or ""))
+    if not bucket.try_acquire():
+        raise _retry_later(429, "Demasiados reportes de este servidor", math.ceil(bucket.wait_time()))
+    if not _ingest_admission.try_enter():
+        raise _retry_later(503, "Ingest saturado, reintentar más tarde", math.ceil(_ingest_admission.retry_after()))
+    slot = _IngestSlot()
+    try:
+        yield slot
+    finally:
+        slot.release()
+
+
+def _next_report_in(server_id: str, interval: int, now: Optional[float] = None) -> int:
+    """
+    Segundos hasta el próximo reporte sugerido. Cada servidor tiene un desfase fijo
+    dentro del intervalo (hash del server_id), así los agentes quedan repartidos
+    aunque arranquen todos juntos tras un reinicio masivo.
+    """
+    if not interval or interval <= 0:
+        return interval
+    now = time.time() if now is None else now
+    slot = zlib.crc32(server_id.encode("utf-8")) % interval
+    wait = (slot - now) % interval
+    if wait < interval / 2:
+        wait += interval
+    return int(round(wait))
+
+
+_METRICS_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            media: {"schema": {"$ref": "#/components/schemas/MetricsIngestSchema"}}
+            for media in ("application/json", "application/msgpack")
+        },
+    }
+}
+
+
+@app.post("/api/metrics", openapi_extra=_METRICS_BODY_DOC)
+async def ingest_metrics_endpoint(request: Request, x_auth_token: Optional[str] = Header(None)):
+    """Acepta JSON o MessagePack; el cuerpo se valida sin pasar por el parseo genérico de FastAPI."""
+    body = await request.body()
+    try:
+        payload = decode_model(body, request.headers.get("content-type"), MetricsIngestSchema)
+    except WireError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [dict(err, loc=("body", *err["loc"])) for err in e.errors(include_url=False)], body=body
         )
+    wire_sample = getattr(request.state, "wire_sample", None)
+    with _admit_ingest(payload.server_id, x_auth_token) as slot:
+        return await run_in_threadpool(ingest_metrics, payload, x_auth_token, wire_sample, slot)
+
+
+def ingest_metrics(payload: MetricsIngestSchema, x_auth_token: Optional[str] = None, wire_sample: Optional[dict] = None,
+                   slot: Optional[_IngestSlot] = None):
+    if slot is not None:
+        slot.db_started()
+    with _db_backpressure(), Session(engine) as sess:
+        srv = _authenticate_server(sess, payload.server_id, x_auth_token)
+        _validate_sample(payload)
+
+        limits = _effective_limits(sess, payload.server_id)
+        # Reporte en tiempo real: vale la hora de recepción, siempre alerta
+        m = _build_metric(payload, limits, sample_ts=False)
         sess.add(m)
+        if payload.disks:
+            sess.execute(insert(MetricDisk), _mount_rows(payload, m.ts))
         sess.commit()
+        if slot is not None:
+            slot.release()
+
+        _check_alerts(sess, srv, payload, limits)
+        _cache_sample(payload, m)
+        # Umbrales efectivos: el agente los evalúa en cada muestra rápida y reporta
+        # fuera de ciclo si alguno se supera
+        response = {
+            "status": "ok",
+            "report_interval": srv.report_interval,
+            "next_report_in": _next_report_in(srv.server_id, srv.report_interval),
+            "thresholds": limits,
+        }
+        # Formato compacto: ya autenticado, la muestra pasa a ser la base de los próximos deltas
+        if payload.seq is not None and wire_bases.acknowledge(payload.server_id, payload.seq, wire_sample):
+            response["ack"] = payload.seq
+        return response
 
-        # Verificar Alertas
-        try:
-            # Cargar configuración de alertas global
-            alert_cfg = sess.execute(select(AlertConfig)).scalar_one_or_none()
-            
-            # Cargar umbrales específicos (con caché)
-            thresholds = _threshold_cache.get(payload.server_id)
-            if thresholds is None:
-                # Si no está en caché, buscar en DB
-                t_db = sess.execute(select(ServerThreshold).where(ServerThreshold.server_id == payload.server_id)).scalar_one_or_none()
-                if t_db:
-                    thresholds = {
-                        "cpu": t_db.cpu_threshold,
-                        "memory": t_db.memory_threshold,
-                        "disk": t_db.disk_threshold
-                    }
-                else:
-                    thresholds = {}
-                _threshold_cache[payload.server_id] = thresholds
-            
-            # Definir límites efectivos (Global vs Específico)
-            # Prioridad: Específico > Global
-            
-            cpu_limit = thresholds.get("cpu")
-            if cpu_limit is None and alert_cfg:
-                cpu_limit = alert_cfg.cpu_total_percent
-                
-            mem_limit = thresholds.get("memory")
-            if mem_limit is None and alert_cfg:
-                mem_limit = alert_cfg.memory_used_percent
-                
-            disk_limit = thresholds.get("disk")
-            if disk_limit is None and alert_cfg:
-                disk_limit = alert_cfg.disk_used_percent
 
-            # Datos completos para el correo
-            full_metrics = payload.model_dump()
-            current_time = time.time()
-            
-            # Check CPU
-            if cpu_limit and cpu_limit > 0 and payload.cpu.total >= cpu_limit:
-                key = (payload.server_id, "cpu")
-                last_sent = _alert_state.get(key, 0)
-                if current_time - last_sent > ALERT_COOLDOWN:
-                    recipients, applied_rules = get_alert_recipients(sess, srv, "cpu")
-                    print(f"[ALERT] Sending CPU alert for {srv.server_id}. Threshold: {cpu_limit}% (Global or Custom). Applied rules: {applied_rules}")
-                    send_alert_email(payload.server_id, "CPU Alta", payload.cpu.total, cpu_limit, recipients, full_metrics)
-                    _alert_state[key] = current_time
-            
-            # Check Memory
-            mem_percent = (payload.memory.used / payload.memory.total) * 100 if payload.memory.total > 0 else 0
-            if mem_limit and mem_limit > 0 and mem_percent >= mem_limit:
-                key = (payload.server_id, "memory")
-                last_sent = _alert_state.get(key, 0)
-                if current_time - last_sent > ALERT_COOLDOWN:
-                    recipients, applied_rules = get_alert_recipients(sess, srv, "memory")
-                    print(f"[ALERT] Sending Memory alert for {srv.server_id}. Threshold: {mem_limit}% (Global or Custom). Applied rules: {applied_rules}")
-                    send_alert_email(payload.server_id, "Memoria Alta", mem_percent, mem_limit, recipients, full_metrics)
-                    _alert_state[key] = current_time
-
-            # Check Disk
-            if disk_limit and disk_limit > 0 and payload.disk.percent >= disk_limit:
-                key = (payload.server_id, "disk")
-                last_sent = _alert_state.get(key, 0)
-                if current_time - last_sent > ALERT_COOLDOWN:
-                    recipients, applied_rules = get_alert_recipients(sess, srv, "disk")
-                    print(f"[ALERT] Sending Disk alert for {srv.server_id}. Threshold: {disk_limit}% (Global or Custom). Applied rules: {applied_rules}")
-                    send_alert_email(payload.server_id, "Disco Lleno", payload.disk.percent, disk_limit, recipients, full_metrics)
-                    _alert_state[key] = current_time
+@app.post("/api/metrics/batch")
+def ingest_metrics_batch(payload: MetricsBatchSchema, x_auth_token: Optional[str] = Header(None)):
+    """
+    Ingest de varias muestras de un mismo servidor (reenvío del spool del agente).
+    Las muestras inválidas se descartan y se informan en `rejected`.
+    """
+    if len(payload.samples) > METRICS_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo {METRICS_MAX_BATCH} muestras por lote")
+
+    with _admit_ingest(payload.server_id, x_auth_token) as slot, _db_backpressure(), Session(engine) as sess:
+        slot.db_started()
+        srv = _authenticate_server(sess, payload.server_id, x_auth_token)
+
+        limits = _effective_limits(sess, payload.server_id)
+        accepted = []
+        mount_rows = []
+        rejected = 0
+        for sample in payload.samples:
+            if sample.server_id != payload.server_id:
+                rejected += 1
+                continue
+            try:
+                _validate_sample(sample)
+            except HTTPException:
+                rejected += 1
+                continue
+            m = _build_metric(sample, limits)
+            sess.add(m)
+            mount_rows.extend(_mount_rows(sample, m.ts))
+            accepted.append((sample, m))
+        if mount_rows:
+            sess.execute(insert(MetricDisk), mount_rows)
+        sess.commit()
+        slot.release()
+
+        live = [(sample, m) for sample, m in accepted if _is_live_sample(m)]
+        if live:
+            sample, _ = max(live, key=lambda item: item[1].ts)
+            _check_alerts(sess, srv, sample, limits)
+        if accepted:
+            _cache.pop(payload.server_id, None)
+        return {
+            "status": "ok",
+            "accepted": len(accepted),
+            "rejected": rejected,
+            "report_interval": srv.report_interval,
+            "thresholds": limits,
+        }
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"Error checking alerts: {e}")
 
-        # Actualizar caché en memoria
-        try:
-            entry = {
-                "server_id": payload.server_id,
-                "ts": str(m.ts),
-                "memory": payload.memory.model_dump(),
-                "cpu": payload.cpu.model_dump(),
-                "disk": payload.disk.model_dump(),
-                "docker": payload.docker.model_dump(),
-            }
-            buf = _cache.get(payload.server_id)
-            if not buf:
-                buf = []
-                _cache[payload.server_id] = buf
-            buf.append(entry)
-            if len(buf) > CACHE_MAX_ITEMS:
-                # recortar dejado en el inicio
-                del buf[: len(buf) - CACHE_MAX_ITEMS]
-        except Exception:
-            # No bloquear por errores de caché
-            pass
-        return {"status": "ok", "report_interval": srv.report_interval}
+# Columnas del rollup: (nombre en la respuesta, expresión agregada)
+_mem_percent = Metric.mem_used * 100.0 / func.nullif(Metric.mem_total, 0)
+_ROLLUP_COLUMNS = (
+    ("cpu_avg", func.avg(Metric.cpu_total)),
+    ("cpu_max", func.max(func.coalesce(Metric.cpu_max, Metric.cpu_total))),
+    ("mem_percent_avg", func.avg(_mem_percent)),
+    ("mem_percent_max", func.max(func.coalesce(Metric.mem_percent_max, _mem_percent))),
+    ("disk_percent_max", func.max(Metric.disk_percent)),
+    ("net_rx_bps_avg", func.avg(Metric.net_rx_bps)),
+    ("net_rx_bps_max", func.max(Metric.net_rx_bps)),
+    ("net_tx_bps_avg", func.avg(Metric.net_tx_bps)),
+    ("net_tx_bps_max", func.max(Metric.net_tx_bps)),
+    ("net_rx_pps_avg", func.avg(Metric.net_rx_pps)),
+    ("net_tx_pps_avg", func.avg(Metric.net_tx_pps)),
+    ("net_errors", func.sum(Metric.net_errors)),
+    ("net_drops", func.sum(Metric.net_drops)),
+    ("disk_read_bps_avg", func.avg(Metric.disk_read_bps)),
+    ("disk_read_bps_max", func.max(Metric.disk_read_bps)),
+    ("disk_write_bps_avg", func.avg(Metric.disk_write_bps)),
+    ("disk_write_bps_max", func.max(Metric.disk_write_bps)),
+    ("disk_read_iops_avg", func.avg(Metric.disk_read_iops)),
+    ("disk_write_iops_avg", func.avg(Metric.disk_write_iops)),
+)
+
+
+def _metrics_rollup(sess: Session, server_id: str, bucket: int, limit: int) -> list[dict]:
+    """Agrega las muestras en ventanas de `bucket` segundos (las últimas `limit`), en SQL."""
+    bucket_start = cast(func.strftime("%s", Metric.ts), Integer) // bucket * bucket
+    rows = sess.execute(
+        select(
+            bucket_start.label("bucket"),
+            func.count().label("samples"),
+            *(expr.label(name) for name, expr in _ROLLUP_COLUMNS),
+        )
+        .where(Metric.server_id == server_id)
+        .group_by(bucket_start)
+        .order_by(bucket_start.desc())
+        .limit(limit)
+    ).all()
+    out = []
+    for r in reversed(rows):
+        item = r._asdict()
+        item["ts"] = str(datetime.fromtimestamp(int(item.pop("bucket")), tz=timezone.utc).replace(tzinfo=None))
+        out.append(item)
+    return out
 
 
 @app.get("/api/metrics/history")
-def metrics_history(server_id: Optional[str] = None, limit: int = 100, user: dict = Depends(get_current_user_from_token)):
+def metrics_history(
+    server_id: Optional[str] = None,
+    limit: int = 100,
+    bucket: Optional[int] = None,
+    user: dict = Depends(get_current_user_from_token),
+):
+    # Rollup por ventanas de tiempo (p.ej. bucket=3600 para promedios/máximos horarios)
+    if bucket:
+        if not server_id:
+            raise HTTPException(status_code=422, detail="bucket requiere server_id")
+        if bucket < 60:
+            raise HTTPException(status_code=422, detail="bucket mínimo: 60 segundos")
+        with Session(engine) as sess:
+            return _metrics_rollup(sess, server_id, bucket, max(1, min(limit, CACHE_MAX_ITEMS)))
+
     # Intentar servir desde caché si es posible
     if server_id and server_id in _cache:
         buf = _cache[server_id]
@@ -1210,12 +1793,13 @@ def metrics_history(server_id: Optional[str] = None, limit: int = 100, user: dic
             return buf[-limit:]
     with Session(engine) as sess:
         try:
-            q = select(Metric).order_by(Metric.id.desc()).limit(limit)
+            q = select(Metric).order_by(Metric.ts.desc(), Metric.id.desc()).limit(limit)
             if server_id:
                 q = q.where(Metric.server_id == server_id)
             rows = sess.execute(q).scalars().all()
             rows = list(reversed(rows))
             def row_to_dict(r: Metric):
+                net, disk_io = _io_dicts(r)
                 return {
                     "server_id": r.server_id,
                     "ts": str(r.ts),
@@ -1223,6 +1807,10 @@ def metrics_history(server_id: Optional[str] = None, limit: int = 100, user: dic
                     "cpu": {"total": r.cpu_total, "per_core": json.loads(r.cpu_per_core or "[]")},
                     "disk": {"total": r.disk_total, "used": r.disk_used, "free": r.disk_free, "percent": r.disk_percent},
                     "docker": {"running_containers": r.docker_running, "containers": json.loads(r.docker_containers or "[]")},
+                    "summary": _summary_dict(r),
+                    "net": net,
+                    "disk_io": disk_io,
+                    "processes": json.loads(r.top_processes) if r.top_processes else None,
                 }
             data = [row_to_dict(r) for r in rows]
             if server_id:
@@ -1232,6 +1820,75 @@ def metrics_history(server_id: Optional[str] = None, limit: int = 100, user: dic
             raise HTTPException(status_code=500, detail="Error consultando historial")
 
 
+def _latest_mount_rows(sess: Session, server_id: str) -> list[MetricDisk]:
+    """
+    Último estado de cada montaje del servidor, ordenado por mountpoint. Sólo se
+    consideran las filas desde el último reporte completo: un montaje que ya no
+    figura en él fue desmontado. Sin reporte completo, las de MOUNT_STATE_MAX_AGE.
+    """
+    since = sess.execute(
+        select(func.max(MetricDisk.ts))
+        .where(MetricDisk.server_id == server_id, MetricDisk.complete.is_(True))
+    ).scalar()
+    if since is None:
+        since = datetime.utcnow() - timedelta(seconds=MOUNT_STATE_MAX_AGE)
+    ranked = (
+        select(
+            MetricDisk,
+            func.row_number().over(
+                partition_by=MetricDisk.mountpoint,
+                order_by=(MetricDisk.ts.desc(), MetricDisk.id.desc()),
+            ).label("rn"),
+        )
+        .where(MetricDisk.server_id == server_id, MetricDisk.ts >= since)
+        .subquery()
+    )
+    latest = aliased(MetricDisk, ranked)
+    return sess.execute(
+        select(latest)
+        .where(ranked.c.rn == 1)
+        .order_by(latest.mountpoint)
+    ).scalars().all()
+
+
+@app.get("/api/metrics/disks")
+def metrics_disks(
+    server_id: str,
+    mountpoint: Optional[str] = None,
+    limit: int = 100,
+    user: dict = Depends(get_current_user_from_token),
+):
+    """
+    Sin `mountpoint`: último estado de cada montaje del servidor.
+    Con `mountpoint`: historial de ese montaje (sólo los cambios reportados), ascendente.
+    """
+    limit = max(1, min(limit, CACHE_MAX_ITEMS))
+    with Session(engine) as sess:
+        if mountpoint:
+            rows = sess.execute(
+                select(MetricDisk)
+                .where(MetricDisk.server_id == server_id, MetricDisk.mountpoint == mountpoint)
+                .order_by(MetricDisk.ts.desc(), MetricDisk.id.desc())
+                .limit(limit)
+            ).scalars().all()
+            rows = list(reversed(rows))
+        else:
+            rows = _latest_mount_rows(sess, server_id)
+        return [
+            {
+                "mountpoint": r.mountpoint,
+                "device": r.device,
+                "fstype": r.fstype,
+                "ts": str(r.ts),
+                "total": r.total,
+                "used": r.used,
+                "free": r.free,
+                "percent": r.percent,
+            }
+            for r in rows
+        ]
+
+
 @app.get("/api/alerts")
 def get_alerts(user: dict = Depends(get_current_user_from_token)):
     with Session(engine) as sess:
@@ -1272,23 +1929,58 @@ def health():
         return {"ok": False, "error": str(e)}
 
 
+def _existing_data_monitoring_keys(sess: Session, keys: set[tuple[str, str]]) -> set[tuple[str, str]]:
+    """Claves (entity_id, created_at_client) que ya están en la tabla."""
+    found = set()
+    key_list = list(keys)
+    for i in range(0, len(key_list), DATA_MONITORING_INSERT_CHUNK):
+        chunk = key_list[i:i + DATA_MONITORING_INSERT_CHUNK]
+        found.update(
+            sess.execute(
+                select(DataMonitoring.entity_id, DataMonitoring.created_at_client)
+                .where(tuple_(DataMonitoring.entity_id, DataMonitoring.created_at_client).in_(chunk))
+            ).tuples().all()
+        )
+    return found
+
+
+def insert_data_monitoring_rows(sess: Session, rows: list[dict]) -> int:
+    """Inserta filas con un INSERT multi-fila por bloque. No hace commit."""
+    for i in range(0, len(rows), DATA_MONITORING_INSERT_CHUNK):
+        sess.execute(insert(DataMonitoring).values(rows[i:i + DATA_MONITORING_INSERT_CHUNK]))
+    return len(rows)
+
+
+def insert_idempotent_data_monitoring_rows(sess: Session, rows: list[dict]) -> list[dict]:
+    """
+    Inserta filas idempotentes con ON CONFLICT DO NOTHING sobre el índice único de
+    la clave. Devuelve sólo las filas realmente insertadas. No hace commit.
+    """
+    inserted = []
+    for i in range(0, len(rows), DATA_MONITORING_INSERT_CHUNK):
+        chunk = [dict(r, idempotent=True) for r in rows[i:i + DATA_MONITORING_INSERT_CHUNK]]
+        stmt = (
+            sqlite_insert(DataMonitoring)
+            .values(chunk)
+            .on_conflict_do_nothing(
+                index_elements=["entity_id", "created_at_client"],
+                index_where=text("idempotent = 1"),
+            )
+            .returning(DataMonitoring.entity_id, DataMonitoring.created_at_client)
+        )
+        keys = set(sess.execute(stmt).tuples().all())
+        inserted.extend(r for r in chunk if (r["entity_id"], r["created_at_client"]) in keys)
+    return inserted
+
+
 @app.post("/api/data-monitoring", status_code=201)
 def create_data_monitoring(payload: DataMonitoringSchema):
     try:
         with Session(engine) as sess:
-            data = DataMonitoring(
-                        app=payload.app,
-                        cash_register_number=payload.cash_register_number,
-                        user_name=payload.user_name,
-                        flow=payload.flow,
-                        patent=payload.patent,
-                        vehicle_type=payload.vehicle_type,
-                        product=payload.product,
-                        created_at_client=payload.created_at_client,
-                        entity_id=payload.entity_id,
-                        working_day=payload.working_day
-                    )
+            row = data_monitoring_row(payload)
+            data = DataMonitoring(**row)
             sess.add(data)
+            increment_counters(sess, [row])
             sess.commit()
             sess.refresh(data)
             return {"status": "created", "id": data.id}
@@ -1296,58 +1988,310 @@ def create_data_monitoring(payload: DataMonitoringSchema):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/data-monitoring/batch", status_code=201)
+def create_data_monitoring_batch(payload: List[DataMonitoringSchema], idempotent: bool = False):
+    """
+    Ingest por lotes. Con `idempotent=true` se descartan los registros cuya clave
+    (entityId, createdAt) ya existe o se repite dentro del lote, de modo que los
+    reintentos del cliente no duplican filas. El índice único parcial cubre el
+    caso de dos reintentos concurrentes del mismo lote.
+    """
+    if len(payload) > DATA_MONITORING_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Máximo {DATA_MONITORING_MAX_BATCH} registros por lote")
+    if not payload:
+        return {"status": "created", "received": 0, "inserted": 0, "duplicates": 0}
+
+    rows = [data_monitoring_row(item) for item in payload]
+    try:
+        with Session(engine) as sess:
+            if idempotent:
+                existing = _existing_data_monitoring_keys(
+                    sess, {(r["entity_id"], r["created_at_client"]) for r in rows}
+                )
+                unique_rows = []
+                for r in rows:
+                    key = (r["entity_id"], r["created_at_client"])
+                    if key in existing:
+                        continue
+                    existing.add(key)
+                    unique_rows.append(r)
+                rows = insert_idempotent_data_monitoring_rows(sess, unique_rows)
+            else:
+                insert_data_monitoring_rows(sess, rows)
+            inserted = len(rows)
+            increment_counters(sess, rows)
+            sess.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "created",
+        "received": len(payload),
+        "inserted": inserted,
+        "duplicates": len(payload) - inserted,
+    }
+
+
+def _data_monitoring_response(d: DataMonitoring) -> DataMonitoringResponseSchema:
+    return DataMonitoringResponseSchema(
+        app=d.app,
+        cashRegisterNumber=d.cash_register_number,
+        userName=d.user_name,
+        flow=d.flow,
+        patent=d.patent,
+        vehicleType=d.vehicle_type,
+        product=d.product,
+        createdAt=d.created_at_client,
+        entityId=d.entity_id,
+        workingDay=d.working_day,
+        id=d.id,
+        received_at=d.received_at
+    )
+
+
+@app.get("/api/data-monitoring/stats")
+def data_monitoring_stats(
+    group_by: str = "flow",
+    granularity: str = "day",
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    app_name: Optional[str] = Query(None, alias="app"),
+    flow: Optional[str] = None,
+    latest: bool = False,
+    user: dict = Depends(require_data_monitoring_access),
+):
+    """
+    Conteos por `group_by` (app, flow, vehicle_type, product) y día u hora,
+    leídos de los contadores incrementales (no escanea data_monitoring).
+    Con `latest=true` sólo se devuelve el último día con datos dentro del rango.
+    """
+    if group_by not in COUNTER_DIMENSIONS:
+        raise HTTPException(status_code=422, detail=f"group_by debe ser uno de {', '.join(COUNTER_DIMENSIONS)}")
+    if granularity not in ("day", "hour"):
+        raise HTTPException(status_code=422, detail="granularity debe ser 'day' u 'hour'")
+
+    dim = getattr(DataMonitoringCounter, group_by)
+    keys = [DataMonitoringCounter.working_day_date]
+    if granularity == "hour":
+        keys.append(DataMonitoringCounter.hour)
+    filters = []
+    if day_from is not None:
+        filters.append(DataMonitoringCounter.working_day_date >= day_from)
+    if day_to is not None:
+        filters.append(DataMonitoringCounter.working_day_date <= day_to)
+    if app_name is not None:
+        filters.append(DataMonitoringCounter.app == app_name)
+    if flow is not None:
+        filters.append(DataMonitoringCounter.flow == flow)
+    q = (
+        select(*keys, dim, func.sum(DataMonitoringCounter.count).label("count"))
+        .where(*filters)
+        .group_by(*keys, dim)
+        .order_by(*keys, dim)
+    )
+
+    with Session(engine) as sess:
+        if latest:
+            last_day = sess.execute(
+                select(func.max(DataMonitoringCounter.working_day_date)).where(*filters)
+            ).scalar()
+            if last_day is None:
+                return []
+            q = q.where(DataMonitoringCounter.working_day_date == last_day)
+        rows = sess.execute(q).all()
+    result = []
+    for r in rows:
+        item = {"day": r.working_day_date.isoformat(), group_by: getattr(r, group_by) or None, "count": int(r.count)}
+        if granularity == "hour":
+            item["hour"] = r.hour
+        result.append(item)
+    return result
+
+
+@app.post("/api/admin/data-monitoring/stats/rebuild")
+def rebuild_data_monitoring_stats(user: dict = Depends(require_admin)):
+    with Session(engine) as sess:
+        total = rebuild_counters(sess)
+        log_audit(sess, "rebuild", "data_monitoring_stats", None, {"rows": total}, user["email"])
+        sess.commit()
+    return {"status": "rebuilt", "rows": total}
+
+
 @app.get("/api/data-monitoring", response_model=List[DataMonitoringResponseSchema])
 def list_data_monitoring(
-    limit: int = 50, user: dict = Depends(require_data_monitoring_access)
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    app_name: Optional[str] = Query(None, alias="app"),
+    flow: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    working_day: Optional[str] = None,
+    cash_register_number: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    user: dict = Depends(require_data_monitoring_access),
 ):
+    """
+    Listado con paginación keyset, siempre del más nuevo al más antiguo.
+    - `before_id`: página anterior (ids menores).
+    - `after_id`: solo registros nuevos desde el último id visto (polling).
+    - `created_from`/`created_to` y `day_from`/`day_to`: rangos sobre las columnas tipadas.
+    """
+    limit = max(1, min(limit, DATA_MONITORING_MAX_PAGE))
+    q = select(DataMonitoring)
+    if app_name is not None:
+        q = q.where(DataMonitoring.app == app_name)
+    if flow is not None:
+        q = q.where(DataMonitoring.flow == flow)
+    if entity_id is not None:
+        q = q.where(DataMonitoring.entity_id == entity_id)
+    if working_day is not None:
+        q = q.where(DataMonitoring.working_day == working_day)
+    if cash_register_number is not None:
+        q = q.where(DataMonitoring.cash_register_number == cash_register_number)
+    if created_from is not None:
+        q = q.where(DataMonitoring.created_at_ts >= created_from)
+    if created_to is not None:
+        q = q.where(DataMonitoring.created_at_ts < created_to)
+    if day_from is not None:
+        q = q.where(DataMonitoring.working_day_date >= day_from)
+    if day_to is not None:
+        q = q.where(DataMonitoring.working_day_date <= day_to)
+    if before_id is not None:
+        q = q.where(DataMonitoring.id < before_id)
+
     with Session(engine) as sess:
-        data = sess.execute(
-            select(DataMonitoring)
-            .order_by(DataMonitoring.id.desc())
-            .limit(limit)
-        ).scalars().all()
+        if after_id is not None:
+            # Los más antiguos primero para no saltar filas si hay más de `limit` nuevas
+            q = q.where(DataMonitoring.id > after_id).order_by(DataMonitoring.id.asc()).limit(limit)
+            data = list(reversed(sess.execute(q).scalars().all()))
+        else:
+            q = q.order_by(DataMonitoring.id.desc()).limit(limit)
+            data = sess.execute(q).scalars().all()
         
-        result = []
-        for d in data:
-            result.append(DataMonitoringResponseSchema(
-                app=d.app,
-                cashRegisterNumber=d.cash_register_number,
-                userName=d.user_name,
-                flow=d.flow,
-                patent=d.patent,
-                vehicleType=d.vehicle_type,
-                product=d.product,
-                createdAt=d.created_at_client,
-                entityId=d.entity_id,
-                workingDay=d.working_day,
-                id=d.id,
-                received_at=d.received_at
-            ))
-        return result
+        return [_data_monitoring_response(d) for d in data]
 
 
-@app.get("/api/data-monitoring/export")
-def export_data_monitoring(user: dict = Depends(require_data_monitoring_access)):
+@app.get("/api/data-monitoring/search", response_model=List[DataMonitoringResponseSchema])
+def search_data_monitoring(
+    q: str,
+    field: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    user: dict = Depends(require_data_monitoring_access),
+):
+    """Búsqueda parcial por patente, usuario o entidad, ordenada por relevancia."""
+    if not q.strip():
+        raise HTTPException(status_code=422, detail="q no puede estar vacío")
+    if field is not None and field not in FTS_COLUMNS:
+        raise HTTPException(status_code=422, detail=f"field debe ser uno de {', '.join(FTS_COLUMNS)}")
+    limit = max(1, min(limit, DATA_MONITORING_MAX_PAGE))
+    offset = max(0, offset)
+
     with Session(engine) as sess:
-        query = select(DataMonitoring).order_by(DataMonitoring.id.desc())
-        results = sess.execute(query).scalars().all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        headers = ["id", "app", "cash_register_number", "user_name", "flow", "patent", "vehicle_type", "product", "created_at_client", "entity_id", "working_day", "received_at"]
-        writer.writerow(headers)
-        
-        for row in results:
-            writer.writerow([
-                row.id, row.app, row.cash_register_number, row.user_name, 
-                row.flow, row.patent, row.vehicle_type, row.product, 
-                row.created_at_client, row.entity_id, row.working_day, row.received_at
-            ])
-            
-        output.seek(0)
-        response = StreamingResponse(iter([output.getvalue()]), media_type="text/csv")
-        response.headers["Content-Disposition"] = "attachment; filename=data_monitoring.csv"
-        return response
+        ids = search_ids(sess, q, field=field, limit=limit, offset=offset)
+        if not ids:
+            return []
+        by_id = {
+            d.id: d
+            for d in sess.execute(select(DataMonitoring).where(DataMonitoring.id.in_(ids))).scalars()
+        }
+        return [_data_monitoring_response(by_id[i]) for i in ids if i in by_id]
+
+
+def _csv_chunks(header: list[str], rows):
+    """Codifica filas CSV en bloques de ~EXPORT_CHUNK_BYTES en lugar de un único string."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= EXPORT_CHUNK_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _stream_csv(header: list[str], query):
+    # La sesión vive mientras dure el streaming; yield_per usa un cursor incremental
+    with Session(engine) as sess:
+        result = sess.execute(query.execution_options(yield_per=EXPORT_YIELD_PER))
+        yield from _csv_chunks(header, result)
+
+
+def _csv_response(header: list[str], query, filename: str) -> StreamingResponse:
+    response = StreamingResponse(_stream_csv(header, query), media_type="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+@app.get("/api/data-monitoring/export")
+def export_data_monitoring(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: dict = Depends(require_data_monitoring_access),
+):
+    query = select(*DATA_MONITORING_COLUMNS).order_by(DataMonitoring.id.desc())
+    if start is not None:
+        query = query.where(DataMonitoring.received_at >= start)
+    if end is not None:
+        query = query.where(DataMonitoring.received_at < end)
+    headers = [c.key for c in DATA_MONITORING_COLUMNS]
+    return _csv_response(headers, query, "data_monitoring.csv")
+
+
+@app.get("/api/metrics/export")
+def export_metrics(
+    server_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: dict = Depends(get_current_user_from_token),
+):
+    query = metrics_query(server_id=server_id, start=start, end=end)
+    headers = [c.key for c in METRIC_COLUMNS]
+    return _csv_response(headers, query, f"metrics_{server_id}.csv")
+
+
+def _parquet_response(export_fn, filename: str, **filters) -> FileResponse:
+    if not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Exportación Parquet no disponible (pyarrow no instalado)")
+    # Parquet escribe el footer al final: se genera en un archivo temporal y se envía desde disco
+    tmp = tempfile.NamedTemporaryFile(suffix=".parquet", delete=False)
+    tmp.close()
+    try:
+        with Session(engine) as sess:
+            export_fn(sess, tmp.name, **filters)
+    except Exception:
+        os.unlink(tmp.name)
+        raise HTTPException(status_code=500, detail="Error generando exportación Parquet")
+    return FileResponse(
+        tmp.name,
+        media_type="application/vnd.apache.parquet",
+        filename=filename,
+        background=BackgroundTask(os.unlink, tmp.name),
+    )
+
+
+@app.get("/api/export/metrics.parquet")
+def export_metrics_parquet_file(
+    server_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: dict = Depends(get_current_user_from_token),
+):
+    return _parquet_response(export_metrics_parquet, "metrics.parquet", server_id=server_id, start=start, end=end)
+
+
+@app.get("/api/export/data-monitoring.parquet")
+def export_data_monitoring_parquet_file(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user: dict = Depends(require_data_monitoring_access),
+):
+    return _parquet_response(export_data_monitoring_parquet, "data_monitoring.parquet", start=start, end=end)
 
 # --- Servir Frontend con Cache Busting (debe ir al final) ---
 import re
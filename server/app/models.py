@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Text, Boolean, ForeignKey, Table, Index, UniqueConstraint, text
 from sqlalchemy.orm import declarative_base, relationship, backref
 from sqlalchemy.sql import func
 
@@ -71,6 +71,64 @@ class Metric(Base):
     docker_running = Column(Integer)
     docker_containers = Column(Text)  # JSON serializado
 
+    # Resumen de las muestras tomadas por el agente dentro del intervalo de reporte
+    # (el último valor corresponde a las columnas instantáneas de arriba)
+    summary_samples = Column(Integer)
+    summary_window = Column(Float)  # segundos cubiertos
+    cpu_min = Column(Float)
+    cpu_max = Column(Float)
+    cpu_avg = Column(Float)
+    cpu_p95 = Column(Float)
+    mem_percent_min = Column(Float)
+    mem_percent_max = Column(Float)
+    mem_percent_avg = Column(Float)
+    mem_percent_p95 = Column(Float)
+    disk_percent_min = Column(Float)
+    disk_percent_max = Column(Float)
+    disk_percent_avg = Column(Float)
+    disk_percent_p95 = Column(Float)
+
+    # Throughput de red y disco en el intervalo (tasas por segundo; errores/drops son conteos)
+    net_rx_bps = Column(Float)
+    net_tx_bps = Column(Float)
+    net_rx_pps = Column(Float)
+    net_tx_pps = Column(Float)
+    net_errors = Column(Integer)
+    net_drops = Column(Integer)
+    disk_read_bps = Column(Float)
+    disk_write_bps = Column(Float)
+    disk_read_iops = Column(Float)
+    disk_write_iops = Column(Float)
+
+    # Top de procesos por CPU y memoria, sólo en muestras cercanas a un umbral (JSON)
+    top_processes = Column(Text)
+
+    __table_args__ = (
+        Index("ix_metrics_server_ts", "server_id", "ts"),
+    )
+
+
+class MetricDisk(Base):
+    """Uso por punto de montaje. El agente sólo envía los montajes que cambiaron."""
+    __tablename__ = "metric_disks"
+    id = Column(Integer, primary_key=True)
+    server_id = Column(String(255), nullable=False)
+    ts = Column(DateTime(timezone=True), server_default=func.now())
+    mountpoint = Column(String(512), nullable=False)
+    device = Column(String(512))
+    fstype = Column(String(64))
+    total = Column(Float)  # GB
+    used = Column(Float)
+    free = Column(Float)
+    percent = Column(Float)
+    # Fila de un reporte con la lista completa de montajes (disks_complete)
+    complete = Column(Boolean, nullable=True)
+
+    __table_args__ = (
+        Index("ix_metric_disks_server_mount_ts", "server_id", "mountpoint", "ts"),
+        Index("ix_metric_disks_server_complete_ts", "server_id", "complete", "ts"),
+    )
+
 
 class AlertConfig(Base):
     __tablename__ = "alerts"
@@ -141,6 +199,7 @@ class ServerThreshold(Base):
     cpu_threshold = Column(Float, nullable=True)     # %
     memory_threshold = Column(Float, nullable=True)  # %
     disk_threshold = Column(Float, nullable=True)    # %
+    disk_mount_thresholds = Column(Text, nullable=True)  # JSON {mountpoint: %}, prioridad sobre disk_threshold
     
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -174,3 +233,44 @@ class DataMonitoring(Base):
     entity_id = Column(String(100), nullable=False)
     working_day = Column(String(100), nullable=False)
     received_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Versiones tipadas de created_at_client / working_day (parseadas al ingresar)
+    created_at_ts = Column(DateTime, nullable=True, index=True)
+    working_day_date = Column(Date, nullable=True, index=True)
+    # Fila insertada por el ingest idempotente: su clave no puede repetirse
+    idempotent = Column(Boolean, nullable=True)
+
+    __table_args__ = (
+        # Búsqueda de la clave de idempotencia (entity_id, created_at_client) en cualquier fila
+        Index("ix_data_monitoring_entity_created", "entity_id", "created_at_client"),
+        # Unicidad de la clave entre filas idempotentes: dos reintentos concurrentes no duplican
+        Index("ux_data_monitoring_idempotency", "entity_id", "created_at_client",
+              unique=True, sqlite_where=text("idempotent = 1")),
+        # Filtros del listado con paginación keyset (el id final permite ordenar sin sort)
+        Index("ix_data_monitoring_app_flow_id", "app", "flow", "id"),
+        Index("ix_data_monitoring_flow_id", "flow", "id"),
+        Index("ix_data_monitoring_entity_id", "entity_id", "id"),
+        Index("ix_data_monitoring_working_day_id", "working_day", "id"),
+        Index("ix_data_monitoring_cash_register_id", "cash_register_number", "id"),
+    )
+
+
+class DataMonitoringCounter(Base):
+    """Conteos agregados de data_monitoring por día/hora y dimensiones, actualizados al ingresar."""
+    __tablename__ = "data_monitoring_counters"
+
+    id = Column(Integer, primary_key=True)
+    working_day_date = Column(Date, nullable=False)
+    hour = Column(Integer, nullable=False)  # 0-23
+    app = Column(String(100), nullable=False)
+    flow = Column(String(100), nullable=False)
+    vehicle_type = Column(String(50), nullable=False, default="")  # "" = sin valor
+    product = Column(String(100), nullable=False, default="")
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "working_day_date", "hour", "app", "flow", "vehicle_type", "product",
+            name="uq_data_monitoring_counters_key",
+        ),
+    )
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, field_validator
+from typing import Dict, List, Optional
+import json
 from datetime import datetime
 
 
@@ -22,10 +23,51 @@ class DiskSchema(BaseModel):
     percent: float
 
 
+class DiskMountSchema(BaseModel):
+    mountpoint: str
+    device: Optional[str] = None
+    fstype: Optional[str] = None
+    total: float
+    used: float
+    free: float
+    percent: float
+
+
+class NetIoSchema(BaseModel):
+    rx_bytes_per_s: float = Field(..., ge=0)
+    tx_bytes_per_s: float = Field(..., ge=0)
+    rx_packets_per_s: float = Field(..., ge=0)
+    tx_packets_per_s: float = Field(..., ge=0)
+    errors: int = Field(0, ge=0)  # errores de entrada + salida en el intervalo
+    drops: int = Field(0, ge=0)   # paquetes descartados en el intervalo
+
+
+class DiskIoSchema(BaseModel):
+    read_bytes_per_s: float = Field(..., ge=0)
+    write_bytes_per_s: float = Field(..., ge=0)
+    read_iops: float = Field(..., ge=0)
+    write_iops: float = Field(..., ge=0)
+
+
+class ProcessSchema(BaseModel):
+    pid: int
+    name: str
+    cpu: float          # % de un núcleo, como `top`
+    rss_mb: float
+    user: Optional[str] = None
+
+
+class TopProcessesSchema(BaseModel):
+    by_cpu: List[ProcessSchema] = []
+    by_mem: List[ProcessSchema] = []
+
+
 class DockerContainerSchema(BaseModel):
     name: str
-    cpu: Optional[float] = None
-    mem: Optional[float] = None
+    cpu: Optional[float] = None            # % de CPU (100 = un núcleo)
+    mem: Optional[float] = None            # MB usados
+    state: Optional[str] = None            # running, exited, restarting...
+    restart_count: Optional[int] = None
 
 
 class DockerSchema(BaseModel):
@@ -33,6 +75,22 @@ class DockerSchema(BaseModel):
     containers: List[DockerContainerSchema] = []
 
 
+class SeriesSummarySchema(BaseModel):
+    min: float
+    max: float
+    avg: float
+    p95: float
+    last: float
+
+
+class MetricsSummarySchema(BaseModel):
+    samples: int = Field(..., ge=1)
+    window: float = Field(..., ge=0)  # segundos cubiertos por las muestras
+    cpu: Optional[SeriesSummarySchema] = None
+    memory: Optional[SeriesSummarySchema] = None  # % de memoria usada
+    disk: Optional[SeriesSummarySchema] = None    # % de disco usado
+
+
 class MetricsIngestSchema(BaseModel):
     server_id: str
     memory: MemorySchema
@@ -40,6 +98,19 @@ class MetricsIngestSchema(BaseModel):
     disk: DiskSchema
     docker: DockerSchema
     timestamp: Optional[str] = None
+    summary: Optional[MetricsSummarySchema] = None
+    # Montajes que cambiaron desde el último reporte; `disks_complete` indica lista completa
+    disks: Optional[List[DiskMountSchema]] = None
+    disks_complete: bool = False
+    net: Optional[NetIoSchema] = None
+    disk_io: Optional[DiskIoSchema] = None
+    processes: Optional[TopProcessesSchema] = None
+    seq: Optional[int] = None  # número de muestra del formato compacto (ver app/wire.py)
+
+
+class MetricsBatchSchema(BaseModel):
+    server_id: str
+    samples: List[MetricsIngestSchema]
 
 
 class RegisterServerSchema(BaseModel):
@@ -169,6 +240,22 @@ class ServerThresholdBase(BaseModel):
     cpu_threshold: Optional[float] = Field(None, ge=0.1, le=100.0)
     memory_threshold: Optional[float] = Field(None, ge=0.1, le=100.0)
     disk_threshold: Optional[float] = Field(None, ge=0.1, le=100.0)
+    disk_mount_thresholds: Optional[Dict[str, float]] = None
+
+    @field_validator("disk_mount_thresholds", mode="before")
+    @classmethod
+    def parse_mount_thresholds(cls, v):
+        # En la DB se guarda como JSON
+        if isinstance(v, str):
+            return json.loads(v) if v else None
+        return v
+
+    @field_validator("disk_mount_thresholds")
+    @classmethod
+    def check_mount_thresholds(cls, v):
+        if v and any(not (0.1 <= pct <= 100.0) for pct in v.values()):
+            raise ValueError("Los umbrales por montaje deben estar entre 0.1 y 100")
+        return v
 
 class ServerThresholdUpdate(ServerThresholdBase):
     pass
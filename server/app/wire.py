@@ -0,0 +1,222 @@
+"""
+Formato compacto de envío del agente.
+
+- Cuerpo comprimido (Content-Encoding: gzip, o zstd si `zstandard` está instalado).
+- Cuerpo JSON o MessagePack (Content-Type: application/msgpack, requiere `msgpack`).
+- Muestras en delta: el agente envía sólo los campos que cambiaron respecto de la
+  última muestra confirmada (`ack`) y un digest de la muestra completa. El servidor
+  reconstruye la muestra antes de la validación de FastAPI, así que el ingest
+  recibe siempre un MetricsIngestSchema completo.
+
+La base de cada servidor vive en memoria del proceso y sólo se guarda tras un
+ingest autenticado: tras un reinicio, o si el agente cae en otro worker, se
+responde 409 y el agente reenvía la muestra completa.
+"""
+import copy
+import hashlib
+import json
+import threading
+import zlib
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+from .config import WIRE_MAX_BODY
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende del entorno
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+DECODE_PATHS = ("/api/metrics", "/api/metrics/batch")
+DELTA_PATH = "/api/metrics"
+DELETED_KEY = "$del"
+
+
+class WireError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def digest(sample: dict) -> str:
+    canonical = json.dumps(sample, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in MSGPACK_TYPES
+
+
+def unpack(body: bytes):
+    if msgpack is None:
+        raise WireError(415, "MessagePack no soportado en el servidor (msgpack no instalado)")
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except Exception:
+        raise WireError(400, "Cuerpo MessagePack inválido")
+
+
+def pack(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def apply_delta(base: dict, delta: dict) -> dict:
+    out = copy.deepcopy(base)
+    for key, value in delta.items():
+        if key == DELETED_KEY:
+            for removed in value:
+                out.pop(removed, None)
+        elif isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = apply_delta(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    if encoding in ("gzip", "deflate"):
+        wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+        d = zlib.decompressobj(wbits)
+        out = d.decompress(body, WIRE_MAX_BODY)
+        if d.unconsumed_tail:
+            raise WireError(413, "Cuerpo descomprimido demasiado grande")
+        return out
+    if encoding == "zstd":
+        if zstandard is None:
+            raise WireError(415, "zstd no soportado en el servidor")
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            out = reader.read(WIRE_MAX_BODY + 1)
+        if len(out) > WIRE_MAX_BODY:
+            raise WireError(413, "Cuerpo descomprimido demasiado grande")
+        return out
+    raise WireError(415, f"Content-Encoding no soportado: {encoding}")
+
+
+def decode_model(body: bytes, content_type: Optional[str], model):
+    """
+    Valida el cuerpo directamente con el validador precompilado del modelo:
+    JSON con model_validate_json (parseo en pydantic-core, sin dict intermedio)
+    y MessagePack con unpackb + model_validate. Mismas reglas que el body de FastAPI.
+    """
+    if is_msgpack(content_type):
+        return model.model_validate(unpack(body))
+    return model.model_validate_json(body)
+
+
+class BaseStore:
+    """Última muestra confirmada por servidor (base de los deltas)."""
+
+    def __init__(self):
+        self._bases: dict[str, tuple[int, dict]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, message: dict) -> dict:
+        """
+        Muestra completa (sin `seq`) a partir de un mensaje completo o en delta.
+        No guarda nada: corre antes de la autenticación.
+        """
+        server_id = message.get("server_id")
+        seq = message.get("seq")
+        if not isinstance(server_id, str) or not isinstance(seq, int):
+            raise WireError(422, "server_id y seq requeridos")
+        if "delta" in message:
+            with self._lock:
+                base = self._bases.get(server_id)
+            if base is None or base[0] != message.get("base"):
+                raise WireError(409, "resync")
+            full = apply_delta(base[1], message["delta"])
+            if digest(full) != message.get("digest"):
+                raise WireError(409, "resync")
+        else:
+            full = {k: v for k, v in message.items() if k != "seq"}
+        return full
+
+    def acknowledge(self, server_id: str, seq: int, full: Optional[dict]) -> bool:
+        """Adopta `full` como base del servidor tras un ingest autenticado y correcto."""
+        if full is None or full.get("server_id") != server_id:
+            return False
+        with self._lock:
+            self._bases[server_id] = (seq, full)
+        return True
+
+    def forget(self, server_id: Optional[str] = None):
+        with self._lock:
+            if server_id is None:
+                self._bases.clear()
+            else:
+                self._bases.pop(server_id, None)
+
+
+bases = BaseStore()
+
+
+class WireDecodeMiddleware:
+    """
+    Middleware ASGI: descomprime el cuerpo de los endpoints de métricas y resuelve
+    los mensajes en delta antes de que FastAPI valide el payload. La muestra
+    completa queda en `request.state.wire_sample` para confirmarla tras el ingest.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in DECODE_PATHS:
+            return await self.app(scope, receive, send)
+
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        raw_headers = dict(scope["headers"])
+        encoding = raw_headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+        binary = is_msgpack(raw_headers.get(b"content-type", b"").decode("latin-1"))
+        if not encoding and scope["path"] != DELTA_PATH:
+            return await self.app(scope, receive, send)
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > WIRE_MAX_BODY:
+                return await JSONResponse({"detail": "Cuerpo demasiado grande"}, status_code=413)(scope, receive, send)
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+
+        state = dict(scope.get("state") or {})
+        try:
+            if encoding and encoding != "identity":
+                body = decompress(body, encoding)
+            if scope["path"] == DELTA_PATH and b"seq" in body:
+                message = unpack(body) if binary else json.loads(body)
+                if isinstance(message, dict) and "seq" in message:
+                    full = bases.resolve(message)
+                    state["wire_sample"] = full
+                    body = dict(full, seq=message["seq"])
+                    body = pack(body) if binary else json.dumps(body).encode("utf-8")
+        except WireError as e:
+            return await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+        except (ValueError, zlib.error):
+            return await JSONResponse({"detail": "Cuerpo inválido"}, status_code=400)(scope, receive, send)
+
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(dict(scope, headers=headers, state=state), replay_receive, send)
@@ -0,0 +1,227 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `rate` fichas por segundo con ráfagas de hasta `burst`.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = max(float(rate), 1e-6)
+        self.capacity = max(float(burst), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, n: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+    def wait_time(self, n: float = 1.0) -> float:
+        """Segundos hasta que haya `n` fichas disponibles (0 si ya las hay)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = n - self._tokens
+            return max(0.0, missing / self.rate)
+
+    def acquire(self, n: float = 1.0):
+        """Bloquea hasta obtener `n` fichas."""
+        while not self.try_acquire(n):
+            time.sleep(max(self.wait_time(n), 0.001))
+
+
+class KeyedTokenBuckets:
+    """
+    Un TokenBucket por clave (p.ej. servidor que reporta). Conserva como máximo
+    `max_keys` claves; las menos usadas se descartan (vuelven con el bucket lleno).
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class AdmissionController:
+    """
+    Control de admisión de escrituras: limita las que están en curso (profundidad
+    de la cola hacia la DB) y vigila su latencia con una media móvil exponencial.
+    Si la latencia media supera `max_latency` deja de admitir durante `shed_for`
+    segundos; después vuelve a medir desde cero.
+    """
+
+    def __init__(self, max_inflight: int, max_latency: float, shed_for: float = 5.0, alpha: float = 0.2):
+        self.max_inflight = max(int(max_inflight), 1)
+        self.max_latency = max_latency
+        self.shed_for = shed_for
+        self.alpha = alpha
+        self._inflight = 0
+        self._latency = None
+        self._shed_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if time.monotonic() < self._shed_until or self._inflight >= self.max_inflight:
+                return False
+            self._inflight += 1
+            return True
+
+    def leave(self, elapsed: Optional[float] = None):
+        """Libera la plaza; `elapsed` es la duración de la escritura (None: no se midió)."""
+        with self._lock:
+            self._inflight -= 1
+            if elapsed is None:
+                return
+            if self._latency is None:
+                self._latency = elapsed
+            else:
+                self._latency = self.alpha * elapsed + (1 - self.alpha) * self._latency
+            if self._latency > self.max_latency:
+                logger.warning("Latencia de escritura %.2fs, se rechaza carga durante %ss", self._latency, self.shed_for)
+                self._shed_until = time.monotonic() + self.shed_for
+                self._latency = None
+
+    def retry_after(self) -> float:
+        """Segundos sugeridos antes de reintentar (mínimo 1)."""
+        with self._lock:
+            return max(self._shed_until - time.monotonic(), 1.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "inflight": self._inflight,
+                "latency": self._latency,
+                "shedding": time.monotonic() < self._shed_until,
+            }
+
+
+class KeyedSerialExecutor:
+    """
+    Ejecuta tareas en un pool de hilos garantizando orden FIFO por clave
+    (p.ej. número de teléfono): claves distintas avanzan en paralelo,
+    las tareas de una misma clave nunca se solapan.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending_per_key: int = 20, name: str = "keyed"):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._queues: dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.max_pending_per_key = max_pending_per_key
+
+    def submit(self, key: str, fn: Callable, *args) -> bool:
+        with self._lock:
+            q = self._queues.get(key)
+            if q is not None:
+                if len(q) >= self.max_pending_per_key:
+                    logger.warning("Cola de %s llena, se descarta la tarea", key)
+                    return False
+                q.append((fn, args))
+                return True
+            self._queues[key] = deque([(fn, args)])
+        self._pool.submit(self._drain, key)
+        return True
+
+    def _drain(self, key: str):
+        while True:
+            with self._lock:
+                q = self._queues[key]
+                if not q:
+                    del self._queues[key]
+                    return
+                fn, args = q.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("Error procesando tarea para %s", key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+class RateLimitedSender:
+    """
+    Cola de salida atendida por un único hilo que llama a `send_fn` respetando
+    un límite de mensajes por segundo (p.ej. el throughput de Twilio).
+    """
+
+    def __init__(self, send_fn: Callable, rate_per_sec: float = 1.0, burst: float = 1.0,
+                 max_queue: int = 1000, name: str = "sender"):
+        self._send_fn = send_fn
+        self._bucket = TokenBucket(rate_per_sec, burst)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._name = name
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def send(self, *args) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(args)
+            return True
+        except queue.Full:
+            logger.error("Cola de salida %s llena, mensaje descartado", self._name)
+            return False
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            try:
+                self._bucket.acquire()
+                self._send_fn(*args)
+            except Exception:
+                logger.exception("Error en envío %s", self._name)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Espera a que se vacíe la cola (útil en tests)."""
+        self._queue.join()
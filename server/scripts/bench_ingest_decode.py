@@ -0,0 +1,74 @@
+import sys
+import os
+import argparse
+import json
+import timeit
+
+# Add 'server' directory to sys.path so we can import 'app'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+server_dir = os.path.dirname(current_dir) # .../server
+sys.path.append(server_dir)
+
+from app.schemas import MetricsIngestSchema
+from app.wire import decode_model, msgpack
+
+
+def sample_payload(cores: int = 32, containers: int = 20, mounts: int = 6, processes: int = 5) -> dict:
+    proc = lambda i: {"pid": 1000 + i, "name": f"proc-{i}", "cpu": 12.5 * i, "rss_mb": 256.0 * i}
+    return {
+        "server_id": "bench-server",
+        "timestamp": "2024-05-01T10:00:00Z",
+        "memory": {"total": 64000.0, "used": 41000.5, "free": 23000.5, "cache": 9000.0},
+        "cpu": {"total": 37.4, "per_core": [round(10 + i * 1.7, 1) for i in range(cores)]},
+        "disk": {"total": 500.0, "used": 320.2, "free": 179.8, "percent": 64.0},
+        "disks": [
+            {"mountpoint": f"/data{i}", "device": f"/dev/sd{i}", "fstype": "ext4",
+             "total": 1000.0, "used": 100.0 * i, "free": 1000.0 - 100.0 * i, "percent": 10.0 * i}
+            for i in range(mounts)
+        ],
+        "docker": {
+            "running_containers": containers,
+            "containers": [
+                {"name": f"svc-{i}", "cpu": 1.5 * i, "mem": 128.0 * i, "state": "running", "restart_count": 0}
+                for i in range(containers)
+            ],
+        },
+        "net": {"rx_bytes_per_s": 125000.0, "tx_bytes_per_s": 98000.0, "rx_packets_per_s": 900.0,
+                "tx_packets_per_s": 850.0, "errors": 0, "drops": 0},
+        "disk_io": {"read_bytes_per_s": 4096000.0, "write_bytes_per_s": 8192000.0, "read_iops": 120.0, "write_iops": 340.0},
+        "processes": {"by_cpu": [proc(i) for i in range(processes)], "by_mem": [proc(i) for i in range(processes)]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación/validación del ingest de métricas")
+    parser.add_argument("-n", "--number", type=int, default=20000, help="Iteraciones por caso")
+    args = parser.parse_args()
+
+    payload = sample_payload()
+    json_body = json.dumps(payload).encode("utf-8")
+    cases = [
+        # Camino anterior: FastAPI parsea el JSON a dict y luego valida el modelo anidado
+        ("json.loads + model_validate (FastAPI)", lambda: MetricsIngestSchema.model_validate(json.loads(json_body))),
+        ("model_validate_json (JSON directo)", lambda: decode_model(json_body, "application/json", MetricsIngestSchema)),
+    ]
+    sizes = {"JSON": len(json_body)}
+    if msgpack is not None:
+        mp_body = msgpack.packb(payload, use_bin_type=True)
+        sizes["MessagePack"] = len(mp_body)
+        cases.append(("msgpack.unpackb + model_validate", lambda: decode_model(mp_body, "application/msgpack", MetricsIngestSchema)))
+    else:
+        print("⚠️ msgpack no está instalado: se omite el caso MessagePack")
+
+    print("📦 Tamaño del payload: " + ", ".join(f"{k} {v} bytes" for k, v in sizes.items()))
+    baseline = None
+    for name, fn in cases:
+        fn()  # calentar
+        best = min(timeit.repeat(fn, number=args.number, repeat=3))
+        per_op = best / args.number * 1e6
+        baseline = baseline or per_op
+        print(f"⏱️ {name:<40} {per_op:8.1f} µs/op  ({baseline / per_op:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
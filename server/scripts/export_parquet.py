@@ -0,0 +1,44 @@
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# Add 'server' directory to sys.path so we can import 'app'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+server_dir = os.path.dirname(current_dir) # .../server
+sys.path.append(server_dir)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app.config import DB_PATH
+from app.exports import PARQUET_AVAILABLE, export_metrics_parquet, export_data_monitoring_parquet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta metrics o data_monitoring a Parquet")
+    parser.add_argument("table", choices=["metrics", "data-monitoring"], help="Tabla a exportar")
+    parser.add_argument("output", help="Archivo .parquet de salida")
+    parser.add_argument("--server-id", default=None, help="Solo métricas de este servidor")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="Desde (ISO 8601)")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Hasta, exclusivo (ISO 8601)")
+    parser.add_argument("--db", default=str(DB_PATH), help="Ruta a la base SQLite")
+    args = parser.parse_args()
+
+    if not PARQUET_AVAILABLE:
+        print("❌ pyarrow no está instalado. Ejecute: pip install -r server/requirements-parquet.txt")
+        sys.exit(1)
+
+    print(f"📂 Database Path: {args.db}")
+    engine = create_engine(f"sqlite:///{args.db}", future=True)
+
+    with Session(engine) as sess:
+        if args.table == "metrics":
+            rows = export_metrics_parquet(sess, args.output, server_id=args.server_id, start=args.start, end=args.end)
+        else:
+            rows = export_data_monitoring_parquet(sess, args.output, start=args.start, end=args.end)
+
+    print(f"✅ {rows} filas exportadas a {args.output}")
+
+
+if __name__ == "__main__":
+    main()
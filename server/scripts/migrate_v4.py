@@ -0,0 +1,55 @@
+import sys
+import os
+import argparse
+
+# Add 'server' directory to sys.path so we can import 'app'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+server_dir = os.path.dirname(current_dir) # .../server
+sys.path.append(server_dir)
+
+from sqlalchemy import create_engine, text
+from app.config import DB_PATH
+from app.models import DataMonitoring
+from app.data_monitoring import backfill_typed_timestamps
+
+def migrate(chunk_size: int):
+    print(f"🔧 Starting Database Migration V4 (data_monitoring typed timestamps)...")
+    print(f"📂 Database Path: {DB_PATH}")
+
+    db_url = f"sqlite:///{DB_PATH}"
+    engine = create_engine(db_url, future=True)
+
+    # 1. Add typed columns
+    print("1️⃣  Checking/Applying column migrations...")
+    for column, ddl in (("created_at_ts", "DATETIME"), ("working_day_date", "DATE")):
+        with engine.connect() as conn:
+            try:
+                conn.execute(text(f"ALTER TABLE data_monitoring ADD COLUMN {column} {ddl}"))
+                conn.commit()
+                print(f"   ✅ Added '{column}' to 'data_monitoring' table.")
+            except Exception as e:
+                err = str(e).lower()
+                if "duplicate column name" in err:
+                    print(f"   ℹ️  Column '{column}' already exists in 'data_monitoring'.")
+                else:
+                    print(f"   ⚠️  Could not add '{column}': {e}")
+
+    # 2. Indexes
+    print("2️⃣  Checking/Creating indexes...")
+    with engine.begin() as conn:
+        for idx in DataMonitoring.__table__.indexes:
+            idx.create(conn, checkfirst=True)
+    print("   ✅ Indexes verified.")
+
+    # 3. Backfill in chunks
+    print(f"3️⃣  Backfilling typed timestamps (chunks of {chunk_size})...")
+    updated = backfill_typed_timestamps(engine, chunk_size=chunk_size)
+    print(f"   ✅ {updated} rows updated.")
+
+    print("\n✅ Migration V4 completed.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migración V4: fechas tipadas en data_monitoring")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+    migrate(args.chunk_size)
@@ -0,0 +1,243 @@
+from datetime import datetime, date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.main import app, get_password_hash
+from app.models import Base, User, UserSession, DataMonitoring
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    from app import main
+
+    test_engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(test_engine)
+
+    original_engine = main.engine
+    main.engine = test_engine
+    with TestClient(app) as client:
+        yield client
+    main.engine = original_engine
+    test_engine.dispose()
+
+
+@pytest.fixture(name="session")
+def session_fixture(client):
+    from app import main
+    with Session(main.engine) as session:
+        yield session
+
+
+@pytest.fixture(name="headers")
+def headers_fixture(session):
+    admin = User(email="admin@test.com", password_hash=get_password_hash("admin123"), is_admin=True)
+    session.add(admin)
+    session.commit()
+    session.add(UserSession(token="dm-token", user_id=admin.id))
+    session.commit()
+    return {"X-Dashboard-Token": "dm-token"}
+
+
+def _record(n: int, **overrides) -> dict:
+    rec = {
+        "app": "caja",
+        "cashRegisterNumber": 1,
+        "userName": "cajero",
+        "flow": "venta",
+        "patent": f"AB{n:04d}",
+        "vehicleType": "auto",
+        "product": "ticket",
+        "createdAt": f"2024-05-01T10:{n % 60:02d}:00",
+        "entityId": f"ent-{n}",
+        "workingDay": "2024-05-01",
+    }
+    rec.update(overrides)
+    return rec
+
+
+def test_batch_insert(client, session):
+    resp = client.post("/api/data-monitoring/batch", json=[_record(n) for n in range(25)])
+    assert resp.status_code == 201
+    assert resp.json()["inserted"] == 25
+    assert session.execute(select(func.count(DataMonitoring.id))).scalar() == 25
+
+
+def test_batch_idempotent_retry(client, session):
+    batch = [_record(n) for n in range(10)]
+    client.post("/api/data-monitoring/batch?idempotent=true", json=batch)
+
+    # Reintento del mismo lote con un registro nuevo y uno repetido dentro del lote
+    retry = batch + [_record(10), _record(10)]
+    resp = client.post("/api/data-monitoring/batch?idempotent=true", json=retry)
+    body = resp.json()
+    assert body["inserted"] == 1
+    assert body["duplicates"] == 11
+    assert session.execute(select(func.count(DataMonitoring.id))).scalar() == 11
+
+
+def test_batch_idempotent_concurrent_retry_does_not_duplicate(client, session):
+    from unittest.mock import patch
+    from app import main
+    from app.models import DataMonitoringCounter
+
+    batch = [_record(n) for n in range(3)]
+    client.post("/api/data-monitoring/batch?idempotent=true", json=batch)
+
+    # Un reintento concurrente no ve las filas del otro en la consulta previa
+    with patch.object(main, "_existing_data_monitoring_keys", return_value=set()):
+        resp = client.post("/api/data-monitoring/batch?idempotent=true", json=batch + [_record(3)])
+    body = resp.json()
+    assert body["inserted"] == 1
+    assert body["duplicates"] == 3
+    assert session.execute(select(func.count(DataMonitoring.id))).scalar() == 4
+    # Los contadores sólo suman las filas realmente insertadas
+    assert session.execute(select(func.sum(DataMonitoringCounter.count))).scalar() == 4
+
+
+def test_list_keyset_pagination(client, headers):
+    client.post("/api/data-monitoring/batch", json=[_record(n) for n in range(30)])
+
+    page1 = client.get("/api/data-monitoring?limit=10", headers=headers).json()
+    assert len(page1) == 10
+    ids = [r["id"] for r in page1]
+    assert ids == sorted(ids, reverse=True)
+
+    page2 = client.get(f"/api/data-monitoring?limit=10&before_id={ids[-1]}", headers=headers).json()
+    assert page2[0]["id"] == ids[-1] - 1
+
+    # Polling: nada nuevo y luego solo los registros agregados
+    assert client.get(f"/api/data-monitoring?after_id={ids[0]}", headers=headers).json() == []
+    client.post("/api/data-monitoring/batch", json=[_record(100), _record(101)])
+    new = client.get(f"/api/data-monitoring?after_id={ids[0]}", headers=headers).json()
+    assert [r["entityId"] for r in new] == ["ent-101", "ent-100"]
+
+
+def test_list_filters(client, headers):
+    client.post("/api/data-monitoring/batch", json=[
+        _record(1, flow="venta", cashRegisterNumber=1),
+        _record(2, flow="anulacion", cashRegisterNumber=2),
+        _record(3, flow="venta", cashRegisterNumber=2, app="peaje"),
+    ])
+    res = client.get("/api/data-monitoring?flow=venta", headers=headers).json()
+    assert sorted(r["entityId"] for r in res) == ["ent-1", "ent-3"]
+
+    res = client.get("/api/data-monitoring?flow=venta&cash_register_number=2&app=peaje", headers=headers).json()
+    assert [r["entityId"] for r in res] == ["ent-3"]
+
+
+def test_typed_timestamps_parsed_at_ingest(client, session):
+    client.post("/api/data-monitoring/batch", json=[
+        _record(1, createdAt="2024-05-01T10:00:00Z", workingDay="2024-05-01"),
+        _record(2, createdAt="02/05/2024 08:30:00", workingDay="02/05/2024"),
+        _record(3, createdAt="no es fecha", workingDay="???"),
+    ])
+    rows = session.execute(select(DataMonitoring).order_by(DataMonitoring.id)).scalars().all()
+    assert rows[0].created_at_ts == datetime(2024, 5, 1, 10, 0, 0)
+    assert rows[1].working_day_date == date(2024, 5, 2)
+    assert rows[2].created_at_ts is None and rows[2].working_day_date is None
+    # Se conserva el valor original
+    assert rows[1].created_at_client == "02/05/2024 08:30:00"
+
+
+def test_list_day_range(client, headers):
+    client.post("/api/data-monitoring/batch", json=[
+        _record(1, workingDay="2024-05-01"),
+        _record(2, workingDay="2024-05-02"),
+        _record(3, workingDay="2024-05-03"),
+    ])
+    res = client.get("/api/data-monitoring?day_from=2024-05-02&day_to=2024-05-03", headers=headers).json()
+    assert sorted(r["entityId"] for r in res) == ["ent-2", "ent-3"]
+
+
+def test_backfill_typed_timestamps(session):
+    from app import main
+    from app.data_monitoring import backfill_typed_timestamps
+
+    for n in range(7):
+        session.add(DataMonitoring(
+            app="caja", user_name="u", flow="venta", entity_id=f"old-{n}",
+            created_at_client=f"2024-04-0{n + 1} 09:00:00", working_day=f"2024-04-0{n + 1}",
+        ))
+    session.commit()
+
+    assert backfill_typed_timestamps(main.engine, chunk_size=3, log=lambda *_: None) == 7
+    session.expire_all()
+    row = session.execute(select(DataMonitoring).where(DataMonitoring.entity_id == "old-6")).scalar_one()
+    assert row.working_day_date == date(2024, 4, 7)
+    assert row.created_at_ts == datetime(2024, 4, 7, 9, 0, 0)
+
+
+def test_stats_counters_incremental_and_rebuild(client, headers, session):
+    client.post("/api/data-monitoring/batch", json=[
+        _record(1, flow="venta", createdAt="2024-05-01T10:05:00", workingDay="2024-05-01"),
+        _record(2, flow="venta", createdAt="2024-05-01T10:40:00", workingDay="2024-05-01"),
+        _record(3, flow="anulacion", createdAt="2024-05-01T11:00:00", workingDay="2024-05-01"),
+        _record(4, flow="venta", createdAt="2024-05-02T09:00:00", workingDay="2024-05-02", vehicleType=None),
+    ])
+    client.post("/api/data-monitoring", json=_record(5, flow="venta", createdAt="2024-05-01T11:30:00", workingDay="2024-05-01"))
+
+    by_day = client.get("/api/data-monitoring/stats?group_by=flow", headers=headers).json()
+    assert by_day == [
+        {"day": "2024-05-01", "flow": "anulacion", "count": 1},
+        {"day": "2024-05-01", "flow": "venta", "count": 3},
+        {"day": "2024-05-02", "flow": "venta", "count": 1},
+    ]
+
+    by_hour = client.get(
+        "/api/data-monitoring/stats?group_by=vehicle_type&granularity=hour&day_to=2024-05-02", headers=headers
+    ).json()
+    assert {"day": "2024-05-02", "vehicle_type": None, "hour": 9, "count": 1} in by_hour
+    assert {"day": "2024-05-01", "vehicle_type": "auto", "hour": 11, "count": 2} in by_hour
+
+    latest = client.get("/api/data-monitoring/stats?group_by=flow&latest=true", headers=headers).json()
+    assert latest == [{"day": "2024-05-02", "flow": "venta", "count": 1}]
+    latest = client.get("/api/data-monitoring/stats?group_by=flow&latest=true&day_to=2024-05-01", headers=headers).json()
+    assert [r["day"] for r in latest] == ["2024-05-01", "2024-05-01"]
+
+    # El filtro público sigue llamándose `app`
+    assert client.get("/api/data-monitoring/stats?group_by=flow&app=caja", headers=headers).json() == by_day
+    assert client.get("/api/data-monitoring/stats?group_by=flow&app=peaje", headers=headers).json() == []
+
+    resp = client.post("/api/admin/data-monitoring/stats/rebuild", headers=headers)
+    assert resp.json()["rows"] == 5
+    assert client.get("/api/data-monitoring/stats?group_by=flow", headers=headers).json() == by_day
+
+
+def test_stats_rejects_unknown_dimension(client, headers):
+    resp = client.get("/api/data-monitoring/stats?group_by=user_name", headers=headers)
+    assert resp.status_code == 422
+
+
+def test_search_partial_matches(client, headers):
+    client.post("/api/data-monitoring/batch", json=[
+        _record(1, patent="BBXK21", userName="maria.lopez"),
+        _record(2, patent="CDXK99", userName="juan.perez"),
+        _record(3, patent="ZZZZ11", userName="pedro.xk"),
+    ])
+    res = client.get("/api/data-monitoring/search?q=xk2", headers=headers).json()
+    assert [r["patent"] for r in res] == ["BBXK21"]
+
+    res = client.get("/api/data-monitoring/search?q=perez", headers=headers).json()
+    assert [r["userName"] for r in res] == ["juan.perez"]
+
+    res = client.get("/api/data-monitoring/search?q=XK&field=patent", headers=headers).json()
+    assert sorted(r["patent"] for r in res) == ["BBXK21", "CDXK99"]
+
+    res = client.get("/api/data-monitoring/search?q=ent-3", headers=headers).json()
+    assert [r["entityId"] for r in res] == ["ent-3"]
+
+
+def test_search_paginates(client, headers):
+    client.post("/api/data-monitoring/batch", json=[_record(n, patent=f"PAT{n:03d}") for n in range(12)])
+    first = client.get("/api/data-monitoring/search?q=PAT&limit=5", headers=headers).json()
+    second = client.get("/api/data-monitoring/search?q=PAT&limit=5&offset=5", headers=headers).json()
+    assert len(first) == 5 and len(second) == 5
+    assert not {r["id"] for r in first} & {r["id"] for r in second}
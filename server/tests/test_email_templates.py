@@ -0,0 +1,72 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.email_utils import render_alert_email, add_process_tables, _metrics_summary, _process_summary, _value_bucket
+
+
+FULL_METRICS = {
+    "memory": {"total": 8000.0, "used": 7600.0, "free": 400.0, "cache": 0.0},
+    "cpu": {"total": 95.04, "per_core": [95.0, 95.1]},
+    "disk": {"total": 100.0, "used": 50.0, "free": 50.0, "percent": 50.0},
+}
+
+
+def test_render_contains_values():
+    render_alert_email.cache_clear()
+    summary = _metrics_summary(FULL_METRICS)
+    subject, text, html = render_alert_email("srv1", "CPU Alta", _value_bucket(95.04), 90.0, summary)
+
+    assert "srv1" in subject and "95.0%" in subject
+    assert "Valor Actual: 95.0%" in text
+    assert "Umbral configurado: <strong>90.0%</strong>" in html
+    assert "7600 MB / 8000 MB" in html
+    assert "$" not in html
+
+
+def test_render_is_cached_per_value_bucket():
+    render_alert_email.cache_clear()
+    summary = _metrics_summary(FULL_METRICS)
+    first = render_alert_email("srv1", "CPU Alta", _value_bucket(95.04), 90.0, summary)
+    second = render_alert_email("srv1", "CPU Alta", _value_bucket(95.01), 90.0, summary)
+
+    assert first is second
+    assert render_alert_email.cache_info().hits == 1
+
+
+def test_render_without_metrics():
+    subject, text, html = render_alert_email("TEST-SERVER", "PRUEBA DE CORREO", 100.0, 50.0, None)
+    assert "Estado Actual de Recursos" not in html
+    assert "TEST-SERVER" in html
+
+
+def test_render_includes_top_processes():
+    render_alert_email.cache_clear()
+    metrics = dict(FULL_METRICS, processes={
+        "by_cpu": [{"pid": 42, "name": "java<x>", "cpu": 180.04, "rss_mb": 2048.0}],
+        "by_mem": [],
+    })
+    processes = _process_summary(metrics)
+    subject, text, html = add_process_tables(
+        render_alert_email("srv1", "CPU Alta", 95.0, 90.0, _metrics_summary(metrics)), processes
+    )
+
+    assert "Procesos con más CPU" in html
+    assert "java&lt;x&gt;" in html
+    assert "Procesos con más memoria" not in html
+    assert "java<x> (42): CPU 180.0%" in text
+
+
+def test_process_tables_do_not_defeat_render_cache():
+    render_alert_email.cache_clear()
+    summary = _metrics_summary(FULL_METRICS)
+    for pid in (1, 2, 3):
+        metrics = dict(FULL_METRICS, processes={"by_cpu": [{"pid": pid, "name": "java", "cpu": 90.0 + pid, "rss_mb": 1.0}]})
+        _, _, html = add_process_tables(
+            render_alert_email("srv1", "CPU Alta", 95.0, 90.0, summary), _process_summary(metrics)
+        )
+        assert f"({pid})</span>" in html
+    assert render_alert_email.cache_info().hits == 2
+    # El HTML cacheado no queda modificado por los procesos de una alerta anterior
+    assert "java" not in render_alert_email("srv1", "CPU Alta", 95.0, 90.0, summary)[2]
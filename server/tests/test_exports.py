@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.main import app, get_password_hash
+from app.models import Base, User, UserSession, Metric, DataMonitoring
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    from app import main
+
+    test_engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(test_engine)
+
+    original_engine = main.engine
+    main.engine = test_engine
+    with TestClient(app) as client:
+        yield client
+    main.engine = original_engine
+    test_engine.dispose()
+
+
+@pytest.fixture(name="session")
+def session_fixture(client):
+    from app import main
+    with Session(main.engine) as session:
+        yield session
+
+
+@pytest.fixture(name="headers")
+def headers_fixture(session):
+    admin = User(email="admin@test.com", password_hash=get_password_hash("admin123"), is_admin=True)
+    session.add(admin)
+    session.commit()
+    session.add(UserSession(token="export-token", user_id=admin.id))
+    session.commit()
+    return {"X-Dashboard-Token": "export-token"}
+
+
+BASE_TS = datetime(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture(name="metrics")
+def metrics_fixture(session):
+    for i in range(50):
+        session.add(Metric(
+            server_id="srv1" if i % 2 == 0 else "srv2",
+            ts=BASE_TS + timedelta(minutes=i),
+            mem_total=1000, mem_used=500, mem_free=500, mem_cache=0,
+            cpu_total=float(i), cpu_per_core=json.dumps([float(i), float(i)]),
+            disk_total=100, disk_used=50, disk_free=50, disk_percent=50,
+            docker_running=1, docker_containers=json.dumps([{"name": "web", "cpu": 12.5, "mem": 256.0, "state": "running", "restart_count": 2}]),
+        ))
+    session.commit()
+
+
+def _parse(resp):
+    return list(csv.DictReader(io.StringIO(resp.text)))
+
+
+def test_metrics_export_streams_range(client, headers, metrics, monkeypatch):
+    from app import main
+    monkeypatch.setattr(main, "EXPORT_CHUNK_BYTES", 256)
+
+    start = (BASE_TS + timedelta(minutes=10)).isoformat()
+    end = (BASE_TS + timedelta(minutes=20)).isoformat()
+    resp = client.get(f"/api/metrics/export?server_id=srv1&start={start}&end={end}", headers=headers)
+    assert resp.status_code == 200
+    rows = _parse(resp)
+    assert [float(r["cpu_total"]) for r in rows] == [10.0, 12.0, 14.0, 16.0, 18.0]
+    assert all(r["server_id"] == "srv1" for r in rows)
+
+
+def test_csv_chunks_are_bounded(monkeypatch):
+    from app import main
+    monkeypatch.setattr(main, "EXPORT_CHUNK_BYTES", 100)
+    chunks = list(main._csv_chunks(["a", "b"], ((i, "x" * 10) for i in range(100))))
+    assert len(chunks) > 1
+    assert all(len(c) < 200 for c in chunks)
+
+
+def test_data_monitoring_export(client, headers, session):
+    for n in range(3):
+        session.add(DataMonitoring(
+            app="caja", user_name="u", flow="venta", created_at_client=f"2024-05-01T10:0{n}:00",
+            entity_id=f"e{n}", working_day="2024-05-01",
+        ))
+    session.commit()
+    resp = client.get("/api/data-monitoring/export", headers=headers)
+    rows = _parse(resp)
+    assert [r["entity_id"] for r in rows] == ["e2", "e1", "e0"]
+    assert list(rows[0].keys())[0] == "id"
+
+
+def test_metrics_parquet_export(client, headers, metrics):
+    pq = pytest.importorskip("pyarrow.parquet")
+    resp = client.get("/api/export/metrics.parquet?server_id=srv2", headers=headers)
+    assert resp.status_code == 200
+
+    table = pq.read_table(io.BytesIO(resp.content))
+    assert table.num_rows == 25
+    row = table.slice(0, 1).to_pylist()[0]
+    assert row["cpu_per_core"] == [1.0, 1.0]
+    assert row["docker_containers"] == [
+        {"name": "web", "cpu": 12.5, "mem": 256.0, "state": "running", "restart_count": 2}
+    ]
+
+
+def test_parquet_export_without_pyarrow(client, headers, metrics):
+    from unittest.mock import patch
+    from app import main
+
+    with patch.object(main, "PARQUET_AVAILABLE", False):
+        resp = client.get("/api/export/metrics.parquet", headers=headers)
+    assert resp.status_code == 501
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from app.models import Base, Server, User, UserServerLink, Metric
+from app.main import get_user_fleet_status, invalidate_fleet_cache
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    invalidate_fleet_cache()
+    yield engine
+    invalidate_fleet_cache()
+    engine.dispose()
+
+
+def _seed(sess: Session, n_servers: int):
+    user = User(email="ops@test.com", password_hash="hash")
+    sess.add(user)
+    sess.flush()
+    for i in range(n_servers):
+        srv = Server(server_id=f"srv{i}", token="t")
+        sess.add(srv)
+        sess.flush()
+        sess.add(UserServerLink(user_id=user.id, server_id=srv.id))
+        # Servidores pares con dos muestras, impares sin datos
+        if i % 2 == 0:
+            sess.add(Metric(server_id=srv.server_id, cpu_total=10.0, mem_used=1, mem_total=2, disk_percent=5.0))
+            sess.add(Metric(server_id=srv.server_id, cpu_total=50.0 + i, mem_used=1, mem_total=4, disk_percent=7.0))
+    sess.commit()
+    return user
+
+
+def test_fleet_status_latest_sample_single_query(engine):
+    with Session(engine) as sess:
+        user_id = _seed(sess, 6).id
+
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+        fleet = get_user_fleet_status(sess, user_id, use_cache=False)
+
+        assert len(statements) == 1
+        assert [f["server_id"] for f in fleet] == [f"srv{i}" for i in range(6)]
+        assert fleet[0]["cpu_total"] == 50.0
+        assert fleet[2]["cpu_total"] == 52.0
+        assert fleet[1]["has_data"] is False
+
+
+def test_fleet_status_is_cached_per_user(engine):
+    with Session(engine) as sess:
+        user = _seed(sess, 2)
+        first = get_user_fleet_status(sess, user.id)
+
+        sess.add(Metric(server_id="srv1", cpu_total=99.0, mem_used=1, mem_total=2, disk_percent=1.0))
+        sess.commit()
+        assert get_user_fleet_status(sess, user.id) is first
+
+        invalidate_fleet_cache(user.id)
+        fresh = get_user_fleet_status(sess, user.id)
+        assert fresh[1]["cpu_total"] == 99.0
@@ -0,0 +1,362 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import app.main as main
+from app.models import Base, Server, Metric, AlertConfig, User, UserSession, MetricDisk, ServerThreshold
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    with Session(engine) as sess:
+        sess.add(Server(server_id="srv1", token="token123"))
+        sess.add(AlertConfig(cpu_total_percent=80.0, memory_used_percent=80.0, disk_used_percent=80.0))
+        sess.commit()
+    main._cache.clear()
+    main._ingest_buckets.clear()
+    main._alert_state.clear()
+    main._threshold_cache.clear()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(engine):
+    with patch.object(main, "engine", engine):
+        with TestClient(main.app) as c:
+            yield c
+
+
+@pytest.fixture
+def dashboard_headers(engine):
+    with Session(engine) as sess:
+        admin = User(email="admin@test.com", password_hash="x", is_admin=True)
+        sess.add(admin)
+        sess.flush()
+        sess.add(UserSession(token="dash-token", user_id=admin.id))
+        sess.commit()
+    return {"X-Dashboard-Token": "dash-token"}
+
+
+def _sample(ts: datetime, cpu: float = 10.0, server_id: str = "srv1") -> dict:
+    return {
+        "server_id": server_id,
+        "timestamp": ts.isoformat() + "Z",
+        "memory": {"total": 100.0, "used": 10.0, "free": 90.0, "cache": 0.0},
+        "cpu": {"total": cpu, "per_core": [cpu]},
+        "disk": {"total": 100.0, "used": 10.0, "free": 90.0, "percent": 10.0},
+        "docker": {"running_containers": 0, "containers": []},
+    }
+
+
+def test_batch_keeps_original_timestamps(client, engine):
+    base = datetime.utcnow() - timedelta(hours=2)
+    samples = [_sample(base + timedelta(minutes=i)) for i in range(3)]
+    samples.append(_sample(base, cpu=150.0))          # fuera de rango
+    samples.append(_sample(base, server_id="otro"))   # de otro servidor
+
+    r = client.post(
+        "/api/metrics/batch",
+        json={"server_id": "srv1", "samples": samples},
+        headers={"X-Auth-Token": "token123"},
+    )
+    assert r.status_code == 200
+    assert r.json()["accepted"] == 3
+    assert r.json()["rejected"] == 2
+    assert r.json()["thresholds"]["cpu"] == 80.0
+
+    with Session(engine) as sess:
+        stamps = sess.execute(select(Metric.ts).order_by(Metric.id)).scalars().all()
+    assert [s.replace(tzinfo=None) for s in stamps] == [base + timedelta(minutes=i) for i in range(3)]
+
+
+def test_batch_requires_valid_token(client):
+    r = client.post(
+        "/api/metrics/batch",
+        json={"server_id": "srv1", "samples": []},
+        headers={"X-Auth-Token": "bad"},
+    )
+    assert r.status_code == 403
+
+
+def test_replayed_samples_do_not_alert(client):
+    old = datetime.utcnow() - timedelta(hours=1)
+    with patch.object(main, "send_alert_email") as send:
+        client.post(
+            "/api/metrics/batch",
+            json={"server_id": "srv1", "samples": [_sample(old, cpu=99.0)]},
+            headers={"X-Auth-Token": "token123"},
+        )
+        assert send.call_count == 0
+
+        client.post(
+            "/api/metrics",
+            json=_sample(datetime.utcnow(), cpu=99.0),
+            headers={"X-Auth-Token": "token123"},
+        )
+        assert send.call_count == 1
+
+
+def test_live_report_alerts_even_with_lagging_agent_clock(client, engine):
+    # Reloj del agente 1 hora atrasado: /api/metrics usa la hora de recepción
+    sample = _sample(datetime.utcnow() - timedelta(hours=1), cpu=95.0)
+    with patch.object(main, "send_alert_email") as send:
+        r = client.post("/api/metrics", json=sample, headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 200
+    assert send.call_count == 1
+    with Session(engine) as sess:
+        ts = sess.execute(select(Metric.ts)).scalar_one().replace(tzinfo=None)
+    assert abs((datetime.utcnow() - ts).total_seconds()) < 60
+    assert main._cache["srv1"]
+
+
+def test_interval_summary_is_stored_and_returned(client, engine, dashboard_headers):
+    sample = _sample(datetime.utcnow(), cpu=20.0)
+    sample["summary"] = {
+        "samples": 240,
+        "window": 2400.0,
+        "cpu": {"min": 2.0, "max": 97.0, "avg": 18.5, "p95": 64.0, "last": 20.0},
+        "memory": {"min": 9.0, "max": 12.0, "avg": 10.0, "p95": 11.5, "last": 10.0},
+    }
+    r = client.post("/api/metrics", json=sample, headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 200
+
+    with Session(engine) as sess:
+        m = sess.execute(select(Metric)).scalar_one()
+        assert (m.cpu_max, m.cpu_p95, m.summary_samples) == (97.0, 64.0, 240)
+        assert m.disk_percent_max is None
+
+    main._cache.clear()
+    history = client.get(
+        "/api/metrics/history", params={"server_id": "srv1"}, headers=dashboard_headers
+    ).json()
+    summary = history[-1]["summary"]
+    assert summary["cpu"]["max"] == 97.0
+    assert summary["memory"]["last"] == 10.0
+    assert summary["disk"] is None
+
+
+def _mount(mountpoint: str, percent: float) -> dict:
+    return {"mountpoint": mountpoint, "device": "/dev/sda1", "fstype": "ext4",
+            "total": 100.0, "used": percent, "free": 100.0 - percent, "percent": percent}
+
+
+def test_disk_mounts_stored_and_alerted_per_mount(client, engine, dashboard_headers):
+    with Session(engine) as sess:
+        sess.add(ServerThreshold(server_id="srv1", disk_mount_thresholds='{"/data": 60.0}'))
+        sess.commit()
+
+    sample = _sample(datetime.utcnow())
+    sample["disks"] = [_mount("/", 50.0), _mount("/data", 70.0), _mount("/backup", 85.0)]
+    sample["disks_complete"] = True
+    with patch.object(main, "send_alert_email") as send:
+        client.post("/api/metrics", json=sample, headers={"X-Auth-Token": "token123"})
+    # /data supera su umbral propio (60); /backup el global (80); / no alerta
+    alerted = sorted(call.args[1] for call in send.call_args_list)
+    assert alerted == ["Disco Lleno (/backup)", "Disco Lleno (/data)"]
+
+    # Segundo reporte sólo con el montaje que cambió
+    sample = _sample(datetime.utcnow())
+    sample["disks"] = [_mount("/data", 72.0)]
+    client.post("/api/metrics", json=sample, headers={"X-Auth-Token": "token123"})
+
+    with Session(engine) as sess:
+        assert sess.query(MetricDisk).count() == 4
+
+    latest = client.get("/api/metrics/disks", params={"server_id": "srv1"}, headers=dashboard_headers).json()
+    assert {d["mountpoint"]: d["percent"] for d in latest} == {"/": 50.0, "/backup": 85.0, "/data": 72.0}
+
+    history = client.get(
+        "/api/metrics/disks", params={"server_id": "srv1", "mountpoint": "/data"}, headers=dashboard_headers
+    ).json()
+    assert [d["percent"] for d in history] == [70.0, 72.0]
+
+
+def test_unchanged_mounts_keep_their_own_threshold(client, engine):
+    with Session(engine) as sess:
+        sess.add(ServerThreshold(server_id="srv1", disk_mount_thresholds='{"/backup": 95.0}'))
+        sess.commit()
+
+    headers = {"X-Auth-Token": "token123"}
+    full = _sample(datetime.utcnow())
+    full["disk"]["percent"] = 85.0
+    full["disks"] = [_mount("/", 50.0), _mount("/backup", 85.0)]
+    full["disks_complete"] = True
+    with patch.object(main, "send_alert_email") as send:
+        client.post("/api/metrics", json=full, headers=headers)
+        # Ningún montaje cambió: el agente envía "disks": [] y el disco más lleno
+        partial = _sample(datetime.utcnow())
+        partial["disk"]["percent"] = 85.0
+        partial["disks"] = []
+        client.post("/api/metrics", json=partial, headers=headers)
+    # /backup tiene umbral propio de 95: el 85 % no alerta ni por el disco único
+    assert send.call_count == 0
+
+    with Session(engine) as sess:
+        sess.add(MetricDisk(server_id="srv1", ts=datetime.utcnow(), **_mount("/data", 90.0)))
+        sess.commit()
+    with patch.object(main, "send_alert_email") as send:
+        client.post("/api/metrics", json=partial, headers=headers)
+    # Un montaje lleno que no se reenvía se evalúa con su último estado guardado
+    assert [call.args[1] for call in send.call_args_list] == ["Disco Lleno (/data)"]
+
+
+def test_removed_full_mount_is_not_resurrected(client, engine, dashboard_headers):
+    headers = {"X-Auth-Token": "token123"}
+    full = _sample(datetime.utcnow())
+    full["disks"] = [_mount("/", 50.0), _mount("/mnt/usb", 95.0)]
+    full["disks_complete"] = True
+    # Se desmonta /mnt/usb: el agente envía la lista completa sin él
+    unmounted = _sample(datetime.utcnow())
+    unmounted["disks"] = [_mount("/", 50.0)]
+    unmounted["disks_complete"] = True
+    partial = _sample(datetime.utcnow())
+    partial["disks"] = []
+    with patch.object(main, "send_alert_email") as send:
+        client.post("/api/metrics", json=full, headers=headers)
+        main._alert_state.clear()
+        client.post("/api/metrics", json=unmounted, headers=headers)
+        client.post("/api/metrics", json=partial, headers=headers)
+    assert [call.args[1] for call in send.call_args_list] == ["Disco Lleno (/mnt/usb)"]
+
+    latest = client.get("/api/metrics/disks", params={"server_id": "srv1"}, headers=dashboard_headers).json()
+    assert [d["mountpoint"] for d in latest] == ["/"]
+
+
+def test_ingest_returns_effective_thresholds(client, engine):
+    with Session(engine) as sess:
+        sess.add(ServerThreshold(server_id="srv1", cpu_threshold=95.0, disk_mount_thresholds='{"/data": 60.0}'))
+        sess.commit()
+
+    r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 200
+    # CPU propio del servidor; memoria y disco heredan la configuración global
+    assert r.json()["thresholds"] == {"cpu": 95.0, "memory": 80.0, "disk": 80.0, "disk_mounts": {"/data": 60.0}}
+
+
+def test_next_report_in_spreads_servers_over_the_interval():
+    interval = 600
+    slots = {}
+    for now in (1_700_000_000.0, 1_700_000_123.0):
+        for i in range(20):
+            wait = main._next_report_in(f"srv{i}", interval, now=now)
+            assert interval / 2 <= wait <= interval * 1.5
+            slots.setdefault(f"srv{i}", set()).add((now + wait) % interval)
+    # Cada servidor vuelve siempre a su mismo desfase, distinto entre servidores
+    assert all(len(s) == 1 for s in slots.values())
+    assert len({s.pop() for s in slots.values()}) > 10
+
+
+def test_ingest_sheds_with_retry_after_when_db_is_busy(client):
+    busy = OperationalError("INSERT", {}, Exception("database is locked"))
+    with patch.object(main, "_build_metric", side_effect=busy):
+        r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 503
+    assert main.INGEST_RETRY_AFTER <= int(r.headers["Retry-After"]) <= 2 * main.INGEST_RETRY_AFTER
+
+    r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 200
+    assert r.json()["next_report_in"] >= r.json()["report_interval"] / 2
+
+
+def test_ingest_rate_limited_per_server(client):
+    headers = {"X-Auth-Token": "token123"}
+    codes = [
+        client.post("/api/metrics", json=_sample(datetime.utcnow()), headers=headers).status_code
+        for _ in range(main.INGEST_SERVER_BURST + 1)
+    ]
+    assert codes[:-1] == [200] * main.INGEST_SERVER_BURST
+    assert codes[-1] == 429
+
+    r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers=headers)
+    assert int(r.headers["Retry-After"]) >= 1
+    # Un token falso no consume la cuota del servidor real, ni al revés
+    r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "otro"})
+    assert r.status_code == 403
+
+
+def test_ingest_sheds_load_while_dashboard_keeps_reading(client, dashboard_headers):
+    client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "token123"})
+    with patch.object(main._ingest_admission, "try_enter", return_value=False):
+        r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers={"X-Auth-Token": "token123"})
+        assert r.status_code == 503
+        assert "Retry-After" in r.headers
+        history = client.get("/api/metrics/history", params={"server_id": "srv1"}, headers=dashboard_headers)
+        assert history.status_code == 200
+        assert len(history.json()) == 1
+
+
+def test_slow_alert_email_does_not_trip_load_shedding(client):
+    import time
+    from app.workers import AdmissionController
+
+    ctl = AdmissionController(max_inflight=8, max_latency=0.2, shed_for=60)
+    headers = {"X-Auth-Token": "token123"}
+    with patch.object(main, "_ingest_admission", ctl), \
+         patch.object(main, "send_alert_email", side_effect=lambda *a, **k: time.sleep(0.5)) as send:
+        r = client.post("/api/metrics", json=_sample(datetime.utcnow(), cpu=95.0), headers=headers)
+        assert r.status_code == 200
+        assert send.call_count == 1
+        # El correo tardó más que max_latency, pero sólo cuenta la escritura en la DB
+        r = client.post("/api/metrics/batch", json={"server_id": "srv1", "samples": [_sample(datetime.utcnow(), cpu=95.0)]},
+                        headers=headers)
+        assert r.status_code == 200
+        r = client.post("/api/metrics", json=_sample(datetime.utcnow()), headers=headers)
+        assert r.status_code == 200
+    assert ctl.stats()["inflight"] == 0
+    assert not ctl.stats()["shedding"]
+
+
+def test_io_rates_history_and_rollup(client, dashboard_headers):
+    base = datetime(2024, 5, 1, 10, 0, 0)
+    samples = []
+    for i in range(4):
+        sample = _sample(base + timedelta(minutes=20 * i), cpu=10.0 * (i + 1))
+        sample["net"] = {"rx_bytes_per_s": 1000.0 * (i + 1), "tx_bytes_per_s": 500.0,
+                         "rx_packets_per_s": 10.0, "tx_packets_per_s": 5.0, "errors": 1, "drops": 2}
+        sample["disk_io"] = {"read_bytes_per_s": 4096.0, "write_bytes_per_s": 8192.0 * (i + 1),
+                             "read_iops": 1.0, "write_iops": 2.0}
+        samples.append(sample)
+    r = client.post("/api/metrics/batch", json={"server_id": "srv1", "samples": samples},
+                    headers={"X-Auth-Token": "token123"})
+    assert r.json()["accepted"] == 4
+
+    history = client.get("/api/metrics/history", params={"server_id": "srv1"}, headers=dashboard_headers).json()
+    assert history[-1]["net"]["rx_bytes_per_s"] == 4000.0
+    assert history[-1]["disk_io"]["write_bytes_per_s"] == 32768.0
+
+    # 10:00, 10:20, 10:40 en la primera hora; 11:00 en la segunda
+    rollup = client.get("/api/metrics/history", params={"server_id": "srv1", "bucket": 3600},
+                        headers=dashboard_headers).json()
+    assert [b["samples"] for b in rollup] == [3, 1]
+    first = rollup[0]
+    assert first["ts"] == "2024-05-01 10:00:00"
+    assert first["cpu_avg"] == 20.0 and first["cpu_max"] == 30.0
+    assert first["net_rx_bps_max"] == 3000.0
+    assert first["net_errors"] == 3 and first["net_drops"] == 6
+
+
+def test_top_processes_stored_only_near_threshold(client, engine):
+    top = {"by_cpu": [{"pid": 1, "name": "java", "cpu": 150.0, "rss_mb": 900.0}], "by_mem": []}
+    for cpu in (20.0, 75.0):  # umbral global 80: 75 está dentro del margen del 90%
+        sample = _sample(datetime.utcnow(), cpu=cpu)
+        sample["processes"] = top
+        with patch.object(main, "send_alert_email"):
+            client.post("/api/metrics", json=sample, headers={"X-Auth-Token": "token123"})
+
+    with Session(engine) as sess:
+        stored = sess.execute(select(Metric.cpu_total, Metric.top_processes).order_by(Metric.id)).all()
+    assert stored[0].top_processes is None
+    assert "java" in stored[1].top_processes
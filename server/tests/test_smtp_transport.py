@@ -0,0 +1,110 @@
+import sys
+import os
+import smtplib
+from email.message import EmailMessage
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import email_utils
+from app.email_utils import SMTPConnectionPool
+
+
+class FakeSMTP:
+    """Sustituto de smtplib.SMTP: registra cada conexión y los mensajes que envía."""
+
+    connections = []
+
+    def __init__(self, host, port, timeout=None):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.closed = False
+        self.logged_in = None
+        FakeSMTP.connections.append(self)
+
+    def ehlo(self):
+        pass
+
+    def starttls(self, context=None):
+        pass
+
+    def login(self, user, password):
+        self.logged_in = user
+
+    def send_message(self, msg):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        self.messages.append(msg["Subject"])
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_smtp():
+    FakeSMTP.connections = []
+    with patch.object(email_utils.smtplib, "SMTP", FakeSMTP):
+        yield FakeSMTP
+
+
+def _message(n: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = "monitor@test.com"
+    msg["To"] = "admin@test.com"
+    msg["Subject"] = f"alerta {n}"
+    msg.set_content("cuerpo")
+    return msg
+
+
+def test_pool_reuses_connection(fake_smtp):
+    pool = SMTPConnectionPool("smtp.test", 587, user="monitor", password="x", use_tls=True, size=1)
+    try:
+        for n in range(3):
+            pool.send(_message(n))
+    finally:
+        pool.close()
+
+    # Los tres mensajes viajaron por la misma sesión SMTP, autenticada una vez
+    assert len(fake_smtp.connections) == 1
+    conn = fake_smtp.connections[0]
+    assert conn.messages == ["alerta 0", "alerta 1", "alerta 2"]
+    assert conn.logged_in == "monitor"
+    assert conn.closed
+
+
+def test_pool_reconnects_after_disconnect(fake_smtp):
+    pool = SMTPConnectionPool("smtp.test", 25, use_tls=False, size=1)
+    try:
+        pool.send(_message(1))
+        # Simular que el relay cerró la conexión ociosa
+        stale = pool._idle.get_nowait()
+        stale.close()
+        pool._idle.put(stale)
+        pool.send(_message(2))
+    finally:
+        pool.close()
+
+    assert [c.messages for c in fake_smtp.connections] == [["alerta 1"], ["alerta 2"]]
+
+
+def test_pool_does_not_retry_non_stale_errors(fake_smtp):
+    pool = SMTPConnectionPool("smtp.test", 25, use_tls=False, size=1)
+
+    def refuse(msg):
+        raise smtplib.SMTPRecipientsRefused({"admin@test.com": (550, b"no such user")})
+
+    with patch.object(FakeSMTP, "send_message", side_effect=refuse):
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.send(_message(1))
+    pool.close()
+
+    # Sin reintento: una sola conexión, descartada tras el error
+    assert len(fake_smtp.connections) == 1
+    assert fake_smtp.connections[0].closed
+    assert pool._idle.empty()
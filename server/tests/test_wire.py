@@ -0,0 +1,133 @@
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import app.main as main
+from app.models import Base, Server, Metric
+from app.wire import bases, digest, apply_delta
+
+
+@pytest.fixture
+def client():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as sess:
+        sess.add(Server(server_id="srv1", token="token123"))
+        sess.commit()
+    bases.forget()
+    main._cache.clear()
+    main._ingest_buckets.clear()
+    with patch.object(main, "engine", engine):
+        with TestClient(main.app) as c:
+            c.engine = engine
+            yield c
+    engine.dispose()
+
+
+SAMPLE = {
+    "server_id": "srv1",
+    "memory": {"total": 100.0, "used": 10.0, "free": 90.0, "cache": 0.0},
+    "cpu": {"total": 10.0, "per_core": [10.0, 12.0]},
+    "disk": {"total": 100.0, "used": 10.0, "free": 90.0, "percent": 10.0},
+    "docker": {"running_containers": 1, "containers": [{"name": "web"}]},
+}
+HEADERS = {"X-Auth-Token": "token123", "Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+
+def _post(client, message: dict):
+    return client.post("/api/metrics", content=gzip.compress(json.dumps(message).encode()), headers=HEADERS)
+
+
+def test_gzip_full_then_delta(client):
+    r = _post(client, dict(SAMPLE, seq=1))
+    assert r.status_code == 200
+    assert r.json()["ack"] == 1
+
+    new = json.loads(json.dumps(SAMPLE))
+    new["cpu"]["total"] = 55.0
+    r = _post(client, {"server_id": "srv1", "seq": 2, "base": 1,
+                       "delta": {"cpu": {"total": 55.0}}, "digest": digest(new)})
+    assert r.status_code == 200
+    assert r.json()["ack"] == 2
+
+    with Session(client.engine) as sess:
+        rows = sess.execute(select(Metric.cpu_total, Metric.docker_containers).order_by(Metric.id)).all()
+    assert [r.cpu_total for r in rows] == [10.0, 55.0]
+    assert "web" in rows[1].docker_containers
+
+
+def test_delta_without_matching_base_asks_resync(client):
+    r = _post(client, {"server_id": "srv1", "seq": 7, "base": 6, "delta": {}, "digest": "x"})
+    assert r.status_code == 409
+
+    _post(client, dict(SAMPLE, seq=1))
+    r = _post(client, {"server_id": "srv1", "seq": 2, "base": 1, "delta": {"cpu": {"total": 1.0}}, "digest": "bad"})
+    assert r.status_code == 409
+
+
+def test_unauthenticated_posts_do_not_touch_bases(client):
+    _post(client, dict(SAMPLE, seq=1))
+
+    # Servidor inventado y post falsificado para el real: ninguno guarda base
+    fake = dict(SAMPLE, server_id="inventado", seq=1)
+    r = client.post("/api/metrics", content=gzip.compress(json.dumps(fake).encode()),
+                    headers=dict(HEADERS, **{"X-Auth-Token": "x"}))
+    assert r.status_code == 403
+    forged = dict(SAMPLE, seq=2)
+    forged["cpu"] = {"total": 99.0, "per_core": [99.0]}
+    r = client.post("/api/metrics", content=gzip.compress(json.dumps(forged).encode()),
+                    headers=dict(HEADERS, **{"X-Auth-Token": "x"}))
+    assert r.status_code == 403
+    assert set(bases._bases) == {"srv1"}
+
+    # El agente real sigue enviando deltas sobre su base confirmada
+    new = json.loads(json.dumps(SAMPLE))
+    new["cpu"]["total"] = 20.0
+    r = _post(client, {"server_id": "srv1", "seq": 3, "base": 1,
+                       "delta": {"cpu": {"total": 20.0}}, "digest": digest(new)})
+    assert r.status_code == 200
+    assert r.json()["ack"] == 3
+
+
+def test_plain_json_ingest_unchanged(client):
+    r = client.post("/api/metrics", json=SAMPLE, headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 200
+    assert "ack" not in r.json()
+
+
+def test_apply_delta_removes_keys():
+    assert apply_delta({"a": 1, "b": {"c": 2, "d": 3}}, {"b": {"$del": ["d"]}, "e": 4}) == {"a": 1, "b": {"c": 2}, "e": 4}
+
+
+def test_msgpack_ingest(client):
+    msgpack = pytest.importorskip("msgpack")
+    r = client.post(
+        "/api/metrics",
+        content=msgpack.packb(SAMPLE),
+        headers={"X-Auth-Token": "token123", "Content-Type": "application/msgpack"},
+    )
+    assert r.status_code == 200
+
+    # Formato compacto también en MessagePack
+    r = client.post(
+        "/api/metrics",
+        content=gzip.compress(msgpack.packb(dict(SAMPLE, seq=1))),
+        headers={"X-Auth-Token": "token123", "Content-Type": "application/msgpack", "Content-Encoding": "gzip"},
+    )
+    assert r.json()["ack"] == 1
+
+
+def test_invalid_body_keeps_fastapi_error_shape(client):
+    bad = json.loads(json.dumps(SAMPLE))
+    bad["cpu"]["total"] = "mucho"
+    r = client.post("/api/metrics", json=bad, headers={"X-Auth-Token": "token123"})
+    assert r.status_code == 422
+    assert r.json()["detail"][0]["loc"] == ["body", "cpu", "total"]
+
+    assert "MetricsIngestSchema" in json.dumps(client.get("/openapi.json").json()["paths"]["/api/metrics"])
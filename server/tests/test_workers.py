@@ -0,0 +1,87 @@
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.workers import TokenBucket, KeyedSerialExecutor, RateLimitedSender, KeyedTokenBuckets, AdmissionController
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(rate=100, burst=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    time.sleep(0.03)
+    assert bucket.try_acquire()
+
+
+def test_keyed_token_buckets_are_independent_and_bounded():
+    buckets = KeyedTokenBuckets(rate=0.01, burst=1, max_keys=2)
+    assert buckets.get("a").try_acquire()
+    assert not buckets.get("a").try_acquire()
+    assert buckets.get("b").try_acquire()
+    buckets.get("c")  # desplaza a "a", la menos usada
+    assert buckets.get("a").try_acquire()
+
+
+def test_admission_controller_limits_inflight_and_sheds_on_latency():
+    ctl = AdmissionController(max_inflight=2, max_latency=0.5, shed_for=0.05)
+    assert ctl.try_enter()
+    assert ctl.try_enter()
+    assert not ctl.try_enter()
+    ctl.leave(0.01)
+    assert ctl.try_enter()
+    ctl.leave(0.01)
+
+    ctl.leave(5.0)  # escritura lenta: dispara el rechazo
+    assert not ctl.try_enter()
+    assert ctl.retry_after() >= 1.0
+    time.sleep(0.06)
+    assert ctl.try_enter()
+
+
+def test_keyed_executor_keeps_order_per_key():
+    executor = KeyedSerialExecutor(max_workers=4)
+    results = {"a": [], "b": []}
+    done = threading.Event()
+    total = 40
+
+    def task(key, n):
+        time.sleep(0.001)
+        results[key].append(n)
+        if sum(len(v) for v in results.values()) == total:
+            done.set()
+
+    for n in range(total // 2):
+        executor.submit("a", task, "a", n)
+        executor.submit("b", task, "b", n)
+
+    assert done.wait(5)
+    assert results["a"] == list(range(total // 2))
+    assert results["b"] == list(range(total // 2))
+    executor.shutdown()
+
+
+def test_keyed_executor_bounds_pending_per_key():
+    executor = KeyedSerialExecutor(max_workers=1, max_pending_per_key=1)
+    gate = threading.Event()
+    executor.submit("a", gate.wait)
+    time.sleep(0.05)  # la primera tarea ya está en ejecución
+    assert executor.submit("a", lambda: None)
+    assert not executor.submit("a", lambda: None)
+    gate.set()
+    executor.shutdown()
+
+
+def test_rate_limited_sender_respects_rate():
+    sent = []
+    sender = RateLimitedSender(lambda phone, body: sent.append(time.monotonic()), rate_per_sec=20, burst=1)
+    for n in range(5):
+        sender.send("+56900000000", f"msg {n}")
+    sender.join()
+
+    assert len(sent) == 5
+    # 5 mensajes a 20/s con ráfaga 1 requieren al menos ~0.2s
+    assert sent[-1] - sent[0] >= 0.18